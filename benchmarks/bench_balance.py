@@ -0,0 +1,100 @@
+"""Spread of the load over replicas of skewed latency.
+
+The async client requests routes from local stand-in servers, one of them
+slower than the others, with each balancing strategy of
+:mod:`osrm.balancing`, reporting the share of requests served by each
+replica and the p50/p99 latency.
+
+Usage: python -m benchmarks.bench_balance [--requests N] [--concurrency N]
+"""
+import argparse
+import asyncio
+import time
+from contextlib import ExitStack
+from typing import Dict, List, Sequence
+
+from osrm import Balancer, OsrmAsyncClient
+from osrm.balancing import STRATEGIES
+
+from .server import StandInServer
+
+COORDS = [(12.0, 41.0), (12.1, 41.1), (12.2, 41.2)]
+
+
+async def _run(
+        servers: List[StandInServer],
+        strategy: str,
+        requests: int,
+        concurrency: int,
+) -> Dict[str, object]:
+    balancer = Balancer([server.url for server in servers], strategy)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with OsrmAsyncClient(
+            balancer=balancer, max_concurrency=concurrency,
+    ) as osrm:
+        async def _call() -> float:
+            async with semaphore:
+                start = time.perf_counter()
+                await osrm.route(COORDS)
+                return time.perf_counter() - start
+
+        served = [server.requests for server in servers]
+        latencies = sorted(
+            await asyncio.gather(*(_call() for _ in range(requests)))
+        )
+    n = len(latencies)
+    return {
+        'shares': [
+            (server.requests - before) / n
+            for server, before in zip(servers, served)
+        ],
+        'p50_ms': latencies[n // 2] * 1000,
+        'p99_ms': latencies[min(int(n * 0.99), n - 1)] * 1000,
+    }
+
+
+def run(
+        requests: int = 500,
+        concurrency: int = 16,
+        latencies: Sequence[float] = (0.002, 0.002, 0.02),
+) -> Dict[str, Dict[str, object]]:
+    """Run every strategy returning the metrics of each one."""
+    with ExitStack() as stack:
+        servers = [
+            stack.enter_context(StandInServer(latency=latency, steps=1))
+            for latency in latencies
+        ]
+        return {
+            strategy: asyncio.run(
+                _run(servers, strategy, requests, concurrency),
+            )
+            for strategy in STRATEGIES
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument(
+        '--latencies', type=float, nargs='+', default=[0.002, 0.002, 0.02],
+        help='latency of each replica',
+    )
+    args = parser.parse_args()
+
+    results = run(args.requests, args.concurrency, args.latencies)
+    shares = ' '.join(
+        f'{f"{latency * 1000:g}ms":>7}' for latency in args.latencies
+    )
+    print(f'{"strategy":>18} {shares} {"p50 ms":>8} {"p99 ms":>8}')
+    for strategy, res in results.items():
+        shares = ' '.join(f'{share:7.0%}' for share in res['shares'])
+        print(
+            f'{strategy:>18} {shares} {res["p50_ms"]:8.2f} '
+            f'{res["p99_ms"]:8.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
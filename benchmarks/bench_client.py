@@ -0,0 +1,245 @@
+"""Throughput, latency and CPU cost of the clients against a local server.
+
+Every service is requested by the sync and the async client through real
+HTTP, against the stand-in server of :mod:`benchmarks.server`, reporting
+requests per second, p50/p99 latency and client CPU per request (process
+CPU minus the CPU spent by the in-process server).
+
+Results can be saved as baseline and later checked against it, failing
+when throughput or CPU per request regress beyond the tolerance. With
+``--repeat`` the best of many runs is kept, less sensitive to noise.
+
+Usage: python -m benchmarks.bench_client [--requests N] [--concurrency N]
+                                         [--repeat N] [--save FILE]
+                                         [--baseline FILE]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from osrm import OsrmAsyncClient, OsrmClient
+
+from .server import StandInServer
+
+# service -> (method, keyword arguments)
+SCENARIOS = {
+    'nearest': ('nearest', {'coordinate': (12.0, 41.0)}),
+    'route': ('route', {
+        'coordinates': [(12.0, 41.0), (12.1, 41.1), (12.2, 41.2)],
+        'steps': True,
+    }),
+    'table': ('table', {
+        'coordinates': [(12.0 + i * 1e-3, 41.0) for i in range(100)],
+    }),
+    'match': ('match', {
+        'coordinates': [(12.0 + i * 1e-4, 41.0) for i in range(20)],
+        'steps': True,
+    }),
+    'trip': ('trip', {
+        'coordinates': [(12.0 + i * 1e-3, 41.0) for i in range(5)],
+        'steps': True,
+    }),
+}
+
+# metrics checked against the baseline, True if higher is better
+CHECKS = {'rps': True, 'cpu_ms': False}
+
+
+def _stats(
+        latencies: List[float],
+        wall: float,
+        cpu: float,
+) -> Dict[str, float]:
+    latencies = sorted(latencies)
+    n = len(latencies)
+    return {
+        'rps': n / wall,
+        'p50_ms': latencies[n // 2] * 1000,
+        'p99_ms': latencies[min(int(n * 0.99), n - 1)] * 1000,
+        'cpu_ms': cpu / n * 1000,
+    }
+
+
+def _run_sync(
+        server: StandInServer,
+        method: str,
+        kwargs: dict,
+        requests: int,
+        concurrency: int,
+) -> Dict[str, float]:
+    with OsrmClient(base_url=server.url, max_workers=concurrency) as osrm:
+        service = getattr(osrm, method)
+
+        def _call(_) -> float:
+            start = time.perf_counter()
+            service(**kwargs)
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(concurrency) as pool:
+            # warm up connections and server cache
+            list(pool.map(_call, range(concurrency)))
+            return _measure(
+                server, lambda: list(pool.map(_call, range(requests))),
+            )
+
+
+def _run_async(
+        server: StandInServer,
+        method: str,
+        kwargs: dict,
+        requests: int,
+        concurrency: int,
+) -> Dict[str, float]:
+    async def _run() -> Dict[str, float]:
+        async with OsrmAsyncClient(base_url=server.url) as osrm:
+            service = getattr(osrm, method)
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def _call() -> float:
+                async with semaphore:
+                    start = time.perf_counter()
+                    await service(**kwargs)
+                    return time.perf_counter() - start
+
+            async def _batch(n: int) -> List[float]:
+                return await asyncio.gather(*(_call() for _ in range(n)))
+
+            await _batch(concurrency)
+            start = _start(server)
+            latencies = await _batch(requests)
+            return _stop(server, start, latencies)
+
+    return asyncio.run(_run())
+
+
+def _start(server: StandInServer) -> tuple:
+    return time.perf_counter(), time.process_time(), server.cpu_time
+
+
+def _stop(
+        server: StandInServer,
+        start: tuple,
+        latencies: List[float],
+) -> Dict[str, float]:
+    wall, cpu, server_cpu = start
+    return _stats(
+        latencies,
+        time.perf_counter() - wall,
+        (time.process_time() - cpu) - (server.cpu_time - server_cpu),
+    )
+
+
+def _measure(
+        server: StandInServer,
+        run: Callable[[], List[float]],
+) -> Dict[str, float]:
+    start = _start(server)
+    latencies = run()
+    return _stop(server, start, latencies)
+
+
+def run(
+        requests: int = 200,
+        concurrency: int = 8,
+        latency: float = 0.002,
+        steps: int = 10,
+) -> Dict[str, Dict[str, float]]:
+    """Run all the scenarios returning the metrics of each one."""
+    results = {}
+    with StandInServer(latency=latency, steps=steps) as server:
+        for client, runner in (('sync', _run_sync), ('async', _run_async)):
+            for name, (method, kwargs) in SCENARIOS.items():
+                results[f'{client}/{name}'] = runner(
+                    server, method, kwargs, requests, concurrency,
+                )
+    return results
+
+
+def best(
+        runs: List[Dict[str, Dict[str, float]]],
+) -> Dict[str, Dict[str, float]]:
+    """Best metrics of each scenario over many runs."""
+    return {
+        name: {
+            metric: (max if metric == 'rps' else min)(
+                res[name][metric] for res in runs
+            )
+            for metric in runs[0][name]
+        }
+        for name in runs[0]
+    }
+
+
+def check(
+        results: Dict[str, Dict[str, float]],
+        baseline: Dict[str, Dict[str, float]],
+        tolerance: float,
+) -> List[str]:
+    """Regressions of the results with respect to the baseline."""
+    regressions = []
+    for name, base in baseline.items():
+        res = results.get(name)
+        if res is None:
+            continue
+        for metric, higher_is_better in CHECKS.items():
+            ratio = res[metric] / base[metric]
+            if not higher_is_better:
+                ratio = 1 / ratio
+            if ratio < 1 / (1 + tolerance):
+                regressions.append(
+                    f'{name} {metric}: {res[metric]:.2f} '
+                    f'(baseline {base[metric]:.2f})'
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.002)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument(
+        '--repeat', type=int, default=1, help='keep the best of N runs',
+    )
+    parser.add_argument('--save', help='save results as baseline')
+    parser.add_argument('--baseline', help='fail on regressions from it')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.5,
+        help='allowed relative regression, 0.5 for 1.5x slower',
+    )
+    args = parser.parse_args()
+
+    results = best([
+        run(args.requests, args.concurrency, args.latency, args.steps)
+        for _ in range(args.repeat)
+    ])
+    print(
+        f'{"scenario":>14} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8} '
+        f'{"cpu ms/req":>10}'
+    )
+    for name, res in results.items():
+        print(
+            f'{name:>14} {res["rps"]:9.1f} {res["p50_ms"]:8.2f} '
+            f'{res["p99_ms"]:8.2f} {res["cpu_ms"]:10.3f}'
+        )
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = check(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Decode throughput of large table responses for the available decoders.
+
+Usage: python -m benchmarks.bench_decode [--size N] [--repeat N]
+"""
+import argparse
+import json
+import timeit
+
+from .fixtures import table_response
+
+
+def _decoders() -> dict:
+    decoders = {
+        # former client behavior, body decoded twice from text
+        'json, text x2': lambda raw: (
+            json.loads(raw.decode()), json.loads(raw.decode())
+        ),
+        'json': json.loads,
+    }
+    try:
+        import orjson
+        decoders['orjson'] = orjson.loads
+    except ImportError:
+        print('orjson not installed, skipped')
+    return decoders
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    raw = json.dumps(
+        table_response(args.size, annotations=['durations', 'distances'])
+    ).encode()
+    mb = len(raw) / 1024 / 1024
+    print(f'table {args.size}x{args.size}, {mb:.1f} MB')
+
+    for name, loads in _decoders().items():
+        elapsed = min(timeit.repeat(
+            lambda: loads(raw), number=1, repeat=args.repeat,
+        ))
+        print(f'{name:>14}: {elapsed * 1000:9.1f} ms {mb / elapsed:8.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Memory per Route, slot based objects versus the former dict based ones.
+
+Usage: python -m benchmarks.bench_memory [--legs N] [--steps N] [--count N]
+"""
+import argparse
+import gc
+import tracemalloc
+
+from osrm import model
+
+from .fixtures import route
+
+
+class _DictModel():
+    """Object with per-instance ``__dict__``, as result objects used to be."""
+
+    def __init__(self, **data):
+        for key, value in data.items():
+            setattr(self, key, value)
+
+
+def _dict_route(data: dict) -> _DictModel:
+    """Build the route object graph as the former BaseModel did."""
+    def _step(step):
+        return _DictModel(**{
+            **step,
+            'maneuver': _DictModel(**step['maneuver']),
+            'intersections': [
+                _DictModel(**{
+                    **ins,
+                    'lanes': [_DictModel(**lane) for lane in ins['lanes']],
+                })
+                for ins in step['intersections']
+            ],
+        })
+
+    return _DictModel(**{
+        **data,
+        'legs': [
+            _DictModel(**{**leg, 'steps': [_step(s) for s in leg['steps']]})
+            for leg in data['legs']
+        ],
+    })
+
+
+def _bytes_per_route(build, data: dict, count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    routes = [build(data) for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del routes
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--legs', type=int, default=5)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--intersections', type=int, default=5)
+    parser.add_argument('--count', type=int, default=50)
+    args = parser.parse_args()
+
+    data = route(
+        legs=args.legs,
+        steps=args.steps,
+        intersections=args.intersections,
+    )
+
+    print(
+        f'route with {args.legs} legs x {args.steps} steps x '
+        f'{args.intersections} intersections'
+    )
+    before = _bytes_per_route(_dict_route, data, args.count)
+    after = _bytes_per_route(lambda d: model.Route(**d), data, args.count)
+    print(f'  dict objects: {before:12,.0f} bytes/route')
+    print(f'  slot objects: {after:12,.0f} bytes/route')
+    print(f'         saved: {1 - after / before:12.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Parse time of route responses, eager versus lazy model construction.
+
+Usage: python -m benchmarks.bench_model [--legs N] [--steps N] [--repeat N]
+"""
+import argparse
+import timeit
+
+from osrm import model
+
+from .fixtures import route_response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--legs', type=int, default=20)
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--intersections', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    data = route_response(
+        legs=args.legs,
+        steps=args.steps,
+        intersections=args.intersections,
+        annotation_size=args.steps * 10,
+    )
+
+    cases = {
+        'eager': lambda: model.OsrmRoute(**data).routes[0].distance,
+        'lazy': lambda: model.OsrmRoute(lazy=True, **data).routes[0].distance,
+        'lazy, walk all': lambda: [
+            ins.out
+            for leg in model.OsrmRoute(lazy=True, **data).routes[0].legs
+            for step in leg.steps
+            for ins in step.intersections
+        ],
+    }
+
+    print(
+        f'route with {args.legs} legs x {args.steps} steps x '
+        f'{args.intersections} intersections'
+    )
+    baseline = None
+    for name, case in cases.items():
+        elapsed = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        baseline = baseline or elapsed
+        print(
+            f'{name:>16}: {elapsed * 1000:8.3f} ms '
+            f'({baseline / elapsed:5.1f}x)'
+        )
+
+
+if __name__ == '__main__':
+    main()
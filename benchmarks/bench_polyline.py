@@ -0,0 +1,86 @@
+"""Polyline decoding, pure python versus vectorized numpy decoder.
+
+Usage: python -m benchmarks.bench_polyline [--points N] [--routes N]
+"""
+import argparse
+import random
+import timeit
+
+from osrm import polyline
+
+
+def _decode_python(line: str, precision: int = 5) -> list:
+    """Character by character decoder, as commonly done by consumers."""
+    coords = []
+    index = lat = lon = 0
+    factor = 10 ** precision
+    while index < len(line):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(line[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coords.append((lon / factor, lat / factor))
+    return coords
+
+
+def _encode(coords: list, precision: int = 5) -> str:
+    res = []
+    prev = (0, 0)
+    for lon, lat in coords:
+        point = (round(lat * 10 ** precision), round(lon * 10 ** precision))
+        for value, prev_value in zip(point, prev):
+            value = value - prev_value
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                res.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            res.append(chr(value + 63))
+        prev = point
+    return ''.join(res)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=5000)
+    parser.add_argument('--routes', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    lines = []
+    for _ in range(args.routes):
+        lon, lat = 12.0, 41.0
+        coords = []
+        for _ in range(args.points):
+            lon += rnd.uniform(-1e-3, 1e-3)
+            lat += rnd.uniform(-1e-3, 1e-3)
+            coords.append((lon, lat))
+        lines.append(_encode(coords))
+
+    cases = {
+        'python': lambda: [_decode_python(line) for line in lines],
+        'numpy, one by one': lambda: [polyline.decode(li) for li in lines],
+        'numpy, batched': lambda: polyline.decode_many(lines),
+    }
+    print(f'{args.routes} polylines of {args.points} points')
+    baseline = None
+    for name, case in cases.items():
+        elapsed = min(timeit.repeat(case, number=1, repeat=args.repeat))
+        baseline = baseline or elapsed
+        print(
+            f'{name:>18}: {elapsed * 1000:9.1f} ms '
+            f'({baseline / elapsed:5.1f}x)'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Shard lookup, R-tree index versus linear scan, as shards grow.
+
+Shards are a grid of bounding boxes, e.g. one per region, each looked up
+for random points.
+
+Usage: python -m benchmarks.bench_sharding [--points N]
+"""
+import argparse
+import math
+import random
+import timeit
+
+from osrm import Shard, ShardMap
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=10000)
+    parser.add_argument(
+        '--shards', type=int, nargs='+', default=[10, 100, 1000, 10000],
+    )
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    print(f'{"shards":>8} {"scan us":>9} {"r-tree us":>9}')
+    for n in args.shards:
+        side = math.ceil(math.sqrt(n))
+        shards = [
+            Shard(None, bbox=(x, y, x + 1, y + 1))
+            for x in range(side) for y in range(side)
+        ][:n]
+        shard_map = ShardMap(shards)
+        points = [
+            shards[rnd.randrange(n)].bbox[:2] for _ in range(args.points)
+        ]
+
+        def _scan():
+            for point in points:
+                next(shard for shard in shards if shard.contains(point))
+
+        def _index():
+            for point in points:
+                shard_map.find(point, 'driving')
+
+        scan, index = (
+            min(timeit.repeat(case, number=1, repeat=args.repeat))
+            for case in (_scan, _index)
+        )
+        print(
+            f'{n:8d} {scan / args.points * 1e6:9.2f} '
+            f'{index / args.points * 1e6:9.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
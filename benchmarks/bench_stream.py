@@ -0,0 +1,72 @@
+"""Peak memory and time of large table responses, buffered versus streamed.
+
+The buffered path decodes the whole body then builds the matrices, the
+streamed one parses rows into preallocated arrays while the body is read.
+
+Usage: python -m benchmarks.bench_stream [--size N] [--chunk N]
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from osrm import model
+from osrm.streaming import TableParser
+from osrm.utils import _default_json_loads
+
+from .fixtures import table_response
+
+
+def _buffered(raw: bytes, chunk: int) -> model.OsrmTable:
+    # the body is received in chunks then joined, as by res.read()
+    body = b''.join(raw[i:i + chunk] for i in range(0, len(raw), chunk))
+    return model.OsrmTable(dtype='float64', **_default_json_loads()(body))
+
+
+def _streamed(raw: bytes, chunk: int, size: int) -> model.OsrmTable:
+    parser = TableParser((size, size), _default_json_loads(), 'float64')
+    for i in range(0, len(raw), chunk):
+        parser.feed(raw[i:i + chunk])
+    return model.OsrmTable(dtype='float64', **parser.close())
+
+
+def _measure(fn) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    table = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del table
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=2000)
+    parser.add_argument('--chunk', type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    raw = json.dumps(
+        table_response(args.size, annotations=['durations', 'distances'])
+    ).encode()
+    matrices = 2 * args.size * args.size * 8 / 1024 / 1024
+    print(
+        f'table {args.size}x{args.size}, {len(raw) / 1024 / 1024:.1f} MB '
+        f'body, {matrices:.1f} MB matrices'
+    )
+    for name, fn in (
+            ('buffered', lambda: _buffered(raw, args.chunk)),
+            ('streamed', lambda: _streamed(raw, args.chunk, args.size)),
+    ):
+        elapsed, peak = _measure(fn)
+        print(
+            f'{name:>9}: {elapsed * 1000:9.1f} ms '
+            f'peak {peak / 1024 / 1024:8.1f} MB'
+        )
+
+
+if __name__ == '__main__':
+    main()
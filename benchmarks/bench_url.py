@@ -0,0 +1,66 @@
+"""Request url length and build time, text versus polyline coordinates.
+
+Urls of table requests are built with the coordinates as full precision
+text, as ``polyline`` and as ``polyline6``, for a GPS-like trace and for
+coordinates scattered over a region.
+
+Usage: python -m benchmarks.bench_url [--sizes N [N ...]]
+"""
+import argparse
+import random
+import timeit
+
+from osrm.utils import _build_osrm_url
+
+ENCODINGS = {'text': None, 'polyline': 5, 'polyline6': 6}
+
+
+def _trace(n: int, rnd: random.Random) -> list:
+    lon, lat = 12.0, 41.0
+    coords = []
+    for _ in range(n):
+        lon += rnd.uniform(-1e-3, 1e-3)
+        lat += rnd.uniform(-1e-3, 1e-3)
+        coords.append((lon, lat))
+    return coords
+
+
+def _scattered(n: int, rnd: random.Random) -> list:
+    return [(rnd.uniform(6, 18), rnd.uniform(36, 47)) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000],
+    )
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    print(
+        f'{"coordinates":>20} {"encoding":>10} {"url KB":>9} '
+        f'{"build ms":>9}'
+    )
+    for kind, generate in (('trace', _trace), ('scattered', _scattered)):
+        for n in args.sizes:
+            coords = generate(n, rnd)
+            for name, precision in ENCODINGS.items():
+                def _build():
+                    return _build_osrm_url(
+                        'table', 'v1', 'driving', coords,
+                        polyline_precision=precision,
+                    )
+
+                number = max(1, 10000 // n)
+                elapsed = min(timeit.repeat(
+                    _build, number=number, repeat=args.repeat,
+                )) / number
+                print(
+                    f'{f"{kind} {n}":>20} {name:>10} '
+                    f'{len(_build()) / 1000:9.2f} {elapsed * 1000:9.3f}'
+                )
+
+
+if __name__ == '__main__':
+    main()
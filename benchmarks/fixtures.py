@@ -0,0 +1,108 @@
+"""Synthetic OSRM responses of configurable size."""
+import random
+from typing import List, Optional
+
+
+def waypoint(i: int) -> dict:
+    return {
+        "name": f"street {i}",
+        "location": [12.0 + i * 1e-4, 41.0 + i * 1e-4],
+        "distance": 3.2,
+        "hint": "AAAAgP___38AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA",
+    }
+
+
+def intersection(i: int, lanes: int = 2) -> dict:
+    return {
+        "location": [12.0 + i * 1e-5, 41.0 + i * 1e-5],
+        "bearings": [0, 90, 180, 270],
+        "entry": [True, True, False, True],
+        "in": 2,
+        "out": 0,
+        "lanes": [
+            {"indications": ["straight"], "valid": True}
+            for _ in range(lanes)
+        ],
+    }
+
+
+def step(i: int, intersections: int = 5) -> dict:
+    return {
+        "name": f"street {i}",
+        "mode": "driving",
+        "distance": 120.5,
+        "duration": 14.2,
+        "weight": 14.2,
+        "driving_side": "right",
+        "geometry": "_p~iF~ps|U_ulLnnqC_mqNvxq`@",
+        "maneuver": {
+            "location": [12.0 + i * 1e-4, 41.0 + i * 1e-4],
+            "bearing_before": 90,
+            "bearing_after": 0,
+            "type": "turn",
+            "modifier": "left",
+        },
+        "intersections": [intersection(j) for j in range(intersections)],
+    }
+
+
+def route(
+        legs: int = 1,
+        steps: int = 10,
+        intersections: int = 5,
+        annotation_size: int = 0,
+) -> dict:
+    leg = {
+        "distance": 1205.0,
+        "duration": 142.0,
+        "weight": 142.0,
+        "summary": "street 1, street 2",
+        "steps": [step(i, intersections) for i in range(steps)],
+    }
+    if annotation_size:
+        leg["annotation"] = {
+            "distance": [1.5] * annotation_size,
+            "duration": [0.2] * annotation_size,
+            "datasources": [0] * annotation_size,
+            "nodes": list(range(annotation_size + 1)),
+        }
+    return {
+        "distance": 1205.0 * legs,
+        "duration": 142.0 * legs,
+        "weight": 142.0 * legs,
+        "weight_name": "routability",
+        "geometry": "_p~iF~ps|U_ulLnnqC_mqNvxq`@",
+        "legs": [leg] * legs,
+    }
+
+
+def route_response(routes: int = 1, **kwargs) -> dict:
+    return {
+        "code": "Ok",
+        "routes": [route(**kwargs) for _ in range(routes)],
+        "waypoints": [waypoint(i) for i in range(kwargs.get("legs", 1) + 1)],
+    }
+
+
+def table_response(
+        size: int,
+        annotations: List[str] = ["durations"],
+        unreachable: float = 0.01,
+        seed: Optional[int] = 42,
+) -> dict:
+    rnd = random.Random(seed)
+    res = {
+        "code": "Ok",
+        "sources": [waypoint(i) for i in range(size)],
+        "destinations": [waypoint(i) for i in range(size)],
+    }
+    for key in annotations:
+        res[key] = [
+            [
+                None if rnd.random() < unreachable
+                else round(rnd.uniform(0, 5000), 1)
+                for _ in range(size)
+            ]
+            for _ in range(size)
+        ]
+    return res
@@ -0,0 +1,335 @@
+"""Local stand-in OSRM server serving canned responses over real HTTP.
+
+Responses have the shape of the OSRM API and a size driven by the request
+(e.g. a table of the requested coordinates, a route leg between each of
+them) and by the ``steps`` and ``intersections`` of the server. Bodies are
+encoded once per shape and cached, so that the server costs little CPU
+besides HTTP handling. Each response is delayed by ``latency`` seconds.
+
+Faults can be injected: a ratio of the responses failing with 503 or
+delayed by ``slow_latency`` instead, e.g. to simulate a slow replica.
+
+The capacity of the server can be limited to ``capacity`` requests served
+at once, as the threads of ``osrm-routed``: further requests queue, and
+fail with 503 beyond ``max_queue`` queued requests.
+
+Usage: python -m benchmarks.server [--port N] [--latency S] [--capacity N]
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from . import fixtures
+
+
+class StandInServer():
+    """OSRM API stand-in running in a background thread.
+
+    Use as context manager, the server listens on :attr:`url` while open.
+    """
+
+    def __init__(
+            self,
+            host: str = '127.0.0.1',
+            port: int = 0,
+            latency: float = 0.0,
+            steps: int = 10,
+            intersections: int = 5,
+            max_table_size: Optional[int] = None,
+            error_rate: float = 0.0,
+            slow_rate: float = 0.0,
+            slow_latency: float = 1.0,
+            capacity: Optional[int] = None,
+            max_queue: Optional[int] = None,
+            seed: Optional[int] = 42,
+    ) -> None:
+        """Construct the server.
+
+        :keyword host: Address to listen on.
+        :keyword port: Port to listen on, 0 for any free port.
+        :keyword latency: Seconds every response is delayed.
+        :keyword steps: Steps of each route leg.
+        :keyword intersections: Intersections of each route step.
+        :keyword max_table_size: Reject larger tables as OSRM does.
+        :keyword error_rate: Ratio of responses failing with status 503.
+        :keyword slow_rate: Ratio of responses delayed by ``slow_latency``.
+        :keyword slow_latency: Seconds slow responses are delayed.
+        :keyword capacity: Max requests served at once, others queue.
+        :keyword max_queue: Max queued requests, others fail with 503.
+        :keyword seed: Seed of the fault injection.
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.steps = steps
+        self.intersections = intersections
+        self.max_table_size = max_table_size
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.queued = 0
+        self.max_queued = 0
+        self.rejected = 0
+        self._workers = (
+            threading.Semaphore(capacity) if capacity is not None else None
+        )
+        self._random = random.Random(seed)
+        self.requests = 0
+        # CPU seconds spent serving, to tell it apart from the client
+        self.cpu_time = 0.0
+        self._bodies: Dict[Tuple, bytes] = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def __enter__(self) -> 'StandInServer':
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> None:
+        """Start serving in a background thread."""
+        handler = type('_Handler', (_Handler,), {'stand_in': self})
+        self._server = _Server((self.host, self.port), handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving and close the listening socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def account(self, cpu_time: float, requests: int = 1) -> None:
+        """Count served requests and their CPU seconds."""
+        with self._lock:
+            self.requests += requests
+            self.cpu_time += cpu_time
+
+    @contextmanager
+    def slot(self) -> Iterator[bool]:
+        """Hold a worker while serving, False if the queue is full."""
+        if self._workers is None:
+            yield True
+            return
+        if not self._workers.acquire(blocking=False):
+            with self._lock:
+                full = (
+                    self.max_queue is not None and
+                    self.queued >= self.max_queue
+                )
+                if full:
+                    self.rejected += 1
+                else:
+                    self.queued += 1
+                    self.max_queued = max(self.max_queued, self.queued)
+            if full:
+                yield False
+                return
+            self._workers.acquire()
+            with self._lock:
+                self.queued -= 1
+        try:
+            yield True
+        finally:
+            self._workers.release()
+
+    def delay(self) -> float:
+        """Seconds to delay the next response."""
+        if self.slow_rate:
+            with self._lock:
+                if self._random.random() < self.slow_rate:
+                    return self.slow_latency
+        return self.latency
+
+    def respond(self, path: str) -> Tuple[int, bytes]:
+        """Status and body of the response to a request path."""
+        if self.error_rate:
+            with self._lock:
+                error = self._random.random() < self.error_rate
+            if error:
+                return 503, b'Service Unavailable'
+        parts = urlsplit(path)
+        segments = parts.path.strip('/').split('/')
+        if len(segments) != 4 or segments[0] not in _SERVICES:
+            return 400, _error('InvalidUrl', 'URL string malformed')
+        service = segments[0]
+        coordinates = unquote(segments[3])
+        if coordinates.startswith('polyline'):
+            encoded = coordinates[coordinates.index('(') + 1:-1]
+            # 2 values per coordinate, each ending with a chunk below 0x20
+            size = sum(ord(c) - 63 < 0x20 for c in encoded) // 2
+        else:
+            size = len(coordinates.split(';'))
+        params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+
+        if service == 'table':
+            shape = tuple(
+                size if params.get(p, 'all') == 'all'
+                else len(params[p].split(';'))
+                for p in ('sources', 'destinations')
+            )
+            if self.max_table_size and size > self.max_table_size:
+                return 400, _error(
+                    'TooBig', 'Too many table coordinates',
+                )
+            key = (service, shape, params.get('annotations', 'duration'))
+        elif service == 'nearest':
+            key = (service, int(params.get('number', 1)))
+        else:
+            key = (service, size)
+
+        body = self._bodies.get(key)
+        if body is None:
+            body = json.dumps(_SERVICES[service](self, *key[1:])).encode()
+            with self._lock:
+                self._bodies[key] = body
+        return 200, body
+
+    def _nearest(self, number: int) -> dict:
+        return {
+            "code": "Ok",
+            "waypoints": [fixtures.waypoint(i) for i in range(number)],
+        }
+
+    def _route(self, size: int) -> dict:
+        return fixtures.route_response(
+            legs=max(size - 1, 1),
+            steps=self.steps,
+            intersections=self.intersections,
+        )
+
+    def _table(self, shape: Tuple[int, int], annotations: str) -> dict:
+        res = fixtures.table_response(
+            max(shape),
+            annotations=[f'{a}s' for a in annotations.split(',')],
+        )
+        for key in ('durations', 'distances'):
+            if key in res:
+                res[key] = [row[:shape[1]] for row in res[key][:shape[0]]]
+        res['sources'] = res['sources'][:shape[0]]
+        res['destinations'] = res['destinations'][:shape[1]]
+        return res
+
+    def _match(self, size: int) -> dict:
+        return {
+            "code": "Ok",
+            "tracepoints": [
+                {
+                    **fixtures.waypoint(i),
+                    "matchings_index": 0,
+                    "waypoint_index": i,
+                    "alternatives_count": 0,
+                }
+                for i in range(size)
+            ],
+            "matchings": [{
+                **self._route(size)["routes"][0],
+                "confidence": 0.9,
+            }],
+        }
+
+    def _trip(self, size: int) -> dict:
+        return {
+            "code": "Ok",
+            "waypoints": [
+                {**fixtures.waypoint(i), "trips_index": 0, "waypoint_index": i}
+                for i in range(size)
+            ],
+            "trips": self._route(size + 1)["routes"],
+        }
+
+
+_SERVICES: Dict[str, Callable[..., dict]] = {
+    'nearest': StandInServer._nearest,
+    'route': StandInServer._route,
+    'table': StandInServer._table,
+    'match': StandInServer._match,
+    'trip': StandInServer._trip,
+}
+
+
+def _error(code: str, message: str) -> bytes:
+    return json.dumps({"code": code, "message": message}).encode()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # clients may close connections, e.g. cancelled hedged requests
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately
+    disable_nagle_algorithm = True
+    stand_in: StandInServer
+
+    def do_GET(self) -> None:
+        with self.stand_in.slot() as served:
+            start = time.thread_time()
+            if served:
+                status, body = self.stand_in.respond(self.path)
+            else:
+                status, body = 503, b'Service Unavailable'
+            cpu_time = time.thread_time() - start
+            delay = self.stand_in.delay() if served else 0
+            if delay:
+                time.sleep(delay)
+        # counted before the client can read the response
+        self.stand_in.account(cpu_time)
+        start = time.thread_time()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.stand_in.account(time.thread_time() - start, requests=0)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--capacity', type=int)
+    parser.add_argument('--max-queue', type=int)
+    args = parser.parse_args()
+
+    with StandInServer(
+            port=args.port, latency=args.latency, steps=args.steps,
+            capacity=args.capacity, max_queue=args.max_queue,
+    ) as server:
+        print(f'serving on {server.url}, ctrl-c to stop')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ from .model import (
     Lane,
     OsrmMatch,
     OsrmNearest,
+    OsrmSnap,
     OsrmTable,
     OsrmTrip,
     OsrmTile,
@@ -15,25 +16,61 @@ from .model import (
     StepManeuver,
     Waypoint,
 )
-from .client_sync import OsrmClient
+from .balancing import Backend, Balancer
+from .cache import Cache, MemoryCache, SqliteCache
+from .concurrency import AdaptiveLimiter
+from .instrumentation import RequestEvent
+from .replay import Recorder, Replayer
+from .resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    HedgePolicy,
+    RetryPolicy,
+)
+from .client_sync import BatchResults, OsrmClient
 from .client_async import OsrmAsyncClient
+from .sharding import (
+    OsrmAsyncShardedClient,
+    OsrmShardedClient,
+    Shard,
+    ShardMap,
+)
 
 __all__ = [
+    'AdaptiveLimiter',
     'Annotation',
+    'Backend',
+    'Balancer',
+    'BatchResults',
+    'Cache',
+    'CircuitBreaker',
+    'CircuitOpenError',
+    'HedgePolicy',
     'Intersection',
     'Lane',
+    'MemoryCache',
     'OsrmAsyncClient',
+    'OsrmAsyncShardedClient',
     'OsrmClient',
     'OsrmMatch',
     'OsrmNearest',
+    'OsrmShardedClient',
+    'OsrmSnap',
     'OsrmTable',
     'OsrmTrip',
     'OsrmTile',
     'Point',
+    'Recorder',
+    'Replayer',
+    'RequestEvent',
+    'RetryPolicy',
     'Route',
     'RouteLeg',
     'RouteStep',
     'ServiceStatus',
+    'Shard',
+    'ShardMap',
+    'SqliteCache',
     'StepManeuver',
     'Waypoint',
 ]
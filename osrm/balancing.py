@@ -0,0 +1,176 @@
+"""Load balancing of the requests over many OSRM servers.
+
+Give the clients a list of server urls as ``base_url``, or a configured
+:class:`Balancer` as ``balancer``. Each request goes to the server chosen
+by the balancer strategy:
+
+- ``least_outstanding``: the server with the fewest requests in flight.
+- ``ewma``: the server with the lowest moving average of the latency,
+  weighted by its requests in flight ("peak EWMA").
+- ``round_robin``: each server in turn, as a dumb proxy would.
+
+Servers failing ``max_failures`` times in a row (connection errors or 5xx
+responses) are ejected for ``eject_time`` seconds, then re-probed with a
+single request: on success they are back in rotation, else ejected again.
+"""
+import random
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+STRATEGIES = ('least_outstanding', 'ewma', 'round_robin')
+
+
+class Backend():
+    """A OSRM server and its load and health state."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url if url.endswith('/') else url + '/'
+        self.outstanding = 0
+        # moving average of the latency, None until the first response
+        self.ewma: Optional[float] = None
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0
+        self.ejected_until: Optional[float] = None
+        self.probing = False
+
+    def __repr__(self) -> str:
+        ewma = f'{self.ewma * 1000:.1f}ms' if self.ewma is not None else None
+        return (
+            f'<Backend {self.url} outstanding={self.outstanding} '
+            f'ewma={ewma} requests={self.requests} errors={self.errors} '
+            f'healthy={self.healthy}>'
+        )
+
+    @property
+    def healthy(self) -> bool:
+        """Whether the server is in rotation."""
+        return self.ejected_until is None
+
+
+class Balancer():
+    """Chooses the server of each request, safe to share between threads."""
+
+    def __init__(
+            self,
+            urls: Iterable[str],
+            strategy: str = 'least_outstanding',
+            decay: float = 0.3,
+            max_failures: int = 3,
+            eject_time: float = 10.0,
+    ) -> None:
+        """Construct the balancer.
+
+        :param urls: Base urls of the OSRM servers.
+        :keyword str strategy: One of ``least_outstanding``, ``ewma`` and
+                               ``round_robin``.
+        :keyword float decay: Weight of the last latency in the moving
+                              average.
+        :keyword int max_failures: Consecutive failures ejecting a server.
+        :keyword float eject_time: Seconds before re-probing an ejected
+                                   server.
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f'unknown balancing strategy {strategy!r}')
+        self.backends = [Backend(url) for url in urls]
+        if not self.backends:
+            raise ValueError('no backend to balance')
+        self.strategy = strategy
+        self.decay = decay
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def select(
+            self,
+            exclude: Optional[Backend] = None,
+            available: Optional[Callable[[str], bool]] = None,
+    ) -> Optional[Backend]:
+        """Choose the server of a request and count it as in flight.
+
+        Ejected servers whose time is up are re-probed first. When all the
+        servers are ejected, the one ejected first is chosen anyway.
+
+        :keyword exclude: Server to avoid if possible, e.g. for a hedge.
+        :keyword available: Whether a server url can be chosen at all,
+                            e.g. its circuit being closed.
+        :return: The server, None if none is available.
+        """
+        with self._lock:
+            backends = self.backends
+            if available is not None:
+                backends = [b for b in backends if available(b.url)]
+                if not backends:
+                    return None
+            now = time.monotonic()
+            candidates = []
+            for backend in backends:
+                if backend.healthy:
+                    candidates.append(backend)
+                elif not backend.probing and backend.ejected_until <= now:
+                    backend.probing = True
+                    return self._acquire(backend)
+            if exclude is not None and len(candidates) > 1:
+                candidates = [b for b in candidates if b is not exclude]
+            if not candidates:
+                return self._acquire(min(
+                    backends, key=lambda b: b.ejected_until,
+                ))
+            return self._acquire(self._choose(candidates))
+
+    def release(
+            self,
+            backend: Backend,
+            latency: Optional[float],
+            ok: Optional[bool] = True,
+    ) -> None:
+        """Complete a request to the server.
+
+        :param backend: Server chosen by :meth:`select`.
+        :param latency: Seconds the request took, None if not sent.
+        :keyword ok: Whether the server responded correctly, None if
+                     unknown (e.g. cancelled request), not affecting its
+                     health.
+        """
+        with self._lock:
+            backend.outstanding -= 1
+            if ok is not False and latency is not None:
+                backend.ewma = latency if backend.ewma is None else (
+                    self.decay * latency + (1 - self.decay) * backend.ewma
+                )
+            if ok is None:
+                if backend.probing:
+                    backend.probing = False
+                return
+            if ok:
+                backend.failures = 0
+                backend.ejected_until = None
+            else:
+                backend.errors += 1
+                backend.failures += 1
+                if backend.probing or backend.failures >= self.max_failures:
+                    backend.ejected_until = time.monotonic() + self.eject_time
+            backend.probing = False
+
+    def _acquire(self, backend: Backend) -> Backend:
+        backend.outstanding += 1
+        backend.requests += 1
+        return backend
+
+    def _choose(self, candidates: List[Backend]) -> Backend:
+        if self.strategy == 'round_robin':
+            self._next += 1
+            return candidates[self._next % len(candidates)]
+        if self.strategy == 'least_outstanding':
+            def cost(backend):
+                return backend.outstanding
+        else:
+            # servers without latency yet are tried first
+            def cost(backend):
+                ewma = backend.ewma or 0.0
+                return ewma * (backend.outstanding + 1)
+        best = min(cost(backend) for backend in candidates)
+        # random among ties, so that idle servers share the load
+        return random.choice([b for b in candidates if cost(b) == best])
@@ -0,0 +1,280 @@
+import abc
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class Cache(abc.ABC):
+    """Base cache of raw OSRM responses keyed on the canonical request url.
+
+    Entries are evicted least recently used first when the total size of
+    the cached responses exceeds ``max_bytes``, and are considered missing
+    after ``ttl`` seconds. Subclasses implement the storage backend.
+    """
+
+    def __init__(
+            self,
+            max_bytes: int = 64 * 1024 * 1024,
+            ttl: Optional[float] = None,
+    ) -> None:
+        """Construct the cache.
+
+        :keyword int max_bytes: Max total size of cached responses.
+        :keyword float ttl: Seconds an entry is valid, None for no expiry.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Get a cached response, None if missing or expired."""
+        value = self._get(key, time.time())
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        """Cache a response, evicting older entries if needed."""
+        if len(value) > self.max_bytes:
+            return
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        self._set(key, value, expires)
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        """Remove all entries."""
+
+    @property
+    def hit_ratio(self) -> float:
+        """Ratio of lookups served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @abc.abstractmethod
+    def _get(self, key: str, now: float) -> Optional[bytes]:
+        """Stored response, None if missing or expired at ``now``."""
+
+    @abc.abstractmethod
+    def _set(self, key: str, value: bytes, expires: Optional[float]) -> None:
+        """Store a response, expiring at ``expires`` if not None."""
+
+
+class MemoryCache(Cache):
+    """In-memory LRU cache, safe to share between threads."""
+
+    def __init__(
+            self,
+            max_bytes: int = 64 * 1024 * 1024,
+            ttl: Optional[float] = None,
+    ) -> None:
+        """Construct the cache.
+
+        :keyword int max_bytes: Max total size of cached responses.
+        :keyword float ttl: Seconds an entry is valid, None for no expiry.
+        """
+        super().__init__(max_bytes=max_bytes, ttl=ttl)
+        # guarded by the lock of the base cache
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the cached responses."""
+        return self._size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _get(self, key: str, now: float) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= now:
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: bytes, expires: Optional[float]) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, expires)
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._size -= len(value)
+
+
+class SqliteCache(Cache):
+    """On-disk LRU cache backed by SQLite.
+
+    The database survives restarts and can be shared by many processes,
+    each one opening its own connection per thread. Hit and miss counters
+    are local to the instance.
+
+    The total size is maintained by triggers, so that the least recently
+    used entries are evicted only when it exceeds ``max_bytes``. Reading an
+    entry updates its access time only if older than ``access_resolution``
+    seconds: most hits do not write, which would lock the database.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            max_bytes: int = 1024 * 1024 * 1024,
+            ttl: Optional[float] = None,
+            timeout: float = 30.0,
+            access_resolution: float = 10.0,
+    ) -> None:
+        """Construct the cache.
+
+        :param str path: Path of the SQLite database file.
+        :keyword int max_bytes: Max total size of cached responses.
+        :keyword float ttl: Seconds an entry is valid, None for no expiry.
+        :keyword float timeout: Seconds to wait for a locked database.
+        :keyword float access_resolution: Seconds within which reads of an
+                                          entry are the same for the LRU.
+        """
+        super().__init__(max_bytes=max_bytes, ttl=ttl)
+        self.path = path
+        self.timeout = timeout
+        self.access_resolution = access_resolution
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS osrm_cache ('
+                ' key TEXT PRIMARY KEY,'
+                ' value BLOB NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' expires REAL,'
+                ' accessed REAL NOT NULL'
+                ')'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS osrm_cache_accessed'
+                ' ON osrm_cache (accessed)'
+            )
+            # single row with the total size, also of existing databases
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS osrm_cache_size ('
+                ' id INTEGER PRIMARY KEY CHECK (id = 0),'
+                ' total INTEGER NOT NULL'
+                ')'
+            )
+            conn.execute(
+                'INSERT OR IGNORE INTO osrm_cache_size (id, total)'
+                ' SELECT 0, COALESCE(SUM(size), 0) FROM osrm_cache'
+            )
+            for event, delta in (
+                    ('INSERT', 'NEW.size'),
+                    ('DELETE', '-OLD.size'),
+                    ('UPDATE OF size', 'NEW.size - OLD.size'),
+            ):
+                name = event.split()[0].lower()
+                conn.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS osrm_cache_{name}'
+                    f' AFTER {event} ON osrm_cache BEGIN'
+                    f' UPDATE osrm_cache_size SET total = total + {delta};'
+                    ' END'
+                )
+
+    def __len__(self) -> int:
+        with self._connection() as conn:
+            row = conn.execute('SELECT COUNT(*) FROM osrm_cache').fetchone()
+            return row[0]
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the cached responses."""
+        with self._connection() as conn:
+            return self._size(conn)
+
+    def clear(self) -> None:
+        with self._connection() as conn:
+            conn.execute('DELETE FROM osrm_cache')
+
+    def close(self) -> None:
+        """Close the connection of the current thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _size(self, conn: sqlite3.Connection) -> int:
+        return conn.execute(
+            'SELECT total FROM osrm_cache_size WHERE id = 0'
+        ).fetchone()[0]
+
+    def _get(self, key: str, now: float) -> Optional[bytes]:
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT value, expires, accessed FROM osrm_cache'
+                ' WHERE key = ?',
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires, accessed = row
+            if expires is not None and expires <= now:
+                conn.execute('DELETE FROM osrm_cache WHERE key = ?', (key,))
+                return None
+            if now - accessed >= self.access_resolution:
+                conn.execute(
+                    'UPDATE osrm_cache SET accessed = ? WHERE key = ?',
+                    (now, key),
+                )
+            return value
+
+    def _set(self, key: str, value: bytes, expires: Optional[float]) -> None:
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT INTO osrm_cache'
+                ' (key, value, size, expires, accessed)'
+                ' VALUES (?, ?, ?, ?, ?)'
+                ' ON CONFLICT (key) DO UPDATE SET'
+                ' value = excluded.value, size = excluded.size,'
+                ' expires = excluded.expires, accessed = excluded.accessed',
+                (key, value, len(value), expires, time.time()),
+            )
+            excess = self._size(conn) - self.max_bytes
+            if excess <= 0:
+                return
+            # least recently used first, reading only the entries evicted
+            evicted = []
+            for old_key, size in conn.execute(
+                    'SELECT key, size FROM osrm_cache'
+                    ' ORDER BY accessed, key'
+            ):
+                evicted.append((old_key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany(
+                'DELETE FROM osrm_cache WHERE key = ?', evicted,
+            )
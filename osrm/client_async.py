@@ -1,9 +1,49 @@
-from typing import List, Optional
+import asyncio
+import functools
+import time
+from concurrent.futures import Executor
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from urllib.parse import urljoin
 
 import aiohttp
 
 from . import model
-from .utils import _build_osrm_url, _check_response
+from .balancing import Backend, Balancer
+from .cache import Cache
+from .concurrency import AdaptiveLimiter
+from .instrumentation import RequestEvent
+from .replay import Recorder, Replayer
+from .resilience import (
+    CircuitBreaker, CircuitOpenError, HedgePolicy, RetryPolicy,
+)
+from .streaming import TableParser
+from .utils import (
+    _ResponseParser,
+    _build_osrm_url,
+    _cache_key,
+    _collapse_table,
+    _decode_response,
+    _dedupe_coordinates,
+    _default_json_loads,
+    _expand_table,
+    _match_windows,
+    _merge_match_windows,
+    _merge_table_tiles,
+    _table_params,
+    _table_tiles,
+)
 
 
 class OsrmAsyncClient():
@@ -15,29 +55,162 @@ class OsrmAsyncClient():
 
     def __init__(
             self,
-            base_url: str = 'https://router.project-osrm.org',
+            base_url: Union[str, Sequence[str]] = (
+                'https://router.project-osrm.org'
+            ),
             api_version: str = 'v1',
             default_profile: str = 'driving',
+            max_concurrency: int = 8,
+            pool_size: int = 100,
+            pool_size_per_host: int = 0,
+            keepalive_timeout: float = 15.0,
+            dns_cache_ttl: Optional[int] = 10,
+            session: Optional[aiohttp.ClientSession] = None,
+            connector: Optional[aiohttp.BaseConnector] = None,
+            cache: Optional[Cache] = None,
+            lazy: bool = False,
+            coalesce: bool = False,
+            json_loads: Optional[Callable[[bytes], Any]] = None,
+            parse_executor: Optional[Executor] = None,
+            recorder: Optional[Recorder] = None,
+            replayer: Optional[Replayer] = None,
+            on_request: Optional[Callable[[RequestEvent], None]] = None,
+            retry: Optional[RetryPolicy] = None,
+            hedge: Optional[HedgePolicy] = None,
+            balancer: Optional[Balancer] = None,
+            breaker: Optional[CircuitBreaker] = None,
+            limiter: Optional[AdaptiveLimiter] = None,
+            polyline_threshold: Optional[int] = 100,
+            polyline_precision: int = 6,
     ) -> None:
         """Construct instance of OSRM client.
 
-        :keyword str base_url: Base url of the OSRM server.
+        :keyword base_url: Base url of the OSRM server, or list of base
+                           urls of many servers to balance the requests
+                           over, see :mod:`osrm.balancing`.
         :keyword str api_version: Api version of OSRM server.
         :keyword str default_profile: Default profile to use.
+        :keyword int max_concurrency: Max concurrent requests issued by
+                                      a single call (e.g. table tiles).
+        :keyword int pool_size: Max open connections, 0 for no limit.
+        :keyword int pool_size_per_host: Max open connections per host,
+                                         0 for no limit.
+        :keyword float keepalive_timeout: Seconds idle connections are
+                                          kept alive.
+        :keyword dns_cache_ttl: Seconds DNS resolutions are cached, None
+                                to cache forever and 0 to disable.
+        :keyword session: Existing session to use, e.g. shared by many
+                          clients. It is not closed by the client and
+                          pool options do not apply to it.
+        :keyword connector: Existing connector to use, e.g. to share the
+                            connection pool. It is not closed by the
+                            client and pool options do not apply to it.
+        :keyword cache: Cache of the responses, see :mod:`osrm.cache`.
+        :keyword bool lazy: Build nested route structures (legs, steps,
+                            intersections, annotations) on first access.
+        :keyword bool coalesce: Share a single request between identical
+                                concurrent requests.
+        :keyword json_loads: Function decoding the raw JSON body, defaults
+                             to orjson if installed else the json module.
+        :keyword parse_executor: Thread or process pool decoding responses
+                                 and building the results off the event
+                                 loop. With a process pool ``json_loads``
+                                 must be picklable, results are sent back
+                                 pickled. It is not shut down by the client.
+        :keyword recorder: Record every response, cache hits included,
+                           see :mod:`osrm.replay`.
+        :keyword replayer: Serve the responses from a record instead of
+                           the server, see :mod:`osrm.replay`.
+        :keyword on_request: Called with the timings of each request, see
+                             :mod:`osrm.instrumentation`. Connection phases
+                             are measured only on the client own session.
+        :keyword retry: Retry policy of transient failures, see
+                        :mod:`osrm.resilience`.
+        :keyword hedge: Hedging policy of slow requests, see
+                        :mod:`osrm.resilience`.
+        :keyword balancer: Balancer of the requests over many servers,
+                           instead of ``base_url``, e.g. to configure it
+                           or share it between clients.
+        :keyword breaker: Circuit breaker of the servers, failing fast or
+                          failing over while a server is down, see
+                          :mod:`osrm.resilience`.
+        :keyword limiter: Adaptive limit of the requests in flight to the
+                          servers, see :mod:`osrm.concurrency`.
+        :keyword polyline_threshold: Coordinates above which they are sent
+                                     polyline encoded, for much shorter
+                                     urls, None to always send them as
+                                     text.
+        :keyword int polyline_precision: Decimal digits of the encoded
+                                         coordinates, 6 (``polyline6``,
+                                         about 0.1 m) or 5 (``polyline``).
         """
-        self.base_url = base_url
+        if balancer is None and not isinstance(base_url, str):
+            balancer = Balancer(base_url)
+        self.balancer = balancer
+        # with many servers, urls are built on the first one and rebased on
+        # the server of each request
+        self.base_url = (
+            balancer.backends[0].url if balancer is not None else base_url
+        )
         self.api_version = api_version
         self.default_profile = default_profile
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.pool_size_per_host = pool_size_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.session = session
+        self.connector = connector
+        self.cache = cache
+        self.lazy = lazy
+        self.coalesce = coalesce
+        self.json_loads = json_loads or _default_json_loads()
+        self.parse_executor = parse_executor
+        self.recorder = recorder
+        self.replayer = replayer
+        self.on_request = on_request
+        self.retry = retry
+        self.hedge = hedge
+        self.breaker = breaker
+        self.limiter = limiter
+        if polyline_precision not in (5, 6):
+            raise ValueError('polyline precision must be 5 or 6')
+        self.polyline_threshold = polyline_threshold
+        self.polyline_precision = polyline_precision
+        # canonical url -> in-flight request, when coalescing
+        self._inflight = {}
 
     async def __aenter__(self):
         """Initialize client opening the underlying http session."""
-        session = aiohttp.ClientSession(base_url=self.base_url)
+        if self.session is not None:
+            self._session = self.session
+            return self
+
+        if self.connector is not None:
+            connector = self.connector
+        else:
+            # TCP_NODELAY is always set by aiohttp
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=self.dns_cache_ttl != 0,
+                ttl_dns_cache=self.dns_cache_ttl,
+            )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            connector_owner=self.connector is None,
+            trace_configs=(
+                [_trace_config()] if self.on_request is not None else None
+            ),
+        )
         self._session = await session.__aenter__()
         return self
 
     async def __aexit__(self, *args, **kwargs):
         """Finalize the client closing the underlying http session."""
-        await self._session.__aexit__(*args, **kwargs)
+        if self._session is not self.session:
+            await self._session.__aexit__(*args, **kwargs)
 
     async def nearest(
             self,
@@ -66,11 +239,54 @@ class OsrmAsyncClient():
         ):
             raise Exception('provide only one coordinate (lon, lat)')
 
-        osrm_res = await self._osrm_service(
+        return await self._osrm_service(
             'nearest', profile, [coordinate],
+            parser=self._parser(model.OsrmNearest),
             number=number,
         )
-        return model.OsrmNearest(**osrm_res)
+
+    async def snap(
+            self,
+            coordinates: Iterable[model.Point],
+            profile: Optional[str] = None,
+            precision: Optional[int] = 5,
+            concurrency: Optional[int] = None,
+    ) -> model.OsrmSnap:
+        """Snap many coordinates to the street network.
+
+        Coordinates are rounded to ``precision`` decimal digits (5 digits
+        are about 1 meter) and each unique cell is snapped once with the
+        Nearest service, with bounded concurrency. The nearest waypoint of
+        each cell is fanned back out to the input coordinates falling in it.
+
+        :param coordinates: Coordinates to snap.
+        :keyword profile: OSRM Profile, defaults to client default.
+        :keyword precision: Decimal digits coordinates are rounded to,
+                            None to collapse only exact duplicates.
+        :keyword concurrency: Max in-flight requests, defaults to
+                              ``max_concurrency``.
+
+        :return: Waypoints aligned to the coordinates and dedup stats.
+        :rtype: ~model.OsrmSnap
+        """
+        unique, inverse = _dedupe_coordinates(coordinates, precision)
+
+        waypoints = [None] * len(unique)
+        errors = {}
+        cells = ((float(lon), float(lat)) for lon, lat in unique)
+        async for i, res in self.nearest_many(
+                cells, concurrency=concurrency, profile=profile,
+        ):
+            if isinstance(res, Exception):
+                errors[unique[i]] = res
+            elif res.waypoints:
+                waypoints[i] = res.waypoints[0]
+
+        return model.OsrmSnap(
+            waypoints=[waypoints[i] for i in inverse],
+            unique=len(unique),
+            errors=errors,
+        )
 
     async def route(
             self,
@@ -101,8 +317,9 @@ class OsrmAsyncClient():
         :return: Route computed by OSRM.
         :rtype: ~model.OsrmRoute
         """
-        osrm_res = await self._osrm_service(
+        return await self._osrm_service(
             'route', profile, coordinates,
+            parser=self._parser(model.OsrmRoute, lazy=self.lazy),
             alternatives=alternatives,
             steps=steps,
             geometries=geometries,
@@ -110,7 +327,6 @@ class OsrmAsyncClient():
             annotations=annotations,
             continue_straight=continue_straight,
         )
-        return model.OsrmRoute(**osrm_res)
 
     async def table(
             self,
@@ -119,12 +335,27 @@ class OsrmAsyncClient():
             sources: List[int] = [],
             destinations: List[int] = [],
             annotations: List[str] = [],
+            max_table_size: Optional[int] = None,
+            dtype: Optional[str] = None,
+            dedupe: bool = False,
+            dedupe_precision: Optional[int] = None,
     ) -> model.OsrmTable:
         """OSRM Table service.
 
         Computes the duration and/or distance of the fastest route between all pairs
         of supplied coordinates.
 
+        When ``max_table_size`` is given and the coordinates exceed it, the
+        table is split in tiles of sources and destinations that fit the
+        server limit. Tiles are requested concurrently, at most
+        ``max_concurrency`` at a time, and stitched back into a single table.
+
+        With ``dedupe`` duplicate coordinates are requested only once and
+        the result is expanded back, so that the table is identical to the
+        one of the full request. This only holds for exact duplicates:
+        near-duplicates collapsed with ``dedupe_precision`` take the values
+        of the first of them, which may differ from their own.
+
         See https://project-osrm.org/docs/v5.24.0/api/#table-service
 
         :param coordinates: List of coordinates.
@@ -132,21 +363,157 @@ class OsrmAsyncClient():
         :keyword sources: Use location with given index as source.
         :keyword destinations: Use location with given index as destination.
         :keyword annotations: Return the requested table or tables in response.
+        :keyword max_table_size: Max coordinates accepted by the server
+                                 (``--max-table-size``), enables tiling.
+        :keyword dtype: Return matrices as numpy arrays of this dtype
+                        (e.g. ``float64``, ``float32``), NaN if unreachable.
+        :keyword dedupe: Collapse duplicate coordinates before the request
+                         and expand the result back to the input shape.
+        :keyword dedupe_precision: Decimal digits used to compare
+                                   coordinates when collapsing, None for
+                                   exact duplicates only.
 
         :return: Duration and/or distance table computed by OSRM.
         :rtype: ~model.OsrmTable
         """
-        sources_str = ";".join(sources) if sources else "all"
-        destinations_str = ";".join(destinations) if destinations else "all"
-        annotations_str = ",".join(annotations) if annotations else "duration"
+        if dedupe:
+            unique, unique_sources, unique_destinations, rows, cols = (
+                _collapse_table(
+                    coordinates, sources, destinations, dedupe_precision,
+                )
+            )
+            table = await self.table(
+                unique, profile,
+                sources=unique_sources,
+                destinations=unique_destinations,
+                annotations=annotations,
+                max_table_size=max_table_size,
+                dtype=dtype,
+            )
+            return _expand_table(table, rows, cols)
+
+        if max_table_size and len(coordinates) > max_table_size:
+            return await self._table_tiled(
+                coordinates, profile, sources, destinations, annotations,
+                max_table_size, dtype,
+            )
 
-        osrm_res = await self._osrm_service(
+        return await self._osrm_service(
             'table', profile, coordinates,
-            sources=sources_str,
-            destinations=destinations_str,
-            annotations=annotations_str,
+            parser=self._parser(model.OsrmTable, dtype=dtype),
+            **_table_params(sources, destinations, annotations),
         )
-        return model.OsrmTable(**osrm_res)
+
+    async def _table_tiled(
+            self,
+            coordinates: List[model.Point],
+            profile: Optional[str],
+            sources: List[int],
+            destinations: List[int],
+            annotations: List[str],
+            max_table_size: int,
+            dtype: Optional[str] = None,
+    ) -> model.OsrmTable:
+        """Table service split in tiles requested concurrently."""
+        tiles = _table_tiles(
+            coordinates, sources, destinations, max_table_size,
+        )
+        results = await self._gather_bounded(
+            self._osrm_service(
+                'table', profile, tile['coordinates'],
+                sources=";".join(map(str, tile['sources'])),
+                destinations=";".join(map(str, tile['destinations'])),
+                annotations=(
+                    ",".join(annotations) if annotations else "duration"
+                ),
+            )
+            for tile in tiles
+        )
+        osrm_res = _merge_table_tiles(
+            tiles, results,
+            len(sources) if sources else len(coordinates),
+            len(destinations) if destinations else len(coordinates),
+            dtype,
+        )
+        return model.OsrmTable(dtype=dtype, **osrm_res)
+
+    async def stream_table(
+            self,
+            coordinates: List[model.Point],
+            profile: Optional[str] = None,
+            sources: List[int] = [],
+            destinations: List[int] = [],
+            annotations: List[str] = [],
+            dtype: Optional[str] = 'float64',
+            on_row: Optional[Callable[[str, int, Any], None]] = None,
+            chunk_size: int = 64 * 1024,
+    ) -> model.OsrmTable:
+        """OSRM Table service parsing the response while it is received.
+
+        Rows of the ``durations`` and ``distances`` matrices are written
+        into preallocated arrays, or passed to ``on_row`` as soon as they
+        are received, without buffering the whole response: peak memory
+        stays close to the size of the matrices. Meant for very large
+        tables, the response is not cached and the request is not tiled.
+        The request goes through the balancer, the circuit breaker, the
+        retry policy, the limiter and ``on_request`` as the others, but it
+        is not hedged nor retried once rows were received.
+
+        See https://project-osrm.org/docs/v5.24.0/api/#table-service
+
+        :param coordinates: List of coordinates.
+        :keyword profile: OSRM Profile, defaults to client default.
+        :keyword sources: Use location with given index as source.
+        :keyword destinations: Use location with given index as destination.
+        :keyword annotations: Return the requested table or tables in response.
+        :keyword dtype: Numpy dtype of the rows, None for lists.
+        :keyword on_row: Called with the matrix name (``durations`` or
+                         ``distances``), the row index and the row. Rows
+                         passed to it are not kept in the result.
+        :keyword chunk_size: Bytes read from the response at once.
+
+        :return: Table computed by OSRM, without matrices if ``on_row``.
+        :rtype: ~model.OsrmTable
+        """
+        full_url = self._service_url(
+            'table', profile, coordinates,
+            **_table_params(sources, destinations, annotations),
+        )
+        parser = TableParser(
+            (
+                len(sources) if sources else len(coordinates),
+                len(destinations) if destinations else len(coordinates),
+            ),
+            self.json_loads, dtype=dtype, on_row=on_row,
+        )
+
+        async def _stream(res: aiohttp.ClientResponse) -> None:
+            async for chunk in res.content.iter_chunked(chunk_size):
+                parser.feed(chunk)
+
+        # records hold whole bodies
+        whole = self.replayer is not None or self.recorder is not None
+        event = None
+        if self.on_request is not None:
+            event = RequestEvent('table', full_url, len(coordinates))
+        try:
+            status, raw = await self._fetch(
+                full_url, event, stream=None if whole else _stream,
+            )
+            if not 200 <= status < 300:
+                _decode_response(status, raw, self.json_loads)
+            if whole:
+                parser.feed(raw)
+            res = model.OsrmTable(dtype=dtype, **parser.close())
+        except Exception as e:
+            if event is not None:
+                event.done(e)
+                self.on_request(event)
+            raise
+        if event is not None:
+            event.done()
+            self.on_request(event)
+        return res
 
     async def match(
             self,
@@ -158,6 +525,8 @@ class OsrmAsyncClient():
             overview: str = 'simplified',
             timestamps: List[int] = [],
             radiuses: List[float] = [],
+            max_matching_size: Optional[int] = None,
+            window_overlap: int = 10,
     ) -> model.OsrmMatch:
         """OSRM Match service.
 
@@ -168,6 +537,16 @@ class OsrmAsyncClient():
         found. The algorithm might not be able to match all points. Outliers
         are removed if they can not be matched successfully.
 
+        When ``max_matching_size`` is given and the trace exceeds it, the
+        trace is split in windows overlapping by ``window_overlap`` points,
+        requested concurrently, at most ``max_concurrency`` at a time.
+        Results are stitched keeping each tracepoint from a single window:
+        matchings are trimmed to the legs of their tracepoints and joined
+        across windows, so that a continuous trace gives a single matching.
+        Matchings cannot be joined without overlap. Windows are requested
+        with the full overview, to cut it at the waypoints, so that a
+        simplified overview is returned full.
+
         See https://project-osrm.org/docs/v5.24.0/api/#match-service
 
         :param coordinates: List of coordinates.
@@ -178,12 +557,28 @@ class OsrmAsyncClient():
         :keyword overview: Add overview geometry
         :keyword timestamps: UNIX Timestamps (seconds) for the input locations.
         :keyword radiuses: Stddev of GPS precision used for map matching.
+        :keyword max_matching_size: Max coordinates accepted by the server
+                                    (``--max-matching-size``), enables
+                                    windowed matching.
+        :keyword window_overlap: Coordinates shared by adjacent windows.
 
         :return: Match computed by OSRM.
         :rtype: ~model.OsrmMatch
         """
-        osrm_res = await self._osrm_service(
+        if max_matching_size and len(coordinates) > max_matching_size:
+            return await self._match_windowed(
+                coordinates, profile, timestamps, radiuses,
+                max_matching_size, window_overlap,
+                steps=steps,
+                geometries=geometries,
+                annotations=annotations,
+                # waypoints are vertices of the full geometry only
+                overview='full' if overview == 'simplified' else overview,
+            )
+
+        return await self._osrm_service(
             'match', profile, coordinates,
+            parser=self._parser(model.OsrmMatch, lazy=self.lazy),
             steps=steps,
             geometries=geometries,
             annotations=annotations,
@@ -191,7 +586,34 @@ class OsrmAsyncClient():
             timestamps=timestamps,
             radiuses=radiuses,
         )
-        return model.OsrmMatch(**osrm_res)
+
+    async def _match_windowed(
+            self,
+            coordinates: List[model.Point],
+            profile: Optional[str],
+            timestamps: List[int],
+            radiuses: List[float],
+            max_matching_size: int,
+            window_overlap: int,
+            **kwargs,
+    ) -> model.OsrmMatch:
+        """Match service split in windows requested concurrently."""
+        windows = _match_windows(
+            len(coordinates), max_matching_size, window_overlap,
+        )
+        results = await self._gather_bounded(
+            self._osrm_service(
+                'match', profile, coordinates[start:end],
+                timestamps=timestamps[start:end],
+                radiuses=radiuses[start:end],
+                **kwargs,
+            )
+            for start, end, _, _ in windows
+        )
+        osrm_res = _merge_match_windows(
+            windows, results, len(coordinates), kwargs['geometries'],
+        )
+        return await self._build(model.OsrmMatch, osrm_res, lazy=self.lazy)
 
     async def trip(
             self,
@@ -231,8 +653,9 @@ class OsrmAsyncClient():
         :returns: Trip calculated by OSRM.
         :rtype: ~model.OsrmTrip
         """
-        osrm_res = await self._osrm_service(
+        return await self._osrm_service(
             'trip', profile, coordinates,
+            parser=self._parser(model.OsrmTrip, lazy=self.lazy),
             steps=steps,
             geometries=geometries,
             overview=overview,
@@ -240,8 +663,6 @@ class OsrmAsyncClient():
             source=source,
             destination=destination,
         )
-        print(osrm_res)
-        return model.OsrmTrip(**osrm_res)
 
     async def tile(
             self,
@@ -275,24 +696,565 @@ class OsrmAsyncClient():
         osrm_res = await self._get(url)
         return model.OsrmTile(**osrm_res)
 
-    async def _osrm_service(
+    def nearest_many(
+            self,
+            requests: Iterable[Union[model.Point, Dict[str, Any]]],
+            concurrency: Optional[int] = None,
+            ordered: bool = False,
+            buffer_size: Optional[int] = None,
+            **kwargs,
+    ) -> AsyncIterator[Tuple[int, Union[model.OsrmNearest, Exception]]]:
+        """Run many OSRM Nearest requests with bounded concurrency.
+
+        Each request is either a coordinate or a dict of keyword arguments
+        of :meth:`nearest`. Keyword arguments given here are shared by all
+        requests. See :meth:`_run_many` for the semantics of the results.
+
+        :param requests: Iterable of requests.
+        :keyword concurrency: Max in-flight requests, defaults to
+                              ``max_concurrency``.
+        :keyword ordered: Yield results in input order.
+        :keyword buffer_size: Max results buffered waiting for their turn
+                              when ordered, defaults to twice concurrency.
+
+        :return: Async iterator of (input index, result or exception).
+        """
+        return self._run_many(
+            self.nearest, 'coordinate', requests, kwargs,
+            concurrency, ordered, buffer_size,
+        )
+
+    def route_many(
+            self,
+            requests: Iterable[Union[List[model.Point], Dict[str, Any]]],
+            concurrency: Optional[int] = None,
+            ordered: bool = False,
+            buffer_size: Optional[int] = None,
+            **kwargs,
+    ) -> AsyncIterator[Tuple[int, Union[model.OsrmRoute, Exception]]]:
+        """Run many OSRM Route requests with bounded concurrency.
+
+        Each request is either a list of coordinates or a dict of keyword
+        arguments of :meth:`route`. Keyword arguments given here are shared
+        by all requests. See :meth:`_run_many` for the semantics of the
+        results.
+
+        :param requests: Iterable of requests.
+        :keyword concurrency: Max in-flight requests, defaults to
+                              ``max_concurrency``.
+        :keyword ordered: Yield results in input order.
+        :keyword buffer_size: Max results buffered waiting for their turn
+                              when ordered, defaults to twice concurrency.
+
+        :return: Async iterator of (input index, result or exception).
+        """
+        return self._run_many(
+            self.route, 'coordinates', requests, kwargs,
+            concurrency, ordered, buffer_size,
+        )
+
+    def table_many(
+            self,
+            requests: Iterable[Union[List[model.Point], Dict[str, Any]]],
+            concurrency: Optional[int] = None,
+            ordered: bool = False,
+            buffer_size: Optional[int] = None,
+            **kwargs,
+    ) -> AsyncIterator[Tuple[int, Union[model.OsrmTable, Exception]]]:
+        """Run many OSRM Table requests with bounded concurrency.
+
+        Each request is either a list of coordinates or a dict of keyword
+        arguments of :meth:`table`. Keyword arguments given here are shared
+        by all requests. See :meth:`_run_many` for the semantics of the
+        results.
+
+        :param requests: Iterable of requests.
+        :keyword concurrency: Max in-flight requests, defaults to
+                              ``max_concurrency``.
+        :keyword ordered: Yield results in input order.
+        :keyword buffer_size: Max results buffered waiting for their turn
+                              when ordered, defaults to twice concurrency.
+
+        :return: Async iterator of (input index, result or exception).
+        """
+        return self._run_many(
+            self.table, 'coordinates', requests, kwargs,
+            concurrency, ordered, buffer_size,
+        )
+
+    async def _run_many(
+            self,
+            service: Callable[..., Awaitable],
+            positional: str,
+            requests: Iterable[Any],
+            shared: Dict[str, Any],
+            concurrency: Optional[int],
+            ordered: bool,
+            buffer_size: Optional[int],
+    ) -> AsyncIterator[Tuple[int, Any]]:
+        """Invoke service for each request with bounded concurrency.
+
+        Requests are consumed lazily from the iterable, so that at most
+        ``concurrency`` of them are in flight. Results are yielded as
+        ``(index, result)`` couples, in completion order or, if
+        ``ordered``, in input order holding at most ``buffer_size``
+        results that completed ahead of their turn. A failed request
+        yields its exception as result and does not stop the others.
+        Closing the iterator cancels the requests still in flight.
+        """
+        concurrency = concurrency or self.max_concurrency
+        buffer_size = buffer_size or 2 * concurrency
+
+        async def _call(index: int, request: Any) -> Tuple[int, Any]:
+            if not isinstance(request, dict):
+                request = {positional: request}
+            try:
+                return index, await service(**{**shared, **request})
+            except Exception as e:
+                return index, e
+
+        requests = enumerate(requests)
+        pending = set()
+        buffer = {}
+        next_index = 0
+        launched = 0
+        exhausted = False
+        try:
+            while True:
+                while (
+                        not exhausted and
+                        len(pending) < concurrency and
+                        (not ordered or launched < next_index + buffer_size)
+                ):
+                    request = next(requests, None)
+                    if request is None:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(_call(*request)))
+                    launched += 1
+                if not pending:
+                    return
+
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    index, result = task.result()
+                    if not ordered:
+                        yield index, result
+                        continue
+                    buffer[index] = result
+                while next_index in buffer:
+                    yield next_index, buffer.pop(next_index)
+                    next_index += 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _gather_bounded(
+            self,
+            aws: Iterable[Awaitable],
+    ) -> list:
+        """Await all in order, at most ``max_concurrency`` at a time.
+
+        On the first failure the pending awaitables are cancelled and the
+        exception is raised.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _bounded(aw: Awaitable):
+            async with semaphore:
+                return await aw
+
+        tasks = [asyncio.ensure_future(_bounded(aw)) for aw in aws]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    def _service_url(
             self,
             service: str,
             profile: str,
             coordinates: List[model.Point],
             **kwargs,
-    ) -> dict:
-        """Request to a OSRM service.
-        """
+    ) -> str:
+        """Full url of a request to a OSRM service."""
+        encode = (
+            self.polyline_threshold is not None and
+            len(coordinates) > self.polyline_threshold
+        )
         url = _build_osrm_url(
             service,
             self.api_version,
             profile if profile else self.default_profile,
             coordinates,
+            polyline_precision=self.polyline_precision if encode else None,
             **kwargs
         )
+        return urljoin(self.base_url, url)
+
+    async def _osrm_service(
+            self,
+            service: str,
+            profile: str,
+            coordinates: List[model.Point],
+            parser: Optional[_ResponseParser] = None,
+            **kwargs,
+    ) -> Any:
+        """Request to a OSRM service.
+
+        The response is decoded and built by ``parser``, as a dict if
+        not given.
+        """
+        full_url = self._service_url(service, profile, coordinates, **kwargs)
+        parser = parser or self._parser()
+        event = None
+        if self.on_request is not None:
+            event = RequestEvent(service, full_url, len(coordinates))
+        if not self.coalesce:
+            return await self._request(full_url, parser, event)
+
+        key = (_cache_key(full_url), parser.key)
+        request = self._inflight.get(key)
+        if request is None:
+            request = asyncio.ensure_future(
+                self._request(full_url, parser, event),
+            )
+            self._inflight[key] = request
+            request.add_done_callback(
+                lambda done: self._request_done(key, done)
+            )
+        # a cancelled waiter must not cancel the request of the others
+        return await asyncio.shield(request)
+
+    def _request_done(self, key: Tuple, request: asyncio.Future) -> None:
+        """Forget a completed coalesced request."""
+        self._inflight.pop(key, None)
+        if not request.cancelled():
+            # mark the exception as retrieved even if all waiters are gone
+            request.exception()
+
+    async def _request(
+            self,
+            full_url: str,
+            parser: _ResponseParser,
+            event: Optional[RequestEvent] = None,
+    ) -> Any:
+        """Request the url through the cache, if any.
+
+        With ``event`` the request is timed and reported to the hook.
+        """
+        try:
+            key = _cache_key(full_url) if self.cache is not None else None
+            raw = self.cache.get(key) if key is not None else None
+            if raw is not None:
+                if event is not None:
+                    event.cached = True
+                if self.recorder is not None:
+                    self.recorder.record(full_url, 200, raw)
+                res = await self._parse(parser, 200, raw, event)
+            else:
+                status, raw = await self._fetch(full_url, event)
+                res = await self._parse(parser, status, raw, event)
+                if key is not None:
+                    self.cache.set(key, raw)
+        except Exception as e:
+            if event is not None:
+                event.done(e)
+                self.on_request(event)
+            raise
+        if event is not None:
+            event.done()
+            self.on_request(event)
+        return res
+
+    def _parser(
+            self,
+            result: Optional[Callable[..., Any]] = None,
+            **kwargs,
+    ) -> _ResponseParser:
+        """Parser of responses into ``result``, built with ``kwargs``."""
+        return _ResponseParser(self.json_loads, result, **kwargs)
+
+    async def _parse(
+            self,
+            parser: _ResponseParser,
+            status: int,
+            raw: bytes,
+            event: Optional[RequestEvent] = None,
+    ) -> Any:
+        """Parse a raw response, on the parse executor if any."""
+        if event is None:
+            parse = parser
+        else:
+            event.status = status
+            event.response_bytes = len(raw)
+            parse = parser.timed
+        if self.parse_executor is None:
+            res = parse(status, raw)
+        else:
+            res = await asyncio.get_running_loop().run_in_executor(
+                self.parse_executor, parse, status, raw,
+            )
+        if event is None:
+            return res
+        res, event.timings['decode'], event.timings['build'] = res
+        return res
+
+    async def _build(
+            self,
+            result: Callable[..., Any],
+            data: dict,
+            **kwargs,
+    ) -> Any:
+        """Build a result from decoded data, on the parse executor if any."""
+        build = functools.partial(result, **kwargs, **data)
+        if self.parse_executor is None:
+            return build()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.parse_executor, build,
+        )
+
+    async def _fetch(
+            self,
+            url: str,
+            event: Optional[RequestEvent] = None,
+            stream: Optional[
+                Callable[[aiohttp.ClientResponse], Awaitable[None]]
+            ] = None,
+    ) -> Tuple[int, bytes]:
+        """Get the url returning status code and raw body.
+
+        Transient failures are retried according to the retry policy. With
+        ``stream`` a successful response is passed to it instead of being
+        read: the request is not hedged, nor retried once streaming.
+        """
+        if self.replayer is not None:
+            return self.replayer.get(url)
+        streaming = False
+
+        async def _stream(res: aiohttp.ClientResponse) -> None:
+            nonlocal streaming
+            streaming = True
+            await stream(res)
+
+        attempt = 0
+        while True:
+            try:
+                if stream is None:
+                    status, raw = await self._fetch_hedged(url, event)
+                else:
+                    status, raw = await self._get(
+                        url, event, self._select(), _stream,
+                    )
+            except _TRANSIENT_ERRORS:
+                if (
+                        streaming or self.retry is None or
+                        not self.retry.retry(attempt)
+                ):
+                    raise
+            else:
+                if (
+                        self.retry is None or
+                        not self.retry.retry(attempt, status)
+                ):
+                    break
+            await asyncio.sleep(self.retry.delay(attempt))
+            attempt += 1
+        if self.recorder is not None and stream is None:
+            self.recorder.record(url, status, raw)
+        return status, raw
+
+    async def _fetch_hedged(
+            self,
+            url: str,
+            event: Optional[RequestEvent] = None,
+    ) -> Tuple[int, bytes]:
+        """Get the url, duplicating the request if slow to respond.
+
+        The duplicate goes to another server when balancing, and is not
+        sent if the circuits of all the servers are open.
+        """
+        delay = self.hedge.delay() if self.hedge is not None else None
+        backend = self._select()
+        if delay is None:
+            return await self._get(url, event, backend)
+
+        requests = {asyncio.ensure_future(self._get(url, event, backend))}
+        try:
+            done, _ = await asyncio.wait(requests, timeout=delay)
+            if not done:
+                try:
+                    other = self._select(exclude=backend)
+                except CircuitOpenError:
+                    # no server to hedge to, keep waiting for the first one
+                    pass
+                else:
+                    self.hedge.count_hedge()
+                    if event is not None:
+                        event.hedged = True
+                    requests.add(asyncio.ensure_future(
+                        self._get(url, backend=other),
+                    ))
+            while True:
+                done, _ = await asyncio.wait(
+                    requests, return_when=asyncio.FIRST_COMPLETED,
+                )
+                # the first reply wins, unless it failed and others remain
+                for request in done:
+                    if request.exception() is None:
+                        return request.result()
+                requests -= done
+                if not requests:
+                    return done.pop().result()
+        finally:
+            for request in requests:
+                request.cancel()
+
+    def _select(self, exclude: Optional[Backend] = None) -> Optional[Backend]:
+        """Server of the next request, None if not balancing.
+
+        Servers with an open circuit are skipped.
+
+        :raises CircuitOpenError: If the circuits of all servers are open.
+        """
+        if self.balancer is None:
+            return None
+        if self.breaker is None:
+            return self.balancer.select(exclude)
+        backend = self.balancer.select(exclude, self.breaker.available)
+        if backend is None:
+            raise CircuitOpenError('circuits of all the servers are open')
+        return backend
+
+    async def _get(
+            self,
+            url: str,
+            event: Optional[RequestEvent] = None,
+            backend: Optional[Backend] = None,
+            stream: Optional[
+                Callable[[aiohttp.ClientResponse], Awaitable[None]]
+            ] = None,
+    ) -> Tuple[int, bytes]:
+        """Send a single request, to ``backend`` if given.
+
+        The request fails fast if the circuit of the server is open, else
+        waits for the limiter if any. The selected backend, the circuit and
+        the limiter are released with the outcome of the request.
+        """
+        server = self.base_url
+        if backend is not None:
+            server = backend.url
+            url = server + url[len(self.base_url):]
+        generation = None
+        if self.breaker is not None:
+            generation = self.breaker.allow(server)
+            if generation is None:
+                if backend is not None:
+                    self.balancer.release(backend, None, None)
+                raise CircuitOpenError(f'circuit of {server} is open')
+        if self.limiter is not None:
+            try:
+                await self.limiter.acquire()
+            except asyncio.CancelledError:
+                # e.g. a hedge that lost while queued, never sent
+                if backend is not None:
+                    self.balancer.release(backend, None, None)
+                if self.breaker is not None:
+                    self.breaker.record(server, None, generation)
+                raise
+        start = time.perf_counter()
+        ok = None
+        overload = False
+        try:
+            status, raw = await self._send(url, event, stream)
+            ok = status < 500
+            overload = not ok or (status == 400 and b'TooBig' in raw)
+        except asyncio.CancelledError:
+            # a hedged request that lost, it would have taken longer
+            if self.hedge is not None:
+                self.hedge.observe(time.perf_counter() - start)
+            raise
+        except Exception as e:
+            ok = False
+            overload = isinstance(e, _TRANSIENT_ERRORS)
+            raise
+        finally:
+            latency = time.perf_counter() - start
+            if backend is not None:
+                self.balancer.release(backend, latency, ok)
+            if self.breaker is not None:
+                self.breaker.record(server, ok, generation)
+            if self.limiter is not None:
+                self.limiter.release(
+                    latency if ok or overload else None, overload,
+                )
+        # streams take longer, not to be hedged like other requests
+        if self.hedge is not None and ok and stream is None:
+            self.hedge.observe(time.perf_counter() - start)
+        return status, raw
+
+    async def _send(
+            self,
+            url: str,
+            event: Optional[RequestEvent] = None,
+            stream: Optional[
+                Callable[[aiohttp.ClientResponse], Awaitable[None]]
+            ] = None,
+    ) -> Tuple[int, bytes]:
+        """Send a request on the session.
+
+        With ``stream`` a successful response is passed to it, the body
+        returned being empty.
+        """
+        if event is None and stream is None:
+            async with self._session.get(url) as res:
+                return res.status, await res.read()
+        if event is not None:
+            event.attempts += 1
+            if event.backend is None:
+                event.backend = url
+            event.mark('request_start')
+        async with self._session.get(url, trace_request_ctx=event) as res:
+            if event is not None:
+                event.mark('headers')
+            status = res.status
+            if stream is not None and 200 <= status < 300:
+                await stream(res)
+                raw = b''
+            else:
+                raw = await res.read()
+            if event is not None:
+                event.mark('body')
+        return status, raw
+
+
+# transport failures worth retrying
+_TRANSIENT_ERRORS = (
+    aiohttp.ClientConnectionError,
+    aiohttp.ClientPayloadError,
+    asyncio.TimeoutError,
+)
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    """Trace config marking the transport phases of instrumented requests."""
+    def _mark(name: str) -> Callable[..., Awaitable[None]]:
+        async def _on_signal(session, context, params) -> None:
+            event = context.trace_request_ctx
+            if event is not None:
+                event.mark(name)
+        return _on_signal
 
-        async with self._session.get(url) as res:
-            body = await res.json()
-            _check_response(res.status, body)
-            return body
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_queued_start.append(_mark('queue_start'))
+    trace.on_connection_queued_end.append(_mark('queue_end'))
+    trace.on_dns_resolvehost_start.append(_mark('dns_start'))
+    trace.on_dns_resolvehost_end.append(_mark('dns_end'))
+    trace.on_connection_create_start.append(_mark('connect_start'))
+    trace.on_connection_create_end.append(_mark('connect_end'))
+    return trace
@@ -1,10 +1,42 @@
-from typing import List, Optional
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import (
+    Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple,
+    Union,
+)
 from urllib.parse import urljoin
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from . import model
-from .utils import _build_osrm_url, _check_response
+from .balancing import Backend, Balancer
+from .cache import Cache
+from .instrumentation import RequestEvent
+from .replay import Recorder, Replayer
+from .resilience import (
+    CircuitBreaker, CircuitOpenError, HedgePolicy, RetryPolicy,
+)
+from .streaming import TableParser
+from .utils import (
+    _ResponseParser,
+    _build_osrm_url,
+    _cache_key,
+    _collapse_table,
+    _decode_response,
+    _dedupe_coordinates,
+    _default_json_loads,
+    _expand_table,
+    _match_windows,
+    _merge_match_windows,
+    _merge_table_tiles,
+    _table_params,
+    _table_tiles,
+)
 
 
 class OsrmClient():
@@ -16,29 +48,139 @@ class OsrmClient():
 
     def __init__(
             self,
-            base_url: str = 'https://router.project-osrm.org',
+            base_url: Union[str, Sequence[str]] = (
+                'https://router.project-osrm.org'
+            ),
             api_version: str = 'v1',
             default_profile: str = 'driving',
+            max_workers: int = 8,
+            pool_size: Optional[int] = None,
+            tcp_nodelay: bool = True,
+            session: Optional[requests.Session] = None,
+            cache: Optional[Cache] = None,
+            lazy: bool = False,
+            json_loads: Optional[Callable[[bytes], Any]] = None,
+            recorder: Optional[Recorder] = None,
+            replayer: Optional[Replayer] = None,
+            on_request: Optional[Callable[[RequestEvent], None]] = None,
+            retry: Optional[RetryPolicy] = None,
+            hedge: Optional[HedgePolicy] = None,
+            balancer: Optional[Balancer] = None,
+            breaker: Optional[CircuitBreaker] = None,
+            polyline_threshold: Optional[int] = 100,
+            polyline_precision: int = 6,
     ) -> None:
         """Construct instance of OSRM client.
 
-        :keyword str base_url: Base url of the OSRM server.
+        :keyword base_url: Base url of the OSRM server, or list of base
+                           urls of many servers to balance the requests
+                           over, see :mod:`osrm.balancing`.
         :keyword str api_version: Api version of OSRM server.
         :keyword str default_profile: Default profile to use.
+        :keyword int max_workers: Threads used for concurrent requests.
+        :keyword int pool_size: Max connections kept alive per host,
+                                defaults to the greater of 10 and
+                                ``max_workers``.
+        :keyword bool tcp_nodelay: Set TCP_NODELAY on connections.
+        :keyword session: Existing session to use, e.g. shared by many
+                          clients. It is not closed by the client and
+                          pool options do not apply to it.
+        :keyword cache: Cache of the responses, see :mod:`osrm.cache`.
+        :keyword bool lazy: Build nested route structures (legs, steps,
+                            intersections, annotations) on first access.
+        :keyword json_loads: Function decoding the raw JSON body, defaults
+                             to orjson if installed else the json module.
+        :keyword recorder: Record every response, cache hits included,
+                           see :mod:`osrm.replay`.
+        :keyword replayer: Serve the responses from a record instead of
+                           the server, see :mod:`osrm.replay`.
+        :keyword on_request: Called with the timings of each request, see
+                             :mod:`osrm.instrumentation`.
+        :keyword retry: Retry policy of transient failures, see
+                        :mod:`osrm.resilience`.
+        :keyword hedge: Hedging policy of slow requests, hedged on the
+                        thread pool, see :mod:`osrm.resilience`.
+        :keyword balancer: Balancer of the requests over many servers,
+                           instead of ``base_url``, e.g. to configure it
+                           or share it between clients.
+        :keyword breaker: Circuit breaker of the servers, failing fast or
+                          failing over while a server is down, see
+                          :mod:`osrm.resilience`.
+        :keyword polyline_threshold: Coordinates above which they are sent
+                                     polyline encoded, for much shorter
+                                     urls, None to always send them as
+                                     text.
+        :keyword int polyline_precision: Decimal digits of the encoded
+                                         coordinates, 6 (``polyline6``,
+                                         about 0.1 m) or 5 (``polyline``).
         """
-        self.base_url = base_url
+        if balancer is None and not isinstance(base_url, str):
+            balancer = Balancer(base_url)
+        self.balancer = balancer
+        # with many servers, urls are built on the first one and rebased on
+        # the server of each request
+        self.base_url = (
+            balancer.backends[0].url if balancer is not None else base_url
+        )
         self.api_version = api_version
         self.default_profile = default_profile
+        self.max_workers = max_workers
+        self.pool_size = pool_size or max(10, max_workers)
+        self.tcp_nodelay = tcp_nodelay
+        self.session = session
+        self.cache = cache
+        self.lazy = lazy
+        self.json_loads = json_loads or _default_json_loads()
+        self.recorder = recorder
+        self.replayer = replayer
+        self.on_request = on_request
+        self.retry = retry
+        self.hedge = hedge
+        self.breaker = breaker
+        if polyline_precision not in (5, 6):
+            raise ValueError('polyline precision must be 5 or 6')
+        self.polyline_threshold = polyline_threshold
+        self.polyline_precision = polyline_precision
+        self._lock = threading.Lock()
+        self._entered = 0
+        self._local = threading.local()
 
     def __enter__(self):
-        """Initialize client opening the underlying http session."""
-        session = requests.Session()
-        self._session = session.__enter__()
+        """Initialize client opening the underlying http session.
+
+        The client may be entered by many threads at once: the session and
+        the thread pool are shared and closed when the last one exits.
+        """
+        with self._lock:
+            self._entered += 1
+            if self._entered > 1:
+                return self
+            if self.session is not None:
+                self._session = self.session
+            else:
+                session = requests.Session()
+                adapter = _PoolAdapter(
+                    pool_maxsize=self.pool_size,
+                    tcp_nodelay=self.tcp_nodelay,
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session.__enter__()
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=self._init_worker,
+            )
         return self
 
     def __exit__(self, *args, **kwargs):
         """Finalize the client closing the underlying http session."""
-        self._session.__exit__(*args, **kwargs)
+        with self._lock:
+            self._entered -= 1
+            if self._entered > 0:
+                return
+            self._executor.shutdown()
+            if self._session is not self.session:
+                self._session.__exit__(*args, **kwargs)
 
     def nearest(
             self,
@@ -67,11 +209,58 @@ class OsrmClient():
         ):
             raise Exception('provide only one coordinate tuple (lon, lat)')
 
-        osrm_res = self._osrm_service(
+        return self._osrm_service(
             'nearest', profile, [coordinate],
+            parser=self._parser(model.OsrmNearest),
             number=number,
         )
-        return model.OsrmNearest(**osrm_res)
+
+    def snap(
+            self,
+            coordinates: Iterable[model.Point],
+            profile: Optional[str] = None,
+            precision: Optional[int] = 5,
+    ) -> model.OsrmSnap:
+        """Snap many coordinates to the street network.
+
+        Coordinates are rounded to ``precision`` decimal digits (5 digits
+        are about 1 meter) and each unique cell is snapped once with the
+        Nearest service, concurrently on the client thread pool. The
+        nearest waypoint of each cell is fanned back out to the input
+        coordinates falling in it.
+
+        :param coordinates: Coordinates to snap.
+        :keyword profile: OSRM Profile, defaults to client default.
+        :keyword precision: Decimal digits coordinates are rounded to,
+                            None to collapse only exact duplicates.
+
+        :return: Waypoints aligned to the coordinates and dedup stats.
+        :rtype: ~model.OsrmSnap
+        """
+        unique, inverse = _dedupe_coordinates(coordinates, precision)
+
+        def _snap_cell(cell: model.Point):
+            try:
+                return self.nearest(
+                    (float(cell[0]), float(cell[1])), profile=profile,
+                )
+            except Exception as e:
+                return e
+
+        waypoints = []
+        errors = {}
+        for cell, res in zip(unique, self._map(_snap_cell, unique)):
+            if isinstance(res, Exception):
+                errors[cell] = res
+                waypoints.append(None)
+            else:
+                waypoints.append(res.waypoints[0] if res.waypoints else None)
+
+        return model.OsrmSnap(
+            waypoints=[waypoints[i] for i in inverse],
+            unique=len(unique),
+            errors=errors,
+        )
 
     def route(
             self,
@@ -102,8 +291,9 @@ class OsrmClient():
         :return: Route computed by OSRM.
         :rtype: ~model.OsrmRoute
         """
-        osrm_res = self._osrm_service(
+        return self._osrm_service(
             'route', profile, coordinates,
+            parser=self._parser(model.OsrmRoute, lazy=self.lazy),
             alternatives=alternatives,
             steps=steps,
             geometries=geometries,
@@ -111,7 +301,6 @@ class OsrmClient():
             annotations=annotations,
             continue_straight=continue_straight,
         )
-        return model.OsrmRoute(**osrm_res)
 
     def table(
             self,
@@ -120,12 +309,27 @@ class OsrmClient():
             sources: List[int] = [],
             destinations: List[int] = [],
             annotations: List[str] = [],
+            max_table_size: Optional[int] = None,
+            dtype: Optional[str] = None,
+            dedupe: bool = False,
+            dedupe_precision: Optional[int] = None,
     ) -> model.OsrmTable:
         """OSRM Table service.
 
         Computes the duration and/or distance of the fastest route between all pairs
         of supplied coordinates.
 
+        When ``max_table_size`` is given and the coordinates exceed it, the
+        table is split in tiles of sources and destinations that fit the
+        server limit. Tiles are requested concurrently on the client thread
+        pool and stitched back into a single table.
+
+        With ``dedupe`` duplicate coordinates are requested only once and
+        the result is expanded back, so that the table is identical to the
+        one of the full request. This only holds for exact duplicates:
+        near-duplicates collapsed with ``dedupe_precision`` take the values
+        of the first of them, which may differ from their own.
+
         See https://project-osrm.org/docs/v5.24.0/api/#table-service
 
         :param coordinates: List of coordinates.
@@ -133,21 +337,158 @@ class OsrmClient():
         :keyword sources: Use location with given index as source.
         :keyword destinations: Use location with given index as destination.
         :keyword annotations: Return the requested table or tables in response.
+        :keyword max_table_size: Max coordinates accepted by the server
+                                 (``--max-table-size``), enables tiling.
+        :keyword dtype: Return matrices as numpy arrays of this dtype
+                        (e.g. ``float64``, ``float32``), NaN if unreachable.
+        :keyword dedupe: Collapse duplicate coordinates before the request
+                         and expand the result back to the input shape.
+        :keyword dedupe_precision: Decimal digits used to compare
+                                   coordinates when collapsing, None for
+                                   exact duplicates only.
 
         :return: Duration and/or distance table computed by OSRM.
         :rtype: ~model.OsrmTable
         """
-        sources_str = ";".join(sources) if sources else "all"
-        destinations_str = ";".join(destinations) if destinations else "all"
-        annotations_str = ",".join(annotations) if annotations else "duration"
+        if dedupe:
+            unique, unique_sources, unique_destinations, rows, cols = (
+                _collapse_table(
+                    coordinates, sources, destinations, dedupe_precision,
+                )
+            )
+            table = self.table(
+                unique, profile,
+                sources=unique_sources,
+                destinations=unique_destinations,
+                annotations=annotations,
+                max_table_size=max_table_size,
+                dtype=dtype,
+            )
+            return _expand_table(table, rows, cols)
+
+        if max_table_size and len(coordinates) > max_table_size:
+            return self._table_tiled(
+                coordinates, profile, sources, destinations, annotations,
+                max_table_size, dtype,
+            )
+
+        return self._osrm_service(
+            'table', profile, coordinates,
+            parser=self._parser(model.OsrmTable, dtype=dtype),
+            **_table_params(sources, destinations, annotations),
+        )
+
+    def _table_tiled(
+            self,
+            coordinates: List[model.Point],
+            profile: Optional[str],
+            sources: List[int],
+            destinations: List[int],
+            annotations: List[str],
+            max_table_size: int,
+            dtype: Optional[str] = None,
+    ) -> model.OsrmTable:
+        """Table service split in tiles requested concurrently."""
+        tiles = _table_tiles(
+            coordinates, sources, destinations, max_table_size,
+        )
+
+        def _request_tile(tile: dict) -> dict:
+            return self._osrm_service(
+                'table', profile, tile['coordinates'],
+                sources=";".join(map(str, tile['sources'])),
+                destinations=";".join(map(str, tile['destinations'])),
+                annotations=(
+                    ",".join(annotations) if annotations else "duration"
+                ),
+            )
+
+        results = list(self._map(_request_tile, tiles))
+        osrm_res = _merge_table_tiles(
+            tiles, results,
+            len(sources) if sources else len(coordinates),
+            len(destinations) if destinations else len(coordinates),
+            dtype,
+        )
+        return model.OsrmTable(dtype=dtype, **osrm_res)
+
+    def stream_table(
+            self,
+            coordinates: List[model.Point],
+            profile: Optional[str] = None,
+            sources: List[int] = [],
+            destinations: List[int] = [],
+            annotations: List[str] = [],
+            dtype: Optional[str] = 'float64',
+            on_row: Optional[Callable[[str, int, Any], None]] = None,
+            chunk_size: int = 64 * 1024,
+    ) -> model.OsrmTable:
+        """OSRM Table service parsing the response while it is received.
 
-        osrm_res = self._osrm_service(
+        Rows of the ``durations`` and ``distances`` matrices are written
+        into preallocated arrays, or passed to ``on_row`` as soon as they
+        are received, without buffering the whole response: peak memory
+        stays close to the size of the matrices. Meant for very large
+        tables, the response is not cached and the request is not tiled.
+        The request goes through the balancer, the circuit breaker, the
+        retry policy and ``on_request`` as the others, but it is not hedged
+        nor retried once rows were received.
+
+        See https://project-osrm.org/docs/v5.24.0/api/#table-service
+
+        :param coordinates: List of coordinates.
+        :keyword profile: OSRM Profile, defaults to client default.
+        :keyword sources: Use location with given index as source.
+        :keyword destinations: Use location with given index as destination.
+        :keyword annotations: Return the requested table or tables in response.
+        :keyword dtype: Numpy dtype of the rows, None for lists.
+        :keyword on_row: Called with the matrix name (``durations`` or
+                         ``distances``), the row index and the row. Rows
+                         passed to it are not kept in the result.
+        :keyword chunk_size: Bytes read from the response at once.
+
+        :return: Table computed by OSRM, without matrices if ``on_row``.
+        :rtype: ~model.OsrmTable
+        """
+        full_url = self._service_url(
             'table', profile, coordinates,
-            sources=sources_str,
-            destinations=destinations_str,
-            annotations=annotations_str,
+            **_table_params(sources, destinations, annotations),
+        )
+        parser = TableParser(
+            (
+                len(sources) if sources else len(coordinates),
+                len(destinations) if destinations else len(coordinates),
+            ),
+            self.json_loads, dtype=dtype, on_row=on_row,
         )
-        return model.OsrmTable(**osrm_res)
+
+        def _stream(res: requests.Response) -> None:
+            for chunk in res.iter_content(chunk_size):
+                parser.feed(chunk)
+
+        # records hold whole bodies
+        whole = self.replayer is not None or self.recorder is not None
+        event = None
+        if self.on_request is not None:
+            event = RequestEvent('table', full_url, len(coordinates))
+        try:
+            status, raw = self._fetch(
+                full_url, event, stream=None if whole else _stream,
+            )
+            if not 200 <= status < 300:
+                _decode_response(status, raw, self.json_loads)
+            if whole:
+                parser.feed(raw)
+            res = model.OsrmTable(dtype=dtype, **parser.close())
+        except Exception as e:
+            if event is not None:
+                event.done(e)
+                self.on_request(event)
+            raise
+        if event is not None:
+            event.done()
+            self.on_request(event)
+        return res
 
     def match(
             self,
@@ -159,6 +500,8 @@ class OsrmClient():
             overview: str = 'simplified',
             timestamps: List[int] = [],
             radiuses: List[float] = [],
+            max_matching_size: Optional[int] = None,
+            window_overlap: int = 10,
     ) -> model.OsrmMatch:
         """OSRM Match service.
 
@@ -169,6 +512,16 @@ class OsrmClient():
         found. The algorithm might not be able to match all points. Outliers
         are removed if they can not be matched successfully.
 
+        When ``max_matching_size`` is given and the trace exceeds it, the
+        trace is split in windows overlapping by ``window_overlap`` points,
+        requested concurrently on the client thread pool.
+        Results are stitched keeping each tracepoint from a single window:
+        matchings are trimmed to the legs of their tracepoints and joined
+        across windows, so that a continuous trace gives a single matching.
+        Matchings cannot be joined without overlap. Windows are requested
+        with the full overview, to cut it at the waypoints, so that a
+        simplified overview is returned full.
+
         See https://project-osrm.org/docs/v5.24.0/api/#match-service
 
         :param coordinates: List of coordinates.
@@ -179,12 +532,28 @@ class OsrmClient():
         :keyword overview: Add overview geometry
         :keyword timestamps: UNIX Timestamps (seconds) for the input locations.
         :keyword radiuses: Stddev of GPS precision used for map matching.
+        :keyword max_matching_size: Max coordinates accepted by the server
+                                    (``--max-matching-size``), enables
+                                    windowed matching.
+        :keyword window_overlap: Coordinates shared by adjacent windows.
 
         :return: Match computed by OSRM.
         :rtype: ~model.OsrmMatch
         """
-        osrm_res = self._osrm_service(
+        if max_matching_size and len(coordinates) > max_matching_size:
+            return self._match_windowed(
+                coordinates, profile, timestamps, radiuses,
+                max_matching_size, window_overlap,
+                steps=steps,
+                geometries=geometries,
+                annotations=annotations,
+                # waypoints are vertices of the full geometry only
+                overview='full' if overview == 'simplified' else overview,
+            )
+
+        return self._osrm_service(
             'match', profile, coordinates,
+            parser=self._parser(model.OsrmMatch, lazy=self.lazy),
             steps=steps,
             geometries=geometries,
             annotations=annotations,
@@ -192,7 +561,36 @@ class OsrmClient():
             timestamps=timestamps,
             radiuses=radiuses,
         )
-        return model.OsrmMatch(**osrm_res)
+
+    def _match_windowed(
+            self,
+            coordinates: List[model.Point],
+            profile: Optional[str],
+            timestamps: List[int],
+            radiuses: List[float],
+            max_matching_size: int,
+            window_overlap: int,
+            **kwargs,
+    ) -> model.OsrmMatch:
+        """Match service split in windows requested concurrently."""
+        windows = _match_windows(
+            len(coordinates), max_matching_size, window_overlap,
+        )
+
+        def _request_window(window: Tuple[int, int, int, int]) -> dict:
+            start, end, _, _ = window
+            return self._osrm_service(
+                'match', profile, coordinates[start:end],
+                timestamps=timestamps[start:end],
+                radiuses=radiuses[start:end],
+                **kwargs,
+            )
+
+        results = list(self._map(_request_window, windows))
+        osrm_res = _merge_match_windows(
+            windows, results, len(coordinates), kwargs['geometries'],
+        )
+        return model.OsrmMatch(lazy=self.lazy, **osrm_res)
 
     def trip(
             self,
@@ -231,8 +629,9 @@ class OsrmClient():
         :returns: Trip calculated by OSRM.
         :rtype: ~model.OsrmTrip
         """
-        osrm_res = self._osrm_service(
+        return self._osrm_service(
             'trip', profile, coordinates,
+            parser=self._parser(model.OsrmTrip, lazy=self.lazy),
             steps=steps,
             geometries=geometries,
             overview=overview,
@@ -240,7 +639,6 @@ class OsrmClient():
             source=source,
             destination=destination,
         )
-        return model.OsrmTrip(**osrm_res)
 
     def tile(
             self,
@@ -274,25 +672,435 @@ class OsrmClient():
         osrm_res = self._get(url)
         return model.OsrmTile(**osrm_res)
 
-    def _osrm_service(
+    def map_route(
+            self,
+            requests: Iterable[Union[List[model.Point], Dict[str, Any]]],
+            **kwargs,
+    ) -> 'BatchResults':
+        """Run many OSRM Route requests on the client thread pool.
+
+        Each request is either a list of coordinates or a dict of keyword
+        arguments of :meth:`route`. Keyword arguments given here are shared
+        by all requests. See :class:`BatchResults` for the semantics of the
+        results.
+
+        :param requests: Iterable of requests.
+
+        :return: Iterator of results or exceptions, in input order.
+        :rtype: BatchResults
+        """
+        return self._map_service(self.route, 'coordinates', requests, kwargs)
+
+    def map_table(
+            self,
+            requests: Iterable[Union[List[model.Point], Dict[str, Any]]],
+            **kwargs,
+    ) -> 'BatchResults':
+        """Run many OSRM Table requests on the client thread pool.
+
+        Each request is either a list of coordinates or a dict of keyword
+        arguments of :meth:`table`. Keyword arguments given here are shared
+        by all requests. See :class:`BatchResults` for the semantics of the
+        results.
+
+        :param requests: Iterable of requests.
+
+        :return: Iterator of results or exceptions, in input order.
+        :rtype: BatchResults
+        """
+        return self._map_service(self.table, 'coordinates', requests, kwargs)
+
+    def _map_service(
+            self,
+            service: Callable[..., Any],
+            positional: str,
+            requests: Iterable[Any],
+            shared: Dict[str, Any],
+    ) -> 'BatchResults':
+        """Invoke service for each request on the thread pool."""
+        def _call(request: Any) -> Any:
+            if not isinstance(request, dict):
+                request = {positional: request}
+            try:
+                return service(**{**shared, **request})
+            except Exception as e:
+                return e
+
+        return BatchResults(self._map(_call, requests))
+
+    def _init_worker(self) -> None:
+        self._local.worker = True
+
+    def _map(
+            self,
+            fn: Callable[[Any], Any],
+            items: Iterable[Any],
+    ) -> Iterator[Any]:
+        """Map on the thread pool yielding results in order.
+
+        Unlike ``Executor.map`` items are submitted lazily, keeping at
+        most twice ``max_workers`` of them pending. Called from a thread of
+        the pool, e.g. a tiled table of a batch, items are mapped inline
+        since waiting on the pool from it could deadlock.
+        """
+        if getattr(self._local, 'worker', False):
+            yield from map(fn, items)
+            return
+        pending = deque()
+        for item in items:
+            if len(pending) >= 2 * self.max_workers:
+                yield pending.popleft().result()
+            pending.append(self._executor.submit(fn, item))
+        while pending:
+            yield pending.popleft().result()
+
+    def _service_url(
             self,
             service: str,
             profile: str,
             coordinates: List[model.Point],
             **kwargs,
-    ) -> dict:
-        """Request to a OSRM service.
-        """
+    ) -> str:
+        """Full url of a request to a OSRM service."""
+        encode = (
+            self.polyline_threshold is not None and
+            len(coordinates) > self.polyline_threshold
+        )
         url = _build_osrm_url(
             service,
             self.api_version,
             profile if profile else self.default_profile,
             coordinates,
+            polyline_precision=self.polyline_precision if encode else None,
             **kwargs
         )
-        full_url = urljoin(self.base_url, url)
+        return urljoin(self.base_url, url)
+
+    def _osrm_service(
+            self,
+            service: str,
+            profile: str,
+            coordinates: List[model.Point],
+            parser: Optional[_ResponseParser] = None,
+            **kwargs,
+    ) -> Any:
+        """Request to a OSRM service.
+
+        The response is decoded and built by ``parser``, as a dict if
+        not given.
+        """
+        full_url = self._service_url(service, profile, coordinates, **kwargs)
+        parser = parser or self._parser()
+        if self.on_request is None:
+            return self._request(full_url, parser)
+
+        event = RequestEvent(service, full_url, len(coordinates))
+        try:
+            res = self._request(full_url, parser, event)
+        except Exception as e:
+            event.done(e)
+            self.on_request(event)
+            raise
+        event.done()
+        self.on_request(event)
+        return res
+
+    def _request(
+            self,
+            full_url: str,
+            parser: _ResponseParser,
+            event: Optional[RequestEvent] = None,
+    ) -> Any:
+        """Request the url through the cache, if any."""
+        key = _cache_key(full_url) if self.cache is not None else None
+        if key is not None:
+            raw = self.cache.get(key)
+            if raw is not None:
+                if event is not None:
+                    event.cached = True
+                if self.recorder is not None:
+                    self.recorder.record(full_url, 200, raw)
+                return self._parse(parser, 200, raw, event)
+
+        status, raw = self._fetch(full_url, event)
+        res = self._parse(parser, status, raw, event)
+        if key is not None:
+            self.cache.set(key, raw)
+        return res
+
+    def _parser(
+            self,
+            result: Optional[Callable[..., Any]] = None,
+            **kwargs,
+    ) -> _ResponseParser:
+        """Parser of responses into ``result``, built with ``kwargs``."""
+        return _ResponseParser(self.json_loads, result, **kwargs)
+
+    def _parse(
+            self,
+            parser: _ResponseParser,
+            status: int,
+            raw: bytes,
+            event: Optional[RequestEvent] = None,
+    ) -> Any:
+        """Parse a raw response, timing it if instrumented."""
+        if event is None:
+            return parser(status, raw)
+        event.status = status
+        event.response_bytes = len(raw)
+        res, event.timings['decode'], event.timings['build'] = (
+            parser.timed(status, raw)
+        )
+        return res
+
+    def _fetch(
+            self,
+            url: str,
+            event: Optional[RequestEvent] = None,
+            stream: Optional[Callable[[requests.Response], None]] = None,
+    ) -> Tuple[int, bytes]:
+        """Get the url returning status code and raw body.
+
+        Transient failures are retried according to the retry policy. With
+        ``stream`` a successful response is passed to it instead of being
+        read: the request is not hedged, nor retried once streaming.
+        """
+        if self.replayer is not None:
+            return self.replayer.get(url)
+        streaming = False
+
+        def _stream(res: requests.Response) -> None:
+            nonlocal streaming
+            streaming = True
+            stream(res)
+
+        attempt = 0
+        while True:
+            try:
+                if stream is None:
+                    status, raw = self._fetch_hedged(url, event)
+                else:
+                    status, raw = self._get(
+                        url, event, self._select(), _stream,
+                    )
+            except _TRANSIENT_ERRORS:
+                if (
+                        streaming or self.retry is None or
+                        not self.retry.retry(attempt)
+                ):
+                    raise
+            else:
+                if (
+                        self.retry is None or
+                        not self.retry.retry(attempt, status)
+                ):
+                    break
+            time.sleep(self.retry.delay(attempt))
+            attempt += 1
+        if self.recorder is not None and stream is None:
+            self.recorder.record(url, status, raw)
+        return status, raw
+
+    def _fetch_hedged(
+            self,
+            url: str,
+            event: Optional[RequestEvent] = None,
+    ) -> Tuple[int, bytes]:
+        """Get the url, duplicating the request if slow to respond.
+
+        Requests are hedged on the thread pool, except when called from
+        it. The slower request is not interrupted but its result dropped.
+        The duplicate goes to another server when balancing, and is not
+        sent if the circuits of all the servers are open.
+        """
+        delay = self.hedge.delay() if self.hedge is not None else None
+        if delay is None or getattr(self._local, 'worker', False):
+            return self._get(url, event, self._select())
+
+        backend = self._select()
+        first = self._executor.submit(self._get, url, event, backend)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        try:
+            other = self._select(exclude=backend)
+        except CircuitOpenError:
+            # no server to hedge to, keep waiting for the first one
+            return first.result()
+        self.hedge.count_hedge()
+        if event is not None:
+            event.hedged = True
+        requests = [first, self._executor.submit(self._get, url, None, other)]
+        error = None
+        # the first reply wins, unless it failed and others remain
+        for request in as_completed(requests):
+            if request.exception() is None:
+                return request.result()
+            error = request.exception()
+        raise error
+
+    def _select(self, exclude: Optional[Backend] = None) -> Optional[Backend]:
+        """Server of the next request, None if not balancing.
+
+        Servers with an open circuit are skipped.
+
+        :raises CircuitOpenError: If the circuits of all servers are open.
+        """
+        if self.balancer is None:
+            return None
+        if self.breaker is None:
+            return self.balancer.select(exclude)
+        backend = self.balancer.select(exclude, self.breaker.available)
+        if backend is None:
+            raise CircuitOpenError('circuits of all the servers are open')
+        return backend
+
+    def _get(
+            self,
+            url: str,
+            event: Optional[RequestEvent] = None,
+            backend: Optional[Backend] = None,
+            stream: Optional[Callable[[requests.Response], None]] = None,
+    ) -> Tuple[int, bytes]:
+        """Send a single request, to ``backend`` if given.
+
+        The request fails fast if the circuit of the server is open. The
+        selected backend and the circuit are released with the outcome of
+        the request.
+        """
+        server = self.base_url
+        if backend is not None:
+            server = backend.url
+            url = server + url[len(self.base_url):]
+        generation = None
+        if self.breaker is not None:
+            generation = self.breaker.allow(server)
+            if generation is None:
+                if backend is not None:
+                    self.balancer.release(backend, None, None)
+                raise CircuitOpenError(f'circuit of {server} is open')
+        start = time.perf_counter()
+        ok = False
+        try:
+            status, raw = self._send(url, event, stream)
+            ok = status < 500
+        finally:
+            if backend is not None:
+                self.balancer.release(
+                    backend, time.perf_counter() - start, ok,
+                )
+            if self.breaker is not None:
+                self.breaker.record(server, ok, generation)
+        # streams take longer, not to be hedged like other requests
+        if self.hedge is not None and ok and stream is None:
+            self.hedge.observe(time.perf_counter() - start)
+        return status, raw
+
+    def _send(
+            self,
+            url: str,
+            event: Optional[RequestEvent] = None,
+            stream: Optional[Callable[[requests.Response], None]] = None,
+    ) -> Tuple[int, bytes]:
+        """Send a request on the session.
+
+        With ``stream`` a successful response is passed to it, the body
+        returned being empty.
+        """
+        if event is None and stream is None:
+            with self._session.get(url) as res:
+                return res.status_code, res.content
+        if event is not None:
+            event.attempts += 1
+            if event.backend is None:
+                event.backend = url
+        with self._session.get(url, stream=True) as res:
+            download = time.perf_counter()
+            status = res.status_code
+            if stream is not None and 200 <= status < 300:
+                stream(res)
+                raw = b''
+            else:
+                raw = res.content
+            if event is not None:
+                event.timings.setdefault(
+                    'wait', res.elapsed.total_seconds(),
+                )
+                event.timings.setdefault(
+                    'download', time.perf_counter() - download,
+                )
+        return status, raw
+
+
+class BatchResults():
+    """Results of a batch run on the thread pool of :class:`OsrmClient`.
+
+    Iterating yields one result per request, in input order. A failed
+    request yields its exception as result and does not stop the others.
+    Requests are submitted lazily as results are consumed, so the
+    counters below grow while iterating.
+    """
+
+    def __init__(self, results: Iterator[Any]) -> None:
+        self._results = results
+        self.completed = 0
+        self.errors = 0
+        self.started = None
+        self.finished = None
+
+    def __iter__(self) -> 'BatchResults':
+        return self
+
+    def __next__(self) -> Any:
+        if self.started is None:
+            self.started = time.perf_counter()
+        try:
+            res = next(self._results)
+        except StopIteration:
+            if self.finished is None:
+                self.finished = time.perf_counter()
+            raise
+        self.completed += 1
+        if isinstance(res, Exception):
+            self.errors += 1
+        return res
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the first result was requested."""
+        if self.started is None:
+            return 0.0
+        end = self.finished or time.perf_counter()
+        return end - self.started
+
+    @property
+    def throughput(self) -> float:
+        """Completed requests per second."""
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed else 0.0
+
+
+# transport failures worth retrying
+_TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class _PoolAdapter(HTTPAdapter):
+    """Http adapter with configurable TCP_NODELAY on pooled connections."""
+
+    # pickled attributes, restored before the pool manager is rebuilt
+    __attrs__ = HTTPAdapter.__attrs__ + ['tcp_nodelay']
+
+    def __init__(self, tcp_nodelay: bool = True, **kwargs):
+        self.tcp_nodelay = tcp_nodelay
+        super().__init__(**kwargs)
 
-        with self._session.get(full_url) as res:
-            body = res.json()
-            _check_response(res.status_code, res.json())
-            return body
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = [
+            (socket.IPPROTO_TCP, socket.TCP_NODELAY, int(self.tcp_nodelay)),
+        ]
+        super().init_poolmanager(*args, **kwargs)
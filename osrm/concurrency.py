@@ -0,0 +1,147 @@
+"""Adaptive limit of the concurrent requests to OSRM.
+
+A fixed limit either wastes the capacity of the server or, set too high,
+has OSRM queue the requests and their latency explode. Give an
+:class:`AdaptiveLimiter` to the async client with ``limiter``: requests
+beyond the current limit wait in a queue, and the limit adapts to the
+observed responses:
+
+- additive increase by ``increase / limit`` per response, about one more
+  request per round trip, while the limit is in use.
+- multiplicative decrease by ``backoff`` on overload: 5xx responses,
+  ``TooBig`` responses, connection errors, or a latency above
+  ``tolerance`` times the minimum latency recently observed (requests
+  queueing on the server, as in TCP Vegas). The limit decreases at most
+  once per round trip.
+
+The current ``limit``, the requests ``in_flight`` and the ``queued`` ones
+can be read at any time as metrics.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Optional
+
+
+class AdaptiveLimiter():
+    """AIMD limit of the requests in flight, for a single event loop."""
+
+    def __init__(
+            self,
+            initial_limit: int = 8,
+            min_limit: int = 1,
+            max_limit: int = 256,
+            increase: float = 1.0,
+            backoff: float = 0.9,
+            tolerance: float = 2.0,
+            window: int = 100,
+    ) -> None:
+        """Construct the limiter.
+
+        :keyword int initial_limit: Limit before any response.
+        :keyword int min_limit: Lowest limit.
+        :keyword int max_limit: Highest limit.
+        :keyword float increase: Limit increase per round trip.
+        :keyword float backoff: Factor of the limit on overload.
+        :keyword float tolerance: Ratio of the latency to the minimum one
+                                  considered as overload.
+        :keyword int window: Responses after which the minimum latency is
+                             renewed, so that it follows the server.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.window = window
+        self.in_flight = 0
+        self.drops = 0
+        self.min_latency: Optional[float] = None
+        self._limit = float(initial_limit)
+        self._window_min = math.inf
+        self._samples = 0
+        self._decreased = -math.inf
+        self._waiters = deque()
+
+    def __repr__(self) -> str:
+        return (
+            f'<AdaptiveLimiter limit={self.limit} '
+            f'in_flight={self.in_flight} queued={self.queued}>'
+        )
+
+    @property
+    def limit(self) -> int:
+        """Current max requests in flight."""
+        return int(self._limit)
+
+    @property
+    def queued(self) -> int:
+        """Requests waiting for the limit."""
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        """Wait until a request can be sent, in arrival order."""
+        if not self._waiters and self.in_flight < self.limit:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if not waiter.cancelled():
+                # granted while being cancelled, hand the slot over
+                self.in_flight -= 1
+                self._wake()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(
+            self,
+            latency: Optional[float] = None,
+            dropped: bool = False,
+    ) -> None:
+        """Complete a request adapting the limit.
+
+        :keyword latency: Seconds the request took, None if unknown (e.g.
+                          cancelled request), not affecting the limit.
+        :keyword bool dropped: Whether the server was overloaded.
+        """
+        if latency is not None:
+            now = time.perf_counter()
+            if dropped or self._queueing(latency):
+                self.drops += dropped
+                # requests sent before the last decrease saw the old limit
+                if now - latency > self._decreased:
+                    self._decreased = now
+                    self._limit = max(
+                        self._limit * self.backoff, self.min_limit,
+                    )
+            elif self.in_flight >= self._limit / 2:
+                self._limit = min(
+                    self._limit + self.increase / self._limit,
+                    self.max_limit,
+                )
+        self.in_flight -= 1
+        self._wake()
+
+    def _queueing(self, latency: float) -> bool:
+        """Record the latency, whether it shows requests queueing."""
+        self._window_min = min(self._window_min, latency)
+        self._samples += 1
+        if self.min_latency is None or self._samples >= self.window:
+            self.min_latency = self._window_min
+            self._window_min = math.inf
+            self._samples = 0
+        else:
+            self.min_latency = min(self.min_latency, latency)
+        return latency > self.tolerance * self.min_latency
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
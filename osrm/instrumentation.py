@@ -0,0 +1,97 @@
+"""Per-request instrumentation of the clients.
+
+Give a hook to the clients with ``on_request``: it is called with a
+:class:`RequestEvent` after each request to a OSRM service completes,
+successfully or not. It runs inline and should be quick and not raise,
+e.g. recording metrics or tracing spans. Without hook no timing is
+taken.
+"""
+import time
+from typing import Dict, Optional
+
+# phases of a request, in order, when measured
+PHASES = ('queue', 'dns', 'connect', 'wait', 'download', 'decode', 'build')
+
+
+class RequestEvent():
+    """Timings and metadata of a request to a OSRM service.
+
+    ``timings`` maps the phases that took place to their seconds:
+
+    - ``queue``: waiting for a free connection of the pool (async only).
+    - ``dns``: resolving the host (async only).
+    - ``connect``: opening a new connection (async only).
+    - ``wait``: from sending the request to receiving the response
+      headers. For the sync client it also includes the connection.
+    - ``download``: reading the response body.
+    - ``decode``: decoding the JSON body.
+    - ``build``: building the result objects.
+
+    Responses from cache or replay have no network phases. ``total`` is
+    the whole duration of the request. With retries or hedging
+    ``attempts`` counts the requests sent to the server and the transport
+    phases are those of the first one.
+    """
+    __slots__ = (
+        'service', 'url', 'backend', 'coordinates', 'status',
+        'response_bytes',
+        'cached', 'attempts', 'hedged', 'error', 'timings', 'total',
+        '_start', '_marks',
+    )
+
+    def __init__(self, service: str, url: str, coordinates: int) -> None:
+        self.service = service
+        self.url = url
+        # url actually requested to the server, when balancing
+        self.backend: Optional[str] = None
+        self.coordinates = coordinates
+        self.status: Optional[int] = None
+        self.response_bytes: Optional[int] = None
+        self.cached = False
+        self.attempts = 0
+        self.hedged = False
+        self.error: Optional[BaseException] = None
+        self.timings: Dict[str, float] = {}
+        self.total = 0.0
+        self._start = time.perf_counter()
+        # timestamps of the transport, by name
+        self._marks: Dict[str, float] = {}
+
+    def __repr__(self) -> str:
+        timings = ', '.join(
+            f'{phase}={self.timings[phase] * 1000:.2f}ms'
+            for phase in PHASES if phase in self.timings
+        )
+        return (
+            f'<RequestEvent {self.service} status={self.status} '
+            f'bytes={self.response_bytes} total={self.total * 1000:.2f}ms '
+            f'{timings}>'
+        )
+
+    def mark(self, name: str) -> None:
+        """Record the current time as transport mark ``name``."""
+        self._marks.setdefault(name, time.perf_counter())
+
+    def done(self, error: Optional[BaseException] = None) -> None:
+        """Complete the event computing the transport phases."""
+        self.error = error
+        self.total = time.perf_counter() - self._start
+        marks = self._marks
+        for phase, start, end in (
+                ('queue', 'queue_start', 'queue_end'),
+                ('dns', 'dns_start', 'dns_end'),
+                ('connect', 'connect_start', 'connect_end'),
+        ):
+            if start in marks and end in marks:
+                self.timings[phase] = marks[end] - marks[start]
+        if 'dns' in self.timings and 'connect' in self.timings:
+            # connection creation includes resolving the host
+            self.timings['connect'] -= self.timings['dns']
+        if 'headers' in marks:
+            sent = max(
+                marks.get(name, 0.0)
+                for name in ('request_start', 'queue_end', 'connect_end')
+            )
+            self.timings['wait'] = marks['headers'] - sent
+            if 'body' in marks:
+                self.timings['download'] = marks['body'] - marks['headers']
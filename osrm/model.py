@@ -1,5 +1,8 @@
 import enum
 from typing import (
+    Any,
+    Callable,
+    Dict,
     Optional,
     List,
     Tuple,
@@ -11,12 +14,57 @@ from typing import (
 Point = Tuple[float, float]
 
 
+def _numpy():
+    """Import numpy, needed only by array based features."""
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError(
+            'numpy is required for array results, '
+            'install it with `pip install py-osrm-client[numpy]`'
+        ) from e
+    return numpy
+
+
 class BaseModel():
+    __slots__ = ()
+
     def __init__(self, **data):
         for key, value in data.items():
             setattr(self, key, value)
 
 
+class _Lazy():
+    """Nested field built from the raw OSRM data on first access.
+
+    The owner declares the slots ``_<name>`` for the built value and
+    ``_raw_<name>`` for the raw data. Until built, the value slot is
+    unset and the raw data is kept in the raw slot.
+    """
+
+    def __init__(self, build: Callable[[Any], Any]):
+        self.build = build
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.value_slot = getattr(owner, f'_{name}')
+        self.raw_slot = getattr(owner, f'_raw_{name}')
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        try:
+            return self.value_slot.__get__(instance, owner)
+        except AttributeError:
+            value = self.build(self.raw_slot.__get__(instance, owner))
+            self.value_slot.__set__(instance, value)
+            self.raw_slot.__delete__(instance)
+            return value
+
+    def __set__(self, instance, value):
+        self.value_slot.__set__(instance, value)
+
+
 # Result objects
 
 class ResultObject(BaseModel):
@@ -24,6 +72,44 @@ class ResultObject(BaseModel):
 
     See https://project-osrm.org/docs/v5.24.0/api/#result-objects
     """
+    __slots__ = ()
+
+
+class _CompactResultObject(ResultObject):
+    """Result object storing its attributes in slots.
+
+    Fields of the OSRM data not declared by the object are kept in the
+    ``_extra`` dict, created only when needed, and are still readable as
+    attributes.
+    """
+    __slots__ = ('_extra',)
+
+    def __init__(self, **extra):
+        self._extra = extra or None
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name == '_extra':
+            raise AttributeError(name)
+        extra = self._extra
+        if extra is None or name not in extra:
+            raise AttributeError(
+                f'{type(self).__name__!r} object has no attribute {name!r}'
+            )
+        return extra[name]
+
+    def __dir__(self):
+        return [*super().__dir__(), *(self._extra or ())]
+
+
+def _geometry_array(geometry: Union[str, dict, None], precision: int) -> Any:
+    """Geometry as (N, 2) array of (longitude, latitude)."""
+    if geometry is None:
+        raise ValueError('no geometry, request it with overview/steps')
+    if isinstance(geometry, dict):
+        # GeoJSON LineString
+        return _numpy().asarray(geometry['coordinates'], dtype=float)
+    from . import polyline
+    return polyline.decode(geometry, precision)
 
 
 class Annotation(ResultObject):
@@ -38,149 +124,338 @@ class Annotation(ResultObject):
     nodes: List[int]
 
 
-class Waypoint(ResultObject):
+class Waypoint(_CompactResultObject):
     """Object used to describe waypoint on a route.
 
     See https://project-osrm.org/docs/v5.24.0/api/#waypoint-object
     """
+    __slots__ = (
+        'name',
+        'location',
+        'distance',
+        'hint',
+        'trips_index',
+        'waypoint_index',
+        'matchings_index',
+    )
+
     name: str
     location: Point
     distance: float
-    hint: str
+    hint: Optional[str]
     # needed by trip service
-    trips_index: Optional[int] = None
+    trips_index: Optional[int]
     # needed by trip and match services
-    waypoint_index: Optional[int] = None
+    waypoint_index: Optional[int]
     # needed by match service
-    matchings_index: Optional[int] = None
-
-
-class Lane(ResultObject):
+    matchings_index: Optional[int]
+
+    def __init__(
+            self,
+            name: str,
+            location: Point,
+            distance: float,
+            hint: Optional[str] = None,
+            trips_index: Optional[int] = None,
+            waypoint_index: Optional[int] = None,
+            matchings_index: Optional[int] = None,
+            **extra,
+    ):
+        super().__init__(**extra)
+        self.name = name
+        self.location = location
+        self.distance = distance
+        self.hint = hint
+        self.trips_index = trips_index
+        self.waypoint_index = waypoint_index
+        self.matchings_index = matchings_index
+
+
+class Lane(_CompactResultObject):
     """A Lane represents a turn lane at the corresponding turn location.
 
     See https://project-osrm.org/docs/v5.24.0/api/#lane-object
     """
+    __slots__ = ('indications', 'valid')
+
     indications: List[str]
     valid: bool
 
+    def __init__(self, indications: List[str], valid: bool, **extra):
+        super().__init__(**extra)
+        self.indications = indications
+        self.valid = valid
 
-class Intersection(ResultObject):
+
+class Intersection(_CompactResultObject):
     """An intersection gives a full representation of any cross-way
     the path passes bay. For every step, the very first intersection
     (intersections[0]) corresponds to the location of the
     StepManeuver. Further intersections are listed for every cross-way
     until the next turn instruction.
 
+    The ``in`` field, a python keyword, is available with
+    ``getattr(intersection, 'in')``.
+
     See https://project-osrm.org/docs/v5.24.0/api/#intersection-object
     """
+    __slots__ = ('location', 'bearings', 'entry', 'in', 'out', 'lanes')
+
     location: Point
     bearings: List[float]
     entry: List[Union[str, bool]]
-    # in: int
-    out: int
+    # in: Optional[int]
+    out: Optional[int]
     lanes: List[Lane]
 
-    def __init__(self, **data):
-        complex_fields = ["lanes"]
-        simple_data = {
-            key: val
-            for key, val in data.items()
-            if key not in complex_fields
-        }
-        super().__init__(**simple_data)
-        self.lanes = [Lane(**lane) for lane in data["lanes"]]
-
-
-class StepManeuver(ResultObject):
+    def __init__(
+            self,
+            location: Point,
+            bearings: List[float],
+            entry: List[Union[str, bool]],
+            out: Optional[int] = None,
+            lanes: Optional[List[dict]] = None,
+            **extra,
+    ):
+        setattr(self, 'in', extra.pop('in', None))
+        super().__init__(**extra)
+        self.location = location
+        self.bearings = bearings
+        self.entry = entry
+        self.out = out
+        self.lanes = [Lane(**lane) for lane in lanes] if lanes else []
+
+
+class StepManeuver(_CompactResultObject):
     """Step maneuver.
 
     See https://project-osrm.org/docs/v5.24.0/api/#stepmaneuver-object
     """
+    __slots__ = (
+        'location',
+        'bearing_before',
+        'bearing_after',
+        'type',
+        'modifier',
+        'exit',
+    )
+
     location: Point
     bearing_before: float
     bearing_after: float
     type: str
-    modifier: Optional[str] = None
-    exit: Optional[int] = None
-
-
-class RouteStep(ResultObject):
+    modifier: Optional[str]
+    exit: Optional[int]
+
+    def __init__(
+            self,
+            location: Point,
+            bearing_before: float,
+            bearing_after: float,
+            type: str,
+            modifier: Optional[str] = None,
+            exit: Optional[int] = None,
+            **extra,
+    ):
+        super().__init__(**extra)
+        self.location = location
+        self.bearing_before = bearing_before
+        self.bearing_after = bearing_after
+        self.type = type
+        self.modifier = modifier
+        self.exit = exit
+
+
+class RouteStep(_CompactResultObject):
     """A step consists of a maneuver such as a turn or merge, followed
     by a distance of travel along a single way to the subsequent step.
 
     See https://project-osrm.org/docs/v5.24.0/api/#routestep-object
     """
+    __slots__ = (
+        'name',
+        'mode',
+        'distance',
+        'duration',
+        'weight',
+        'geometry',
+        'ref',
+        'pronunciation',
+        'driving_side',
+        'maneuver',
+        '_intersections',
+        '_raw_intersections',
+    )
+
     name: str
     mode: str
     distance: float
     duration: float
-    geometry: Union[str, dict]
-    ref: Union[str, int, float, None] = None
-    pronunciation: Optional[str] = None
+    weight: Optional[float]
+    geometry: Union[str, dict, None]
+    ref: Union[str, int, float, None]
+    pronunciation: Optional[str]
+    driving_side: Optional[str]
     maneuver: StepManeuver
-    intersections: List[Intersection]
-
-    def __init__(self, **data):
-        complex_fields = ["maneuver", "intersections"]
-        simple_data = {
-            key: val
-            for key, val in data.items()
-            if key not in complex_fields
-        }
-        super().__init__(**simple_data)
-        self.maneuver = StepManeuver(**data["maneuver"])
-        self.intersections = [
-            Intersection(**ins)
-            for ins in data["intersections"]
-        ]
-
-
-class RouteLeg(ResultObject):
+    intersections: List[Intersection] = _Lazy(
+        lambda raw: [Intersection(**ins) for ins in raw]
+    )
+
+    def __init__(
+            self,
+            name: str,
+            mode: str,
+            distance: float,
+            duration: float,
+            maneuver: dict,
+            intersections: List[dict],
+            weight: Optional[float] = None,
+            geometry: Union[str, dict, None] = None,
+            ref: Union[str, int, float, None] = None,
+            pronunciation: Optional[str] = None,
+            driving_side: Optional[str] = None,
+            lazy: bool = False,
+            **extra,
+    ):
+        super().__init__(**extra)
+        self.name = name
+        self.mode = mode
+        self.distance = distance
+        self.duration = duration
+        self.weight = weight
+        self.geometry = geometry
+        self.ref = ref
+        self.pronunciation = pronunciation
+        self.driving_side = driving_side
+        self.maneuver = StepManeuver(**maneuver)
+        if lazy:
+            self._raw_intersections = intersections
+        else:
+            self.intersections = [Intersection(**ins) for ins in intersections]
+
+    def geometry_array(self, precision: int = 5) -> Any:
+        """Step geometry as numpy array of shape (N, 2) of (lon, lat).
+
+        :keyword precision: 5 for ``polyline``, 6 for ``polyline6``
+                            geometries, ignored for ``geojson``.
+        """
+        return _geometry_array(self.geometry, precision)
+
+
+class RouteLeg(_CompactResultObject):
     """Represents a route between two waypoints.
 
     See https://project-osrm.org/docs/v5.24.0/api/#routeleg-object
     """
+    __slots__ = (
+        'distance',
+        'duration',
+        'weight',
+        'summary',
+        '_steps',
+        '_raw_steps',
+        '_annotation',
+        '_raw_annotation',
+    )
+
     distance: float
     duration: float
-    summary: Optional[str] = None
-    steps: List[RouteStep]
-    annotation: Optional[Annotation] = None
-
-    def __init__(self, **data):
-        complex_fields = ["steps", "annotations"]
-        simple_data = {
-            key: val
-            for key, val in data.items()
-            if key not in complex_fields
-        }
-        super().__init__(**simple_data)
-        self.steps = [RouteStep(**step) for step in data["steps"]]
-        annotation = data.get("annotation", None)
-        if annotation:
-            self.annotation = Annotation(**data["annotation"])
-
-
-class Route(ResultObject):
+    weight: Optional[float]
+    summary: Optional[str]
+    steps: List[RouteStep] = _Lazy(
+        lambda raw: [RouteStep(lazy=True, **step) for step in raw]
+    )
+    annotation: Optional[Annotation] = _Lazy(
+        lambda raw: Annotation(**raw) if raw else None
+    )
+
+    def __init__(
+            self,
+            distance: float,
+            duration: float,
+            steps: List[dict],
+            weight: Optional[float] = None,
+            summary: Optional[str] = None,
+            annotation: Optional[dict] = None,
+            lazy: bool = False,
+            **extra,
+    ):
+        super().__init__(**extra)
+        self.distance = distance
+        self.duration = duration
+        self.weight = weight
+        self.summary = summary
+        if lazy:
+            self._raw_steps = steps
+            self._raw_annotation = annotation
+            return
+        self.steps = [RouteStep(**step) for step in steps]
+        self.annotation = Annotation(**annotation) if annotation else None
+
+
+class Route(_CompactResultObject):
     """Represents a route through (potentially multiple) waypoints.
 
     See https://project-osrm.org/docs/v5.24.0/api/#route-object
     """
+    __slots__ = (
+        'distance',
+        'duration',
+        'weight',
+        'weight_name',
+        'geometry',
+        'confidence',
+        '_legs',
+        '_raw_legs',
+    )
+
     distance: float
     duration: float
-    geometry: Union[str, dict]
-    legs: List[RouteLeg]
+    weight: Optional[float]
+    weight_name: Optional[str]
+    geometry: Union[str, dict, None]
+    legs: List[RouteLeg] = _Lazy(
+        lambda raw: [RouteLeg(lazy=True, **leg) for leg in raw]
+    )
     # needed by match service
-    confidence: Optional[float] = None
-
-    def __init__(self, **data):
-        complex_fields = ["legs"]
-        simple_data = {
-            key: val
-            for key, val in data.items()
-            if key not in complex_fields
-        }
-        super().__init__(**simple_data)
-        self.legs = [RouteLeg(**leg) for leg in data["legs"]]
+    confidence: Optional[float]
+
+    def __init__(
+            self,
+            distance: float,
+            duration: float,
+            legs: List[dict],
+            weight: Optional[float] = None,
+            weight_name: Optional[str] = None,
+            geometry: Union[str, dict, None] = None,
+            confidence: Optional[float] = None,
+            lazy: bool = False,
+            **extra,
+    ):
+        """Construct the route.
+
+        :keyword bool lazy: Build legs, steps, intersections and
+                            annotations from the raw data on first access.
+        """
+        super().__init__(**extra)
+        self.distance = distance
+        self.duration = duration
+        self.weight = weight
+        self.weight_name = weight_name
+        self.geometry = geometry
+        self.confidence = confidence
+        if lazy:
+            self._raw_legs = legs
+        else:
+            self.legs = [RouteLeg(**leg) for leg in legs]
+
+    def geometry_array(self, precision: int = 5) -> Any:
+        """Route geometry as numpy array of shape (N, 2) of (lon, lat).
+
+        :keyword precision: 5 for ``polyline``, 6 for ``polyline6``
+                            geometries, ignored for ``geojson``.
+        """
+        return _geometry_array(self.geometry, precision)
 
 
 # Service responses
@@ -230,30 +505,47 @@ class OsrmTrip(ServiceResponse):
     waypoints: List[Waypoint]
     trips: List[Route]
 
-    def __init__(self, **data):
+    def __init__(self, lazy: bool = False, **data):
         super().__init__(data["code"])
         self.waypoints = [Waypoint(**wp) for wp in data["waypoints"]]
-        self.trips = [Route(**route) for route in data["trips"]]
+        self.trips = [Route(lazy=lazy, **route) for route in data["trips"]]
 
 
 class OsrmTable(ServiceResponse):
     """Response of the OSRM Table service
 
+    When ``dtype`` is given, ``durations`` and ``distances`` are contiguous
+    numpy arrays of that dtype, with NaN for unreachable pairs, instead of
+    nested lists.
+
     See https://project-osrm.org/docs/v5.24.0/api/#table-service
     """
-    durations: List[List[float]]
-    distances: List[List[float]]
+    durations: Union[List[List[Optional[float]]], Any]
+    distances: Union[List[List[Optional[float]]], Any]
     sources: List[Waypoint]
     destinations: List[Waypoint]
 
-    def __init__(self, **data):
+    def __init__(self, dtype: Optional[str] = None, **data):
         super().__init__(data["code"])
-        self.durations = data["durations"] if "durations" in data else []
-        self.distances = data["distances"] if "distances" in data else []
+        self.durations = _table_matrix(data.get("durations"), dtype)
+        self.distances = _table_matrix(data.get("distances"), dtype)
         self.sources = [Waypoint(**wp) for wp in data["sources"]]
         self.destinations = [Waypoint(**wp) for wp in data["destinations"]]
 
 
+def _table_matrix(values: Any, dtype: Optional[str]) -> Any:
+    """Table matrix as returned by OSRM or as numpy array of ``dtype``."""
+    if values is None:
+        return [] if dtype is None else _numpy().empty((0, 0), dtype=dtype)
+    if dtype is None:
+        return values
+    np = _numpy()
+    if isinstance(values, np.ndarray):
+        return np.ascontiguousarray(values, dtype=dtype)
+    # None (unreachable) is converted to NaN by numpy with float dtypes
+    return np.array(values, dtype=dtype)
+
+
 class OsrmNearest(ServiceResponse):
     """Response of the OSRM Nearest service.
 
@@ -274,10 +566,10 @@ class OsrmRoute(ServiceResponse):
     waypoints: List[Waypoint]
     routes: List[Route]
 
-    def __init__(self, **data):
+    def __init__(self, lazy: bool = False, **data):
         super().__init__(data["code"])
         self.waypoints = [Waypoint(**wp) for wp in data["waypoints"]]
-        self.routes = [Route(**route) for route in data["routes"]]
+        self.routes = [Route(lazy=lazy, **route) for route in data["routes"]]
 
 
 class OsrmMatch(ServiceResponse):
@@ -285,13 +577,50 @@ class OsrmMatch(ServiceResponse):
 
     See https://project-osrm.org/docs/v5.24.0/api/#match-service
     """
-    tracepoints: List[Waypoint]
+    tracepoints: List[Optional[Waypoint]]
     matchings: List[Route]
 
-    def __init__(self, **data):
+    def __init__(self, lazy: bool = False, **data):
         super().__init__(data["code"])
-        self.tracepoints = [Waypoint(**wp) for wp in data["tracepoints"]]
-        self.matchings = [Route(**route) for route in data["matchings"]]
+        # unmatched tracepoints are null
+        self.tracepoints = [
+            Waypoint(**wp) if wp else None for wp in data["tracepoints"]
+        ]
+        self.matchings = [
+            Route(lazy=lazy, **route) for route in data["matchings"]
+        ]
+
+
+class OsrmSnap(BaseModel):
+    """Result of snapping many coordinates to the street network.
+
+    Not an OSRM service: coordinates are de-duplicated and each unique one
+    is snapped with the Nearest service. ``waypoints`` are aligned to the
+    input coordinates, None where the Nearest request failed.
+    """
+    waypoints: List[Optional[Waypoint]]
+    unique: int
+    errors: Dict[Point, Exception]
+
+    def __init__(
+            self,
+            waypoints: List[Optional[Waypoint]],
+            unique: int,
+            errors: Dict[Point, Exception],
+    ):
+        self.waypoints = waypoints
+        self.unique = unique
+        self.errors = errors
+
+    @property
+    def total(self) -> int:
+        """Number of input coordinates."""
+        return len(self.waypoints)
+
+    @property
+    def dedup_ratio(self) -> float:
+        """Fraction of the input coordinates not requested to OSRM."""
+        return 1 - self.unique / self.total if self.total else 0.0
 
 
 class OsrmTile(ServiceResponse):
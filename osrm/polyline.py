@@ -0,0 +1,212 @@
+"""Encoded polyline geometries, as returned with ``geometries=polyline``.
+
+Decoding is vectorized with numpy: all the characters of one or many
+polylines are processed at once instead of one at a time. Encoding, used
+to send many coordinates in short urls, is vectorized too when numpy is
+installed, else pure python.
+
+See the polyline algorithm at
+https://developers.google.com/maps/documentation/utilities/polylinealgorithm
+"""
+import functools
+from typing import Any, List, Sequence
+
+from .model import Point, _numpy
+
+# max characters decoded at once by decode_many
+_BATCH_CHARS = 1 << 16
+# min coordinates encoded with numpy, below it python is faster
+_VECTORIZE_MIN = 64
+
+
+def encode(coordinates: Sequence[Point], precision: int = 5) -> str:
+    """Encode coordinates into a polyline.
+
+    :param coordinates: Coordinates as (longitude, latitude), or float
+                        array of shape (N, 2).
+    :keyword precision: Decimal digits, 5 for ``polyline`` and 6 for
+                        ``polyline6``.
+    """
+    np = _optional_numpy()
+    if np is not None and (
+            len(coordinates) >= _VECTORIZE_MIN or
+            isinstance(coordinates, np.ndarray)
+    ):
+        return _encode_vectorized(np, coordinates, precision)
+    factor = 10 ** precision
+    encoded = bytearray()
+    append = encoded.append
+    prev_lat = prev_lon = 0
+    for lon, lat in coordinates:
+        lat = round(lat * factor)
+        lon = round(lon * factor)
+        # zigzag encoded deltas, in little endian chunks of 5 bits
+        value = lat - prev_lat
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            append((0x20 | (value & 0x1f)) + 63)
+            value >>= 5
+        append(value + 63)
+        value = lon - prev_lon
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            append((0x20 | (value & 0x1f)) + 63)
+            value >>= 5
+        append(value + 63)
+        prev_lat, prev_lon = lat, lon
+    return encoded.decode('ascii')
+
+
+def _encode_vectorized(np, coordinates: Any, precision: int) -> str:
+    """Encode coordinates with all the values processed at once."""
+    # (lon, lat) to (lat, lon) deltas from the previous point
+    points = np.round(
+        np.asarray(coordinates, dtype=np.float64)[:, ::-1] * 10 ** precision,
+    ).astype(np.int64)
+    values = np.diff(points, axis=0, prepend=0).ravel()
+    values = (values << 1) ^ (values >> 63)
+    # chunks of 5 bits of each value, little endian
+    counts = np.ones(values.size, dtype=np.int64)
+    shift = 5
+    while True:
+        more = values >= (1 << shift)
+        if not more.any():
+            break
+        counts += more
+        shift += 5
+    value_index = np.repeat(np.arange(values.size), counts)
+    position = np.arange(value_index.size) - np.repeat(
+        np.cumsum(counts) - counts, counts,
+    )
+    chunks = (values[value_index] >> (5 * position)) & 0x1f
+    # continuation bit on all the chunks but the last of each value
+    chunks[position < counts[value_index] - 1] |= 0x20
+    return (chunks + 63).astype(np.uint8).tobytes().decode('ascii')
+
+
+def _decode_python(polyline: str, precision: int = 5) -> List[Point]:
+    """Decode a polyline into (longitude, latitude) tuples, without numpy.
+
+    For the few geometries edited by the client, e.g. match windows.
+    """
+    factor = 10 ** precision
+    deltas = []
+    value = shift = 0
+    for char in polyline.encode('ascii'):
+        chunk = char - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            deltas.append((value >> 1) ^ -(value & 1))
+            value = shift = 0
+    if len(deltas) % 2:
+        raise ValueError('odd number of values in polyline')
+    coords = []
+    lat = lon = 0
+    for i in range(0, len(deltas), 2):
+        lat += deltas[i]
+        lon += deltas[i + 1]
+        coords.append((lon / factor, lat / factor))
+    return coords
+
+
+@functools.lru_cache(maxsize=None)
+def _optional_numpy() -> Any:
+    """Numpy if installed, else None."""
+    try:
+        return _numpy()
+    except ImportError:
+        return None
+
+
+def decode(polyline: str, precision: int = 5) -> Any:
+    """Decode a polyline into an array of coordinates.
+
+    :param polyline: Encoded polyline.
+    :keyword precision: Decimal digits, 5 for ``polyline`` and 6 for
+                        ``polyline6``.
+
+    :return: Float array of shape (N, 2) of (longitude, latitude).
+    """
+    return decode_many([polyline], precision)[0]
+
+
+def decode_many(polylines: Sequence[str], precision: int = 5) -> List[Any]:
+    """Decode many polylines at once.
+
+    E.g. ``decode_many([route.geometry for route in res.routes])``.
+
+    :param polylines: Encoded polylines.
+    :keyword precision: Decimal digits, 5 for ``polyline`` and 6 for
+                        ``polyline6``.
+
+    :return: Float arrays of shape (N, 2) of (longitude, latitude), one
+             for each polyline.
+    """
+    # batches of bounded size keep the intermediate arrays in cache
+    res = []
+    batch = []
+    batch_chars = 0
+    for line in polylines:
+        if batch and batch_chars + len(line) > _BATCH_CHARS:
+            res.extend(_decode_batch(batch, precision))
+            batch = []
+            batch_chars = 0
+        batch.append(line)
+        batch_chars += len(line)
+    if batch:
+        res.extend(_decode_batch(batch, precision))
+    return res
+
+
+def _decode_batch(polylines: Sequence[str], precision: int) -> List[Any]:
+    """Decode polylines concatenated in a single array."""
+    np = _numpy()
+    lengths = np.fromiter(
+        (len(p) for p in polylines), dtype=np.int64, count=len(polylines),
+    )
+    chunks = np.frombuffer(
+        ''.join(polylines).encode('ascii'), dtype=np.uint8,
+    ).astype(np.int64) - 63
+    if not chunks.size:
+        return [np.empty((0, 2)) for _ in polylines]
+    if chunks.min() < 0 or chunks.max() > 63:
+        raise ValueError('invalid polyline character')
+
+    # every value is a little endian sequence of 5 bit chunks, the last
+    # one without the 0x20 continuation bit
+    last = chunks < 0x20
+    char_ends = np.cumsum(lengths)
+    if not last[char_ends[lengths > 0] - 1].all():
+        raise ValueError('truncated polyline')
+    ends = np.flatnonzero(last)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    value_index = np.repeat(np.arange(ends.size), ends - starts + 1)
+    shift = 5 * (np.arange(chunks.size) - starts[value_index])
+    values = np.add.reduceat((chunks & 0x1f) << shift, starts)
+    # zigzag encoded signed deltas
+    deltas = (values >> 1) ^ -(values & 1)
+
+    # values in each polyline, delimited by character offsets
+    value_counts = np.diff(
+        np.concatenate(([0], np.searchsorted(ends, char_ends))),
+    )
+    if np.any(value_counts % 2):
+        raise ValueError('odd number of values in polyline')
+
+    # coordinates are deltas from the previous point of the same polyline
+    deltas = deltas.reshape(-1, 2)
+    coords = np.cumsum(deltas, axis=0)
+    point_counts = value_counts // 2
+    first = np.concatenate(([0], np.cumsum(point_counts)[:-1]))
+    offsets = np.zeros((len(polylines), 2), dtype=np.int64)
+    has_prev = first > 0
+    offsets[has_prev] = coords[first[has_prev] - 1]
+    coords -= np.repeat(offsets, point_counts, axis=0)
+
+    # (lat, lon) to (lon, lat)
+    lonlat = coords[:, ::-1] / 10 ** precision
+    return [
+        np.ascontiguousarray(part)
+        for part in np.split(lonlat, np.cumsum(point_counts)[:-1])
+    ]
@@ -0,0 +1,113 @@
+"""Record and replay of raw OSRM responses.
+
+A :class:`Recorder` writes every request url with its raw response, cache
+hits included, to a new file, a :class:`Replayer` serves the recorded
+responses from memory with no network. Give them to the clients with the
+``recorder`` and ``replayer`` arguments.
+
+The file starts with a magic header followed by records, each one a
+little endian ``(status: u16, url length: u32, body length: u32)`` header,
+the utf-8 url and the raw body.
+"""
+import struct
+import threading
+from typing import Iterator, Tuple
+
+from .utils import OsrmException, _cache_key
+
+MAGIC = b'OSRMREC1'
+_HEADER = struct.Struct('<HII')
+
+
+class Recorder():
+    """Append-only writer of the responses of a run, safe across threads."""
+
+    def __init__(self, path: str) -> None:
+        """Create the record file.
+
+        :param str path: Path of the record file, one per run.
+        :raises FileExistsError: If the file exists, e.g. of another run.
+        """
+        self.path = path
+        self.records = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'xb')
+        self._file.write(MAGIC)
+        self._file.flush()
+
+    def __enter__(self) -> 'Recorder':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def record(self, url: str, status: int, raw: bytes) -> None:
+        """Append a response to the file."""
+        url_bytes = url.encode()
+        with self._lock:
+            self._file.write(_HEADER.pack(status, len(url_bytes), len(raw)))
+            self._file.write(url_bytes)
+            self._file.write(raw)
+            # records of an interrupted run are still readable
+            self._file.flush()
+            self.records += 1
+
+    def close(self) -> None:
+        """Close the file."""
+        self._file.close()
+
+
+class Replayer():
+    """Serves the responses of a record file from memory.
+
+    Urls are matched on their canonical form, so that the order of the
+    query parameters does not matter. A url recorded many times is
+    answered with its last response.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Load the record file.
+
+        :param str path: Path of the record file.
+        :raises OsrmException: If the file is not a record file.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise OsrmException(f'not a record file: {path}')
+
+        self._records = []
+        self._index = {}
+        view = memoryview(data)
+        pos = len(MAGIC)
+        while pos + _HEADER.size <= len(data):
+            status, url_len, raw_len = _HEADER.unpack_from(data, pos)
+            pos += _HEADER.size
+            if pos + url_len + raw_len > len(data):
+                # truncated last record of an interrupted run
+                break
+            url = bytes(view[pos:pos + url_len]).decode()
+            pos += url_len
+            raw = bytes(view[pos:pos + raw_len])
+            pos += raw_len
+            self._index[_cache_key(url)] = len(self._records)
+            self._records.append((url, status, raw))
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[Tuple[str, int, bytes]]:
+        """Recorded (url, status, raw body) in recording order."""
+        return iter(self._records)
+
+    def get(self, url: str) -> Tuple[int, bytes]:
+        """Recorded status and raw body of the url.
+
+        :raises OsrmException: If the url was not recorded.
+        """
+        i = self._index.get(_cache_key(url))
+        if i is None:
+            raise OsrmException(f'no recorded response for {url}')
+        _, status, raw = self._records[i]
+        return status, raw
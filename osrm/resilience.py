@@ -0,0 +1,323 @@
+"""Retries, hedging and circuit breaking of the requests to OSRM.
+
+OSRM requests are idempotent GETs, so they can be safely retried and
+duplicated. Give the policies to the clients with the ``retry``, ``hedge``
+and ``breaker`` arguments. A policy can be shared by many clients and
+threads.
+"""
+import bisect
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Collection, Dict, List, Optional, Tuple
+
+from .utils import OsrmException
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class RetryPolicy():
+    """Retry of transient failures with jittered exponential backoff.
+
+    Connection errors and responses with one of ``statuses`` are retried
+    up to ``attempts`` tries in total. The n-th retry waits a random delay
+    between 0 and ``backoff * 2 ** n`` seconds, capped to ``max_backoff``
+    ("full jitter"), so that clients failing together do not retry in
+    lockstep. When retries are exhausted the last failure is raised.
+    """
+
+    def __init__(
+            self,
+            attempts: int = 3,
+            backoff: float = 0.1,
+            max_backoff: float = 10.0,
+            statuses: Collection[int] = (500, 502, 503, 504),
+            jitter: bool = True,
+    ) -> None:
+        """Construct the policy.
+
+        :keyword int attempts: Max tries of a request, including the first.
+        :keyword float backoff: Base delay in seconds before retrying.
+        :keyword float max_backoff: Max delay in seconds before retrying.
+        :keyword statuses: Response status codes to retry.
+        :keyword bool jitter: Randomize the delays, else the full delay is
+                              always waited.
+        """
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.jitter = jitter
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def retry(self, attempt: int, status: Optional[int] = None) -> bool:
+        """Whether to retry after a failed try.
+
+        :param attempt: Index of the failed try, 0 for the first one.
+        :keyword status: Status of the response, None for connection
+                         errors.
+        """
+        if attempt + 1 >= self.attempts:
+            return False
+        if status is not None and status not in self.statuses:
+            return False
+        with self._lock:
+            self.retries += 1
+        return True
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait before retrying the failed try ``attempt``."""
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        return random.uniform(0, delay) if self.jitter else delay
+
+
+class HedgePolicy():
+    """Duplicate requests slower than a percentile of the latencies.
+
+    When a response has not arrived within the ``percentile`` of the
+    latencies of the last ``window`` responses, the request is sent again
+    and the first reply is taken, the other one being cancelled. Hedging
+    starts after ``min_samples`` responses.
+
+    With a high percentile only the slowest requests are duplicated, e.g.
+    ``percentile=95`` adds about 5% requests, cutting the tail latency
+    caused by a slow server or connection. Hedges are most effective with
+    many servers behind a load balancer.
+    """
+
+    def __init__(
+            self,
+            percentile: float = 95.0,
+            window: int = 1000,
+            min_samples: int = 20,
+            min_delay: float = 0.0,
+            max_delay: Optional[float] = None,
+    ) -> None:
+        """Construct the policy.
+
+        :keyword float percentile: Percentile of the latencies after which
+                                   a request is hedged.
+        :keyword int window: Number of recent latencies considered.
+        :keyword int min_samples: Latencies observed before hedging.
+        :keyword float min_delay: Min seconds before hedging.
+        :keyword float max_delay: Max seconds before hedging.
+        """
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.requests = 0
+        self.hedged = 0
+        self._latencies = deque(maxlen=window)
+        self._sorted = []
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float) -> None:
+        """Record the latency in seconds of a response."""
+        with self._lock:
+            if len(self._latencies) == self.window:
+                old = self._latencies[0]
+                del self._sorted[bisect.bisect_left(self._sorted, old)]
+            self._latencies.append(latency)
+            bisect.insort(self._sorted, latency)
+
+    def count_hedge(self) -> None:
+        """Count a request duplicated after its delay."""
+        with self._lock:
+            self.hedged += 1
+
+    def delay(self) -> Optional[float]:
+        """Seconds after which to hedge a new request, None to not hedge."""
+        with self._lock:
+            self.requests += 1
+            n = len(self._sorted)
+            if not n or n < self.min_samples:
+                return None
+            delay = self._sorted[min(int(n * self.percentile / 100), n - 1)]
+        delay = max(delay, self.min_delay)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay
+
+
+class CircuitOpenError(OsrmException):
+    """Request failed fast, the circuit of the server being open."""
+
+
+class _Circuit():
+    __slots__ = (
+        'state', 'generation', 'outcomes', 'opened_at', 'probes', 'successes',
+    )
+
+    def __init__(self, window: int) -> None:
+        self.state = CLOSED
+        # incremented on every transition, to ignore stale outcomes
+        self.generation = 1
+        # True for the failures of the last requests
+        self.outcomes = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.probes = 0
+        self.successes = 0
+
+
+class CircuitBreaker():
+    """Per-server circuit breaker failing fast while a server is down.
+
+    Each server, keyed by its base url, has a circuit:
+
+    - ``closed``: requests go through. When at least ``min_requests`` of
+      the last ``window`` ones completed and ``failure_rate`` of them
+      failed (connection errors, 5xx), the circuit opens.
+    - ``open``: requests fail fast with :class:`CircuitOpenError`, or go
+      to another server when balancing. After ``cooldown`` seconds the
+      circuit is half-open.
+    - ``half_open``: up to ``half_open_requests`` probe requests go
+      through. If they all succeed the circuit closes, else it opens again.
+
+    ``on_state_change`` is called with the url, the old and the new state
+    on every transition, e.g. to log or count them.
+    """
+
+    def __init__(
+            self,
+            failure_rate: float = 0.5,
+            window: int = 20,
+            min_requests: int = 5,
+            cooldown: float = 5.0,
+            half_open_requests: int = 1,
+            on_state_change: Optional[Callable[[str, str, str], None]] = None,
+    ) -> None:
+        """Construct the breaker.
+
+        :keyword float failure_rate: Ratio of failed requests opening the
+                                     circuit.
+        :keyword int window: Number of recent requests considered.
+        :keyword int min_requests: Requests completed before opening.
+        :keyword float cooldown: Seconds before probing an open circuit.
+        :keyword int half_open_requests: Successful probes closing the
+                                         circuit.
+        :keyword on_state_change: Hook called with ``(url, old, new)``.
+        """
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.half_open_requests = half_open_requests
+        self.on_state_change = on_state_change
+        self._circuits: Dict[str, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    def state(self, url: str) -> str:
+        """State of the circuit of the server."""
+        with self._lock:
+            circuit = self._circuits.get(url)
+            if circuit is None:
+                return CLOSED
+            if circuit.state == OPEN and self._cooled(circuit):
+                return HALF_OPEN
+            return circuit.state
+
+    def available(self, url: str) -> bool:
+        """Whether a request to the server would go through."""
+        with self._lock:
+            circuit = self._circuits.get(url)
+            return circuit is None or self._available(circuit)
+
+    def allow(self, url: str) -> Optional[int]:
+        """Let a request to the server go through, to :meth:`record` after.
+
+        :return: Generation of the circuit (positive) to record the outcome
+                 with, None if the request must fail fast.
+        """
+        transitions = []
+        with self._lock:
+            circuit = self._circuit(url)
+            if not self._available(circuit):
+                return None
+            if circuit.state == OPEN:
+                self._transition(url, circuit, HALF_OPEN, transitions)
+            if circuit.state == HALF_OPEN:
+                circuit.probes += 1
+            generation = circuit.generation
+        self._notify(transitions)
+        return generation
+
+    def record(
+            self,
+            url: str,
+            ok: Optional[bool],
+            generation: Optional[int] = None,
+    ) -> None:
+        """Record the outcome of a request allowed to the server.
+
+        :param ok: Whether the server responded correctly, None if unknown
+                   (e.g. cancelled request), not counting.
+        :keyword generation: As returned by :meth:`allow`. The outcome of a
+                             request allowed before the last transition is
+                             ignored, e.g. sent while closed and completed
+                             while half-open.
+        """
+        transitions = []
+        with self._lock:
+            circuit = self._circuit(url)
+            if generation is not None and generation != circuit.generation:
+                return
+            if circuit.state == HALF_OPEN:
+                circuit.probes -= 1
+                if ok is False:
+                    self._transition(url, circuit, OPEN, transitions)
+                elif ok:
+                    circuit.successes += 1
+                    if circuit.successes >= self.half_open_requests:
+                        self._transition(url, circuit, CLOSED, transitions)
+            elif circuit.state == CLOSED and ok is not None:
+                circuit.outcomes.append(not ok)
+                n = len(circuit.outcomes)
+                if (
+                        n >= self.min_requests and
+                        sum(circuit.outcomes) >= self.failure_rate * n
+                ):
+                    self._transition(url, circuit, OPEN, transitions)
+        self._notify(transitions)
+
+    def _circuit(self, url: str) -> _Circuit:
+        circuit = self._circuits.get(url)
+        if circuit is None:
+            circuit = self._circuits[url] = _Circuit(self.window)
+        return circuit
+
+    def _cooled(self, circuit: _Circuit) -> bool:
+        return time.monotonic() - circuit.opened_at >= self.cooldown
+
+    def _available(self, circuit: _Circuit) -> bool:
+        if circuit.state == CLOSED:
+            return True
+        if circuit.state == OPEN:
+            return self._cooled(circuit)
+        return circuit.probes < self.half_open_requests - circuit.successes
+
+    def _transition(
+            self,
+            url: str,
+            circuit: _Circuit,
+            state: str,
+            transitions: List[Tuple[str, str, str]],
+    ) -> None:
+        transitions.append((url, circuit.state, state))
+        circuit.state = state
+        circuit.generation += 1
+        circuit.outcomes.clear()
+        circuit.probes = circuit.successes = 0
+        if state == OPEN:
+            circuit.opened_at = time.monotonic()
+
+    def _notify(self, transitions: List[Tuple[str, str, str]]) -> None:
+        # outside of the lock, the hook may query the breaker
+        if self.on_state_change is not None:
+            for transition in transitions:
+                self.on_state_change(*transition)
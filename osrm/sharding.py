@@ -0,0 +1,585 @@
+"""Dispatch of the requests to OSRM deployments sharded by region and profile.
+
+Each :class:`Shard` is a client serving an area, a bounding box or a
+polygon, for some profiles. The sharded clients route every request to the
+shard serving its coordinates and profile, looked up in a static R-tree of
+the shard bounding boxes, so that dispatch stays logarithmic in the number
+of shards. Shards listed first win where they overlap, e.g. a city dataset
+listed before the country around it.
+
+Table requests with coordinates in many shards are split in one table per
+shard, requested concurrently and merged: pairs across shards are
+unreachable (None, NaN with ``dtype``).
+"""
+import asyncio
+import contextlib
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any, Collection, Dict, Iterator, List, Optional, Sequence, Tuple, Union,
+)
+
+from . import model
+from .client_async import OsrmAsyncClient
+from .client_sync import OsrmClient
+from .model import _numpy
+from .utils import OsrmException
+
+# (min lon, min lat, max lon, max lat)
+BBox = Tuple[float, float, float, float]
+
+
+class Shard():
+    """A OSRM deployment serving an area for some profiles."""
+
+    def __init__(
+            self,
+            client: Union[OsrmClient, OsrmAsyncClient],
+            bbox: Optional[BBox] = None,
+            polygon: Optional[Sequence[model.Point]] = None,
+            profiles: Optional[Collection[str]] = None,
+            name: Optional[str] = None,
+    ) -> None:
+        """Construct the shard.
+
+        :param client: Client of the deployment, may be shared by shards.
+        :keyword bbox: Area served as ``(min lon, min lat, max lon, max
+                       lat)``.
+        :keyword polygon: Area served as a ring of ``(lon, lat)``, instead
+                          of ``bbox``.
+        :keyword profiles: Profiles served, None for all of them.
+        :keyword str name: Name of the shard, e.g. the dataset.
+        """
+        if polygon is not None:
+            polygon = [tuple(point) for point in polygon]
+            lons = [lon for lon, _ in polygon]
+            lats = [lat for _, lat in polygon]
+            bbox = (min(lons), min(lats), max(lons), max(lats))
+        elif bbox is None:
+            raise ValueError('shard needs a bbox or a polygon')
+        self.client = client
+        self.bbox = tuple(bbox)
+        self.polygon = polygon
+        self.profiles = frozenset(profiles) if profiles is not None else None
+        self.name = name
+
+    def __repr__(self) -> str:
+        profiles = sorted(self.profiles) if self.profiles is not None else '*'
+        return f'<Shard {self.name or self.bbox} profiles={profiles}>'
+
+    def contains(self, point: model.Point) -> bool:
+        """Whether the point is in the area of the shard."""
+        lon, lat = point
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        if not (min_lon <= lon <= max_lon and min_lat <= lat <= max_lat):
+            return False
+        return self.polygon is None or _in_polygon(lon, lat, self.polygon)
+
+
+def _in_polygon(lon: float, lat: float, ring: List[model.Point]) -> bool:
+    """Ray casting test of a point in a polygon ring."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        (lon_i, lat_i), (lon_j, lat_j) = ring[i], ring[j]
+        if (lat_i > lat) != (lat_j > lat) and lon < (
+            (lon_j - lon_i) * (lat - lat_i) / (lat_j - lat_i) + lon_i
+        ):
+            inside = not inside
+        j = i
+    return inside
+
+
+class _RTree():
+    """Static R-tree of bounding boxes, bulk loaded by Sort-Tile-Recursive.
+
+    Nodes are ``(bbox, children, item)`` tuples, ``children`` being None
+    for the leaf entries.
+    """
+
+    def __init__(
+            self,
+            entries: Sequence[Tuple[BBox, Any]],
+            node_size: int = 16,
+    ) -> None:
+        self.node_size = node_size
+        level = [(tuple(bbox), None, item) for bbox, item in entries]
+        while len(level) > node_size:
+            level = [
+                (_union(node[0] for node in group), group, None)
+                for group in self._pack(level)
+            ]
+        self._root = level
+
+    def _pack(self, nodes: List[tuple]) -> Iterator[List[tuple]]:
+        """Group nodes in tiles of ``node_size`` close to each other."""
+        n = self.node_size
+        slices = math.ceil(math.sqrt(math.ceil(len(nodes) / n)))
+        slice_size = slices * n
+        nodes = sorted(nodes, key=lambda node: node[0][0] + node[0][2])
+        for start in range(0, len(nodes), slice_size):
+            vertical = sorted(
+                nodes[start:start + slice_size],
+                key=lambda node: node[0][1] + node[0][3],
+            )
+            for i in range(0, len(vertical), n):
+                yield vertical[i:i + n]
+
+    def query(self, lon: float, lat: float) -> Iterator[Any]:
+        """Items whose bounding box contains the point."""
+        stack = list(self._root)
+        while stack:
+            (min_lon, min_lat, max_lon, max_lat), children, item = stack.pop()
+            if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat:
+                if children is None:
+                    yield item
+                else:
+                    stack.extend(children)
+
+
+def _union(bboxes: Iterator[BBox]) -> BBox:
+    min_lons, min_lats, max_lons, max_lats = zip(*bboxes)
+    return min(min_lons), min(min_lats), max(max_lons), max(max_lats)
+
+
+class ShardMap():
+    """Lookup of the shard serving a coordinate and profile."""
+
+    def __init__(self, shards: Sequence[Shard], node_size: int = 16) -> None:
+        """Build the spatial index of each profile.
+
+        :param shards: Shards in priority order where they overlap.
+        :keyword int node_size: Max children of the R-tree nodes.
+        """
+        self.shards = list(shards)
+        if not self.shards:
+            raise ValueError('no shard to dispatch to')
+        profiles = set()
+        for shard in self.shards:
+            profiles |= shard.profiles or set()
+        # profile -> R-tree of (priority, shard), None for other profiles
+        self._indexes = {
+            profile: _RTree(
+                [
+                    (shard.bbox, (priority, shard))
+                    for priority, shard in enumerate(self.shards)
+                    if shard.profiles is None or profile in shard.profiles
+                ],
+                node_size,
+            )
+            for profile in (*profiles, None)
+        }
+
+    def candidates(self, point: model.Point, profile: str) -> List[Shard]:
+        """Shards serving the point and profile, in priority order."""
+        index = self._indexes.get(profile, self._indexes[None])
+        return [
+            shard for _, shard in sorted(
+                (priority, shard)
+                for priority, shard in index.query(*point)
+                if shard.contains(point)
+            )
+        ]
+
+    def find(self, point: model.Point, profile: str) -> Shard:
+        """Shard serving the point and profile.
+
+        :raises OsrmException: If no shard serves them.
+        """
+        candidates = self.candidates(point, profile)
+        if not candidates:
+            raise OsrmException(
+                f'no shard serves {point} with profile {profile}'
+            )
+        return candidates[0]
+
+    def find_common(
+            self,
+            coordinates: Sequence[model.Point],
+            profile: str,
+    ) -> Optional[Shard]:
+        """Shard serving all the coordinates and the profile, if any."""
+        if not coordinates:
+            return None
+        for shard in self.candidates(coordinates[0], profile):
+            if all(shard.contains(point) for point in coordinates[1:]):
+                return shard
+        return None
+
+    def find_all(
+            self,
+            coordinates: Sequence[model.Point],
+            profile: str,
+    ) -> Shard:
+        """Shard serving all the coordinates and the profile.
+
+        :raises OsrmException: If no single shard serves them.
+        """
+        shard = self.find_common(coordinates, profile)
+        if shard is None:
+            raise OsrmException(
+                f'no shard serves all the coordinates with profile {profile}'
+            )
+        return shard
+
+    def split_table(
+            self,
+            coordinates: Sequence[model.Point],
+            profile: str,
+            sources: Sequence[int],
+            destinations: Sequence[int],
+    ) -> List[Tuple[Shard, dict]]:
+        """Split a table request in one request per shard.
+
+        Each request holds its ``coordinates``, its ``sources`` and
+        ``destinations`` relative to them and the ``rows`` and ``cols`` of
+        its sources and destinations in the whole table. Shards having no
+        sources or no destinations are not requested.
+
+        :raises OsrmException: If a coordinate is served by no shard.
+        """
+        shards = [self.find(point, profile) for point in coordinates]
+        sources = list(sources) if sources else range(len(coordinates))
+        destinations = (
+            list(destinations) if destinations else range(len(coordinates))
+        )
+        requests: Dict[int, dict] = {}
+
+        def _request(i: int) -> dict:
+            shard = shards[i]
+            return requests.setdefault(id(shard), {
+                'shard': shard,
+                'index': {},
+                'sources': [],
+                'destinations': [],
+                'rows': [],
+                'cols': [],
+            })
+
+        for side, positions, indexes in (
+                ('sources', 'rows', sources),
+                ('destinations', 'cols', destinations),
+        ):
+            for position, i in enumerate(indexes):
+                request = _request(i)
+                index = request['index']
+                request[side].append(index.setdefault(i, len(index)))
+                request[positions].append(position)
+
+        split = []
+        for request in requests.values():
+            if not request['sources'] or not request['destinations']:
+                continue
+            shard = request.pop('shard')
+            request['coordinates'] = [
+                coordinates[i] for i in request.pop('index')
+            ]
+            split.append((shard, request))
+        return split
+
+
+def _merge_tables(
+        requests: List[dict],
+        tables: List[model.OsrmTable],
+        n_sources: int,
+        n_destinations: int,
+        annotations: List[str],
+        dtype: Optional[str] = None,
+) -> model.OsrmTable:
+    """Merge the tables of the shards into the table of the whole request.
+
+    Sources and destinations without any in the same shard have no
+    waypoint (None).
+    """
+    merged = model.OsrmTable(
+        dtype=dtype, code='Ok', sources=[], destinations=[],
+    )
+    merged.sources = [None] * n_sources
+    merged.destinations = [None] * n_destinations
+    for annotation in annotations or ['duration']:
+        key = f'{annotation}s'
+        if dtype is None:
+            matrix = [[None] * n_destinations for _ in range(n_sources)]
+        else:
+            matrix = _numpy().full(
+                (n_sources, n_destinations), float('nan'), dtype=dtype,
+            )
+        for request, table in zip(requests, tables):
+            rows, cols = request['rows'], request['cols']
+            values = getattr(table, key)
+            if dtype is not None:
+                matrix[_numpy().ix_(rows, cols)] = values
+                continue
+            for row, row_values in zip(rows, values):
+                for col, value in zip(cols, row_values):
+                    matrix[row][col] = value
+        setattr(merged, key, matrix)
+
+    for request, table in zip(requests, tables):
+        for row, waypoint in zip(request['rows'], table.sources):
+            merged.sources[row] = waypoint
+        for col, waypoint in zip(request['cols'], table.destinations):
+            merged.destinations[col] = waypoint
+    return merged
+
+
+class OsrmShardedClient():
+    """Client dispatching the requests to sharded OSRM deployments.
+
+    The services take the arguments of :class:`~osrm.OsrmClient`, routed
+    to the shard serving all their coordinates.
+    """
+
+    def __init__(
+            self,
+            shards: Union[ShardMap, Sequence[Shard]],
+            default_profile: str = 'driving',
+    ) -> None:
+        """Construct the client.
+
+        :param shards: Shards of :class:`~osrm.OsrmClient`, in priority
+                       order where they overlap, or their :class:`ShardMap`.
+        :keyword str default_profile: Default profile to use.
+        """
+        self.shards = shards if isinstance(shards, ShardMap) else (
+            ShardMap(shards)
+        )
+        self.default_profile = default_profile
+
+    def __enter__(self):
+        """Enter the clients of all the shards.
+
+        The clients already entered are exited if one fails.
+        """
+        with contextlib.ExitStack() as stack:
+            for client in _clients(self.shards):
+                stack.enter_context(client)
+            self._exit_stack = stack.pop_all()
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        """Exit the clients of all the shards."""
+        return self._exit_stack.__exit__(*args, **kwargs)
+
+    def shard(
+            self,
+            coordinates: Sequence[model.Point],
+            profile: Optional[str] = None,
+    ) -> Shard:
+        """Shard serving the coordinates with the profile.
+
+        :raises OsrmException: If no single shard serves them.
+        """
+        return self.shards.find_all(
+            coordinates, profile or self.default_profile,
+        )
+
+    def nearest(self, coordinate: model.Point, profile=None, **kwargs):
+        """OSRM Nearest service on the shard of the coordinate."""
+        profile = profile or self.default_profile
+        return self.shard([coordinate], profile).client.nearest(
+            coordinate, profile, **kwargs,
+        )
+
+    def route(self, coordinates: List[model.Point], profile=None, **kwargs):
+        """OSRM Route service on the shard of the coordinates."""
+        profile = profile or self.default_profile
+        return self.shard(coordinates, profile).client.route(
+            coordinates, profile, **kwargs,
+        )
+
+    def match(self, coordinates: List[model.Point], profile=None, **kwargs):
+        """OSRM Match service on the shard of the coordinates."""
+        profile = profile or self.default_profile
+        return self.shard(coordinates, profile).client.match(
+            coordinates, profile, **kwargs,
+        )
+
+    def trip(self, coordinates: List[model.Point], profile=None, **kwargs):
+        """OSRM Trip service on the shard of the coordinates."""
+        profile = profile or self.default_profile
+        return self.shard(coordinates, profile).client.trip(
+            coordinates, profile, **kwargs,
+        )
+
+    def table(
+            self,
+            coordinates: List[model.Point],
+            profile: Optional[str] = None,
+            sources: List[int] = [],
+            destinations: List[int] = [],
+            annotations: List[str] = [],
+            dtype: Optional[str] = None,
+            **kwargs,
+    ) -> model.OsrmTable:
+        """OSRM Table service, split over the shards of the coordinates.
+
+        The tables of many shards are requested concurrently, one thread
+        for each shard.
+        """
+        profile = profile or self.default_profile
+        shard = self.shards.find_common(coordinates, profile)
+        if shard is not None:
+            return shard.client.table(
+                coordinates, profile, sources, destinations, annotations,
+                dtype=dtype, **kwargs,
+            )
+
+        split = self.shards.split_table(
+            coordinates, profile, sources, destinations,
+        )
+
+        def _request_table(part: Tuple[Shard, dict]) -> model.OsrmTable:
+            shard, request = part
+            return shard.client.table(
+                request['coordinates'], profile,
+                sources=request['sources'],
+                destinations=request['destinations'],
+                annotations=annotations, dtype=dtype, **kwargs,
+            )
+
+        with ThreadPoolExecutor(max_workers=len(split)) as executor:
+            tables = list(executor.map(_request_table, split))
+        return _merge_tables(
+            [request for _, request in split],
+            tables,
+            len(sources) if sources else len(coordinates),
+            len(destinations) if destinations else len(coordinates),
+            annotations, dtype,
+        )
+
+
+class OsrmAsyncShardedClient():
+    """Async client dispatching the requests to sharded OSRM deployments.
+
+    The services take the arguments of :class:`~osrm.OsrmAsyncClient`,
+    routed to the shard serving all their coordinates.
+    """
+
+    def __init__(
+            self,
+            shards: Union[ShardMap, Sequence[Shard]],
+            default_profile: str = 'driving',
+    ) -> None:
+        """Construct the client.
+
+        :param shards: Shards of :class:`~osrm.OsrmAsyncClient`, in
+                       priority order where they overlap, or their
+                       :class:`ShardMap`.
+        :keyword str default_profile: Default profile to use.
+        """
+        self.shards = shards if isinstance(shards, ShardMap) else (
+            ShardMap(shards)
+        )
+        self.default_profile = default_profile
+
+    async def __aenter__(self):
+        """Enter the clients of all the shards.
+
+        The clients already entered are exited if one fails.
+        """
+        async with contextlib.AsyncExitStack() as stack:
+            for client in _clients(self.shards):
+                await stack.enter_async_context(client)
+            self._exit_stack = stack.pop_all()
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        """Exit the clients of all the shards."""
+        return await self._exit_stack.__aexit__(*args, **kwargs)
+
+    def shard(
+            self,
+            coordinates: Sequence[model.Point],
+            profile: Optional[str] = None,
+    ) -> Shard:
+        """Shard serving the coordinates with the profile.
+
+        :raises OsrmException: If no single shard serves them.
+        """
+        return self.shards.find_all(
+            coordinates, profile or self.default_profile,
+        )
+
+    async def nearest(self, coordinate: model.Point, profile=None, **kwargs):
+        """OSRM Nearest service on the shard of the coordinate."""
+        profile = profile or self.default_profile
+        return await self.shard([coordinate], profile).client.nearest(
+            coordinate, profile, **kwargs,
+        )
+
+    async def route(
+            self, coordinates: List[model.Point], profile=None, **kwargs,
+    ):
+        """OSRM Route service on the shard of the coordinates."""
+        profile = profile or self.default_profile
+        return await self.shard(coordinates, profile).client.route(
+            coordinates, profile, **kwargs,
+        )
+
+    async def match(
+            self, coordinates: List[model.Point], profile=None, **kwargs,
+    ):
+        """OSRM Match service on the shard of the coordinates."""
+        profile = profile or self.default_profile
+        return await self.shard(coordinates, profile).client.match(
+            coordinates, profile, **kwargs,
+        )
+
+    async def trip(
+            self, coordinates: List[model.Point], profile=None, **kwargs,
+    ):
+        """OSRM Trip service on the shard of the coordinates."""
+        profile = profile or self.default_profile
+        return await self.shard(coordinates, profile).client.trip(
+            coordinates, profile, **kwargs,
+        )
+
+    async def table(
+            self,
+            coordinates: List[model.Point],
+            profile: Optional[str] = None,
+            sources: List[int] = [],
+            destinations: List[int] = [],
+            annotations: List[str] = [],
+            dtype: Optional[str] = None,
+            **kwargs,
+    ) -> model.OsrmTable:
+        """OSRM Table service, split over the shards of the coordinates.
+
+        The tables of many shards are requested concurrently.
+        """
+        profile = profile or self.default_profile
+        shard = self.shards.find_common(coordinates, profile)
+        if shard is not None:
+            return await shard.client.table(
+                coordinates, profile, sources, destinations, annotations,
+                dtype=dtype, **kwargs,
+            )
+
+        split = self.shards.split_table(
+            coordinates, profile, sources, destinations,
+        )
+        tables = await asyncio.gather(*(
+            shard.client.table(
+                request['coordinates'], profile,
+                sources=request['sources'],
+                destinations=request['destinations'],
+                annotations=annotations, dtype=dtype, **kwargs,
+            )
+            for shard, request in split
+        ))
+        return _merge_tables(
+            [request for _, request in split], tables,
+            len(sources) if sources else len(coordinates),
+            len(destinations) if destinations else len(coordinates),
+            annotations, dtype,
+        )
+
+
+def _clients(shards: ShardMap) -> List[Any]:
+    """Distinct clients of the shards."""
+    clients = {}
+    for shard in shards.shards:
+        clients.setdefault(id(shard.client), shard.client)
+    return list(clients.values())
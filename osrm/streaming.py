@@ -0,0 +1,227 @@
+"""Incremental parsing of OSRM Table responses.
+
+The ``durations`` and ``distances`` matrices are parsed row by row while
+the response is received, into preallocated arrays or a callback, so that
+the whole body is never buffered. Other fields (``sources``,
+``destinations``, ...) are decoded as usual once complete.
+"""
+import re
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .model import _numpy
+
+MATRICES = ('durations', 'distances')
+
+# separators between keys and rows
+_SEPARATORS = re.compile(rb'[\s,]*')
+_SPACES = re.compile(rb'\s*')
+# string starting at its opening quote
+_STRING = re.compile(rb'"(?:[^"\\]|\\.)*"', re.S)
+_CONTAINER_TOKENS = re.compile(rb'["\[\]{}]')
+_SCALAR_END = re.compile(rb'[\s,}\]]')
+
+_BEFORE, _KEY, _COLON, _VALUE, _MATRIX, _OTHER, _DONE = range(7)
+
+
+class TableParser():
+    """Incremental parser of an OSRM Table response body.
+
+    Feed the body in chunks of any size with :meth:`feed` and get the
+    decoded response from :meth:`close`. Matrix rows are passed to
+    ``on_row`` as soon as they are received or, without it, written into
+    the matrices of the decoded response: preallocated arrays of
+    ``shape`` with ``dtype``, else lists of rows.
+    """
+
+    def __init__(
+            self,
+            shape: Tuple[int, int],
+            loads: Callable[[bytes], Any],
+            dtype: Optional[str] = None,
+            on_row: Optional[Callable[[str, int, Any], None]] = None,
+    ) -> None:
+        """Construct the parser.
+
+        :param shape: Expected (sources, destinations) size of the table.
+        :param loads: Function decoding raw JSON.
+        :keyword dtype: Numpy dtype of the rows, None for lists.
+        :keyword on_row: Called with the matrix name (``durations`` or
+                         ``distances``), the row index and the row. Rows
+                         are not kept in the decoded response.
+        """
+        self.shape = shape
+        self.loads = loads
+        self.dtype = dtype
+        self.on_row = on_row
+        self._buf = bytearray()
+        # start of the unconsumed data in the buffer
+        self._pos = 0
+        self._state = _BEFORE
+        self._key = None
+        # scanning progress of a container value, relative to its start
+        self._scan = 0
+        self._depth = 0
+        self._row = 0
+        self._matrix = None
+        self._data = {}
+
+    def feed(self, chunk: bytes) -> None:
+        """Parse the next chunk of the body."""
+        self._buf += chunk
+        self._parse()
+        # drop the consumed data
+        del self._buf[:self._pos]
+        self._pos = 0
+
+    def close(self) -> Dict[str, Any]:
+        """Complete parsing returning the decoded response.
+
+        :raises ValueError: If the body is truncated or malformed.
+        """
+        if self._state == _OTHER:
+            # a trailing scalar has no delimiter
+            self._buf += b' '
+            self._parse()
+        if self._state != _DONE:
+            raise ValueError('truncated table response')
+        return self._data
+
+    def _parse(self) -> None:
+        buf = self._buf
+        i = self._pos
+        while True:
+            if self._state == _BEFORE:
+                i = _SPACES.match(buf, i).end()
+                if i == len(buf):
+                    break
+                if buf[i] != ord('{'):
+                    raise ValueError('table response is not an object')
+                i += 1
+                self._state = _KEY
+            elif self._state == _KEY:
+                i = _SEPARATORS.match(buf, i).end()
+                if i == len(buf):
+                    break
+                if buf[i] == ord('}'):
+                    i += 1
+                    self._state = _DONE
+                    break
+                m = _STRING.match(buf, i)
+                if m is None:
+                    break
+                self._key = self.loads(bytes(m.group()))
+                i = m.end()
+                self._state = _COLON
+            elif self._state == _COLON:
+                i = _SPACES.match(buf, i).end()
+                if i == len(buf):
+                    break
+                if buf[i] != ord(':'):
+                    raise ValueError('malformed table response')
+                i += 1
+                self._state = _VALUE
+            elif self._state == _VALUE:
+                i = _SPACES.match(buf, i).end()
+                if i == len(buf):
+                    break
+                if self._key in MATRICES and buf[i] == ord('['):
+                    i += 1
+                    self._start_matrix()
+                    self._state = _MATRIX
+                else:
+                    self._scan = 0
+                    self._depth = 0
+                    self._state = _OTHER
+            elif self._state == _MATRIX:
+                i = _SEPARATORS.match(buf, i).end()
+                if i == len(buf):
+                    break
+                if buf[i] == ord(']'):
+                    i += 1
+                    self._end_matrix()
+                    self._state = _KEY
+                    continue
+                if buf[i] != ord('['):
+                    raise ValueError('malformed table response')
+                end = buf.find(b']', i)
+                if end < 0:
+                    break
+                self._add_row(bytes(buf[i:end + 1]))
+                i = end + 1
+            elif self._state == _OTHER:
+                end = self._value_end(i)
+                if end is None:
+                    break
+                self._data[self._key] = self.loads(bytes(buf[i:end]))
+                i = end
+                self._state = _KEY
+            else:
+                break
+        self._pos = i
+
+    def _value_end(self, start: int) -> Optional[int]:
+        """End of the value starting at ``start``, None if incomplete."""
+        buf = self._buf
+        first = buf[start]
+        if first == ord('"'):
+            m = _STRING.match(buf, start)
+            return m.end() if m else None
+        if first not in b'[{':
+            m = _SCALAR_END.search(buf, start)
+            return m.start() if m else None
+
+        # resume scanning the container where the last chunk ended
+        scan = start + self._scan
+        while True:
+            m = _CONTAINER_TOKENS.search(buf, scan)
+            if m is None:
+                scan = len(buf)
+                break
+            token = buf[m.start()]
+            if token == ord('"'):
+                s = _STRING.match(buf, m.start())
+                if s is None:
+                    scan = m.start()
+                    break
+                scan = s.end()
+            elif token in b'[{':
+                self._depth += 1
+                scan = m.end()
+            else:
+                self._depth -= 1
+                scan = m.end()
+                if not self._depth:
+                    return scan
+        self._scan = scan - start
+        return None
+
+    def _start_matrix(self) -> None:
+        self._row = 0
+        if self.on_row is not None:
+            self._matrix = None
+        elif self.dtype is not None:
+            self._matrix = _numpy().empty(self.shape, dtype=self.dtype)
+        else:
+            self._matrix = []
+
+    def _add_row(self, raw: bytes) -> None:
+        row = self.loads(raw)
+        if self._row >= self.shape[0] or len(row) != self.shape[1]:
+            raise ValueError('unexpected table shape')
+        if self.dtype is not None:
+            # None (unreachable) is converted to NaN with float dtypes
+            row = _numpy().array(row, dtype=self.dtype)
+        if self.on_row is not None:
+            self.on_row(self._key, self._row, row)
+        elif self.dtype is not None:
+            self._matrix[self._row] = row
+        else:
+            self._matrix.append(row)
+        self._row += 1
+
+    def _end_matrix(self) -> None:
+        if self._row != self.shape[0]:
+            raise ValueError('unexpected table shape')
+        if self._matrix is not None:
+            self._data[self._key] = self._matrix
+            self._matrix = None
@@ -1,9 +1,17 @@
+import copy
+import json
+import time
 from enum import Enum
-from typing import List, Union
+from typing import Any, Callable, List, Optional, Sequence, Tuple, Union
 
 from urllib.parse import quote_plus
 
-from .model import Point
+from . import polyline
+from .model import OsrmTable, Point, _numpy
+
+
+# percent encoding of the polyline characters not valid in url paths
+_POLYLINE_QUOTES = [(c, f'%{ord(c):02X}') for c in '?[\\]^`{|}']
 
 
 # TODO move this from module!
@@ -16,11 +24,20 @@ def _build_osrm_url(
         api_version: str,
         profile: str,
         coordinates: List[Point],
+        polyline_precision: Optional[int] = None,
         **kwargs,
 ) -> str:
-    """Build url for invoking OSRM service."""
+    """Build url for invoking OSRM service.
+
+    With ``polyline_precision`` (5 or 6) the coordinates are sent polyline
+    encoded, a few bytes each instead of their full text.
+    """
 
-    def _query_param(value: Union[str, bool, Enum, int, float]) -> str:
+    def _query_param(
+            value: Union[str, bool, Enum, int, float, list],
+    ) -> str:
+        if isinstance(value, (list, tuple)):
+            return ';'.join(_query_param(v) for v in value)
         if isinstance(value, str):
             return quote_plus(value)
         if isinstance(value, bool):
@@ -30,7 +47,14 @@ def _build_osrm_url(
         else:
             return str(value)
 
-    coord_str = ';'.join([f'{c[0]},{c[1]}' for c in coordinates])
+    if polyline_precision is None:
+        coord_str = ';'.join([f'{c[0]},{c[1]}' for c in coordinates])
+    else:
+        encoded = polyline.encode(coordinates, polyline_precision)
+        coord_str = '{}({})'.format(
+            'polyline' if polyline_precision == 5 else 'polyline6',
+            _quote_polyline(encoded),
+        )
     url_base = f'{service}/{api_version}/{profile}/{coord_str}'
     url_params = '&'.join(
         f'{key}={_query_param(value)}'
@@ -41,6 +65,340 @@ def _build_osrm_url(
     return f'{url_base}?{url_params}'
 
 
+def _quote_polyline(encoded: str) -> str:
+    """Percent encode a polyline for a url path."""
+    # a replace per character is much faster than quote or translate
+    for char, quoted in _POLYLINE_QUOTES:
+        encoded = encoded.replace(char, quoted)
+    return encoded
+
+
+def _match_windows(
+        size: int,
+        max_matching_size: int,
+        overlap: int,
+) -> List[Tuple[int, int, int, int]]:
+    """Split a trace in overlapping windows fitting the max matching size.
+
+    Windows are ``(start, end, own_start, own_end)`` slices of the trace.
+    The overlap between two windows is split halfway, so that every
+    tracepoint is owned by exactly one window. A last window of a single
+    tracepoint, which OSRM rejects, starts one tracepoint earlier.
+    """
+    if max_matching_size < 2:
+        raise ValueError('max matching size must be at least 2')
+    if not 0 <= overlap < max_matching_size:
+        raise ValueError('overlap must be less than max matching size')
+    step = max_matching_size - overlap
+    windows = []
+    start = 0
+    while True:
+        end = min(start + max_matching_size, size)
+        own_start = start + overlap // 2 if start else 0
+        own_end = end if end >= size else start + step + overlap // 2
+        windows.append((min(start, end - 2), end, own_start, own_end))
+        if end >= size:
+            return windows
+        start += step
+
+
+def _merge_match_windows(
+        windows: List[Tuple[int, int, int, int]],
+        results: List[dict],
+        size: int,
+        geometries: str = 'polyline',
+) -> dict:
+    """Stitch the responses of the windows into a single match response.
+
+    Each tracepoint is taken from the window owning it and each window
+    matching is trimmed to the legs between its owned tracepoints, so that
+    the overlap is counted once. A matching reaching the first tracepoint
+    owned by the next window is joined with the matching of that window,
+    through the leg leading to it: a continuous trace gives one matching,
+    as a single request would. ``matchings_index`` and ``waypoint_index``
+    refer to the merged matchings.
+    """
+    tracepoints = [None] * size
+    matchings = []
+    # waypoints of each merged matching, the last one shared when joined
+    waypoints = []
+    joins = _match_window_joins(windows, results)
+    for w, ((start, end, own_start, own_end), res) in enumerate(
+            zip(windows, results),
+    ):
+        window_tps = res['tracepoints']
+        groups = _owned_matchings(window_tps, start, own_start, own_end)
+        for g, (index, owned) in enumerate(groups):
+            first = window_tps[owned[0] - start]['waypoint_index']
+            last = window_tps[owned[-1] - start]['waypoint_index']
+            if g == len(groups) - 1 and joins[w]:
+                # up to the first tracepoint of the next window
+                last = window_tps[own_end - start]['waypoint_index']
+            piece = _trim_matching(
+                res['matchings'][index], window_tps[:end - start], index,
+                first, last, geometries,
+            )
+            if g == 0 and w and joins[w - 1]:
+                offset = waypoints[-1] - 1
+                matchings[-1] = _join_matchings(matchings[-1], piece)
+            else:
+                offset = 0
+                matchings.append(piece)
+                waypoints.append(0)
+            waypoints[-1] = offset + last - first + 1
+            for i in owned:
+                tp = window_tps[i - start]
+                tracepoints[i] = {
+                    **tp,
+                    'matchings_index': len(matchings) - 1,
+                    'waypoint_index': offset + tp['waypoint_index'] - first,
+                }
+
+    for matching in matchings:
+        if matching.get('geometry'):
+            matching['geometry'] = _encode_geometry(
+                matching['geometry'], geometries,
+            )
+    return {'code': 'Ok', 'tracepoints': tracepoints, 'matchings': matchings}
+
+
+def _owned_matchings(
+        window_tps: List[Optional[dict]],
+        start: int,
+        own_start: int,
+        own_end: int,
+) -> List[Tuple[int, List[int]]]:
+    """Matched tracepoints owned by a window, grouped by matching."""
+    groups = []
+    for i in range(own_start, own_end):
+        tp = window_tps[i - start]
+        if tp is None:
+            continue
+        if not groups or groups[-1][0] != tp['matchings_index']:
+            groups.append((tp['matchings_index'], []))
+        groups[-1][1].append(i)
+    return groups
+
+
+def _match_window_joins(
+        windows: List[Tuple[int, int, int, int]],
+        results: List[dict],
+) -> List[bool]:
+    """Whether the last matching of each window continues in the next one.
+
+    It does when the window matched the first tracepoint owned by the next
+    window in its last owned matching, and the next window matched it too.
+    """
+    joins = []
+    for w, (start, end, own_start, own_end) in enumerate(windows):
+        window_tps = results[w]['tracepoints']
+        if w + 1 == len(windows) or own_end >= end:
+            # last window or windows without overlap
+            joins.append(False)
+            continue
+        groups = _owned_matchings(window_tps, start, own_start, own_end)
+        boundary = window_tps[own_end - start]
+        next_start = windows[w + 1][0]
+        joins.append(
+            bool(groups) and boundary is not None and
+            boundary['matchings_index'] == groups[-1][0] and
+            results[w + 1]['tracepoints'][own_end - next_start] is not None
+        )
+    return joins
+
+
+def _trim_matching(
+        matching: dict,
+        window_tps: List[Optional[dict]],
+        index: int,
+        first: int,
+        last: int,
+        geometries: str,
+) -> dict:
+    """Part of a matching from waypoint ``first`` to waypoint ``last``."""
+    legs = matching['legs'][first:last]
+    piece = {
+        **matching,
+        'legs': legs,
+        'distance': sum(leg['distance'] for leg in legs),
+        'duration': sum(leg['duration'] for leg in legs),
+    }
+    if matching.get('weight') is not None:
+        piece['weight'] = sum(leg['weight'] for leg in legs)
+    if matching.get('geometry'):
+        # leg boundaries are the waypoints in the full overview geometry
+        locations = {
+            tp['waypoint_index']: tp['location']
+            for tp in window_tps
+            if tp is not None and tp['matchings_index'] == index
+        }
+        coords = _geometry_coords(matching['geometry'], geometries)
+        bounds = _waypoint_positions(
+            coords, [locations[k] for k in range(last + 1)],
+            10.0 ** -_GEOMETRY_PRECISION.get(geometries, 6),
+        )
+        piece['geometry'] = coords[bounds[first]:bounds[last] + 1]
+    return piece
+
+
+def _join_matchings(matching: dict, piece: dict) -> dict:
+    """Matching continued by the piece of the next window."""
+    joined = {
+        **matching,
+        'legs': matching['legs'] + piece['legs'],
+        'distance': matching['distance'] + piece['distance'],
+        'duration': matching['duration'] + piece['duration'],
+    }
+    if matching.get('weight') is not None:
+        joined['weight'] = matching['weight'] + piece['weight']
+    if matching.get('confidence') is not None:
+        joined['confidence'] = min(
+            matching['confidence'], piece['confidence'],
+        )
+    if matching.get('geometry'):
+        # the piece starts where the matching ends
+        joined['geometry'] = matching['geometry'] + piece['geometry'][1:]
+    return joined
+
+
+_GEOMETRY_PRECISION = {'polyline': 5, 'polyline6': 6}
+
+
+def _geometry_coords(geometry: Union[str, dict], geometries: str) -> list:
+    """Coordinates of an overview geometry, without numpy."""
+    if isinstance(geometry, dict):
+        return [tuple(c) for c in geometry['coordinates']]
+    return polyline._decode_python(geometry, _GEOMETRY_PRECISION[geometries])
+
+
+def _encode_geometry(coords: list, geometries: str) -> Union[str, dict]:
+    """Overview geometry of the coordinates."""
+    if geometries == 'geojson':
+        return {'type': 'LineString', 'coordinates': [list(c) for c in coords]}
+    return polyline.encode(coords, _GEOMETRY_PRECISION[geometries])
+
+
+def _waypoint_positions(
+        coords: list,
+        locations: List[Point],
+        tolerance: float,
+) -> List[int]:
+    """Positions of the successive waypoints along a geometry.
+
+    Each waypoint is the first coordinate matching its location after the
+    previous waypoint, or the closest one if the geometry was rounded
+    differently. Every leg adds at least a coordinate, even if empty.
+    """
+    positions = []
+    pos = 0
+    for lon, lat in locations:
+        if positions:
+            pos = min(positions[-1] + 1, len(coords) - 1)
+        found = next(
+            (
+                i for i in range(pos, len(coords))
+                if abs(coords[i][0] - lon) <= tolerance and
+                abs(coords[i][1] - lat) <= tolerance
+            ),
+            None,
+        )
+        if found is None:
+            found = min(
+                range(pos, len(coords)),
+                key=lambda i: (coords[i][0] - lon) ** 2 +
+                (coords[i][1] - lat) ** 2,
+            )
+        positions.append(found)
+    return positions
+
+
+def _cache_key(url: str) -> str:
+    """Canonical form of a request url, used as cache key.
+
+    Query parameters are sorted so that the same request always maps to
+    the same key regardless of the order of the keyword arguments.
+    """
+    base, _, query = url.partition('?')
+    params = sorted(param for param in query.split('&') if param)
+    return f'{base}?{"&".join(params)}'
+
+
+def _default_json_loads() -> Callable[[bytes], Any]:
+    """Fastest available JSON decoder, orjson if installed."""
+    try:
+        import orjson
+    except ImportError:
+        return json.loads
+    return orjson.loads
+
+
+def _decode_response(
+        status_code: int,
+        raw: bytes,
+        loads: Callable[[bytes], Any],
+) -> dict:
+    """Decode the raw body of a response raising exception if error.
+
+    Error responses not in JSON (e.g. from a proxy) are reported by
+    status code.
+    """
+    try:
+        body = loads(raw) if raw else None
+    except ValueError:
+        if 200 <= status_code < 300:
+            raise
+        body = None
+    _check_response(status_code, body)
+    return body
+
+
+class _ResponseParser():
+    """Decode a raw response and build its result.
+
+    Instances are picklable, provided ``loads`` is, so that parsing can run
+    in a process pool.
+    """
+
+    def __init__(
+            self,
+            loads: Callable[[bytes], Any],
+            result: Optional[Callable[..., Any]] = None,
+            **kwargs,
+    ) -> None:
+        """Construct the parser.
+
+        :param loads: Function decoding the raw JSON body.
+        :keyword result: Result class built with the decoded data, None to
+                         return the decoded dict.
+        :keyword kwargs: Extra keyword arguments of ``result``.
+        """
+        self.loads = loads
+        self.result = result
+        self.kwargs = kwargs
+
+    def __call__(self, status: int, raw: bytes) -> Any:
+        return self.build(_decode_response(status, raw, self.loads))
+
+    def build(self, body: dict) -> Any:
+        """Build the result from the decoded body."""
+        if self.result is None:
+            return body
+        return self.result(**self.kwargs, **body)
+
+    def timed(self, status: int, raw: bytes) -> Tuple[Any, float, float]:
+        """Parse returning the result and seconds to decode and build."""
+        start = time.perf_counter()
+        body = _decode_response(status, raw, self.loads)
+        decoded = time.perf_counter()
+        res = self.build(body)
+        return res, decoded - start, time.perf_counter() - decoded
+
+    @property
+    def key(self) -> Tuple:
+        """Hashable key of the parser, equal for equivalent parsers."""
+        return (self.result, tuple(sorted(self.kwargs.items())))
+
+
 def _check_response(status_code: int, body: dict) -> None:
     """Check the response raising exception if error."""
     if 200 <= status_code < 300:
@@ -58,3 +416,188 @@ def _check_response(status_code: int, body: dict) -> None:
         raise OsrmException(f'internal server error {status_code}: {body}')
 
     raise OsrmException(f'unknown response status code {status_code}')
+
+
+def _table_params(
+        sources: Sequence[int],
+        destinations: Sequence[int],
+        annotations: Sequence[str],
+) -> dict:
+    """Query parameters of a table request."""
+    return {
+        'sources': ";".join(map(str, sources)) if sources else "all",
+        'destinations': (
+            ";".join(map(str, destinations)) if destinations else "all"
+        ),
+        'annotations': ",".join(annotations) if annotations else "duration",
+    }
+
+
+def _dedupe_coordinates(
+        coordinates: Sequence[Point],
+        precision: Optional[int] = None,
+        keep_first: bool = False,
+) -> Tuple[List[Point], List[int]]:
+    """Collapse duplicate coordinates.
+
+    With ``precision`` coordinates are first rounded to that many decimal
+    digits, so that near-duplicates fall in the same cell. With
+    ``keep_first`` the first coordinate of each cell represents it instead
+    of the rounded one.
+
+    :return: Unique (rounded) coordinates in order of first appearance and
+             the index of the unique coordinate of each input coordinate.
+    """
+    index = {}
+    unique = []
+    inverse = []
+    for coord in coordinates:
+        key = tuple(coord) if precision is None else (
+            round(coord[0], precision), round(coord[1], precision)
+        )
+        i = index.get(key)
+        if i is None:
+            i = index[key] = len(unique)
+            unique.append(tuple(coord) if keep_first else key)
+        inverse.append(i)
+    return unique, inverse
+
+
+def _collapse_table(
+        coordinates: Sequence[Point],
+        sources: Sequence[int],
+        destinations: Sequence[int],
+        precision: Optional[int] = None,
+) -> Tuple[List[Point], List[int], List[int], List[int], List[int]]:
+    """Collapse duplicate coordinates, sources and destinations of a table.
+
+    :return: Unique coordinates, their indexes to request as sources and
+             destinations, and for each requested source and destination
+             its row and column in the collapsed table.
+    """
+    unique, inverse = _dedupe_coordinates(
+        coordinates, precision, keep_first=True,
+    )
+    rows = [inverse[i] for i in sources or range(len(coordinates))]
+    cols = [inverse[i] for i in destinations or range(len(coordinates))]
+
+    def _collapse(indexes: List[int]) -> Tuple[List[int], List[int]]:
+        position = {}
+        collapsed = [position.setdefault(i, len(position)) for i in indexes]
+        return list(position), collapsed
+
+    unique_sources, rows = _collapse(rows)
+    unique_destinations, cols = _collapse(cols)
+    return unique, unique_sources, unique_destinations, rows, cols
+
+
+def _expand_table(
+        table: OsrmTable,
+        rows: List[int],
+        cols: List[int],
+) -> OsrmTable:
+    """Expand a table computed on collapsed coordinates.
+
+    ``rows`` and ``cols`` give, for each requested source and destination,
+    its index in the collapsed table. The table is left untouched, as it
+    may be shared with concurrent requests or the cache.
+    """
+    expanded = copy.copy(table)
+    for key in ('durations', 'distances'):
+        matrix = getattr(table, key)
+        if isinstance(matrix, list):
+            if matrix:
+                matrix = [[matrix[r][c] for c in cols] for r in rows]
+        elif matrix.size:
+            matrix = matrix[_numpy().ix_(rows, cols)]
+        setattr(expanded, key, matrix)
+    expanded.sources = [table.sources[r] for r in rows]
+    expanded.destinations = [table.destinations[c] for c in cols]
+    return expanded
+
+
+def _table_tiles(
+        coordinates: List[Point],
+        sources: Sequence[int],
+        destinations: Sequence[int],
+        max_table_size: int,
+) -> List[dict]:
+    """Split a table request in tiles fitting the server max table size.
+
+    Sources and destinations are split in blocks of ``max_table_size // 2``
+    indexes, so that every tile request carries at most ``max_table_size``
+    coordinates. Each tile holds its own coordinates, the ``sources`` and
+    ``destinations`` indexes relative to them and the ``row``/``col``
+    offset of the block in the whole matrix.
+    """
+    block = max(max_table_size // 2, 1)
+    sources = list(sources) if sources else range(len(coordinates))
+    destinations = (
+        list(destinations) if destinations else range(len(coordinates))
+    )
+
+    tiles = []
+    for row in range(0, len(sources), block):
+        src_block = sources[row:row + block]
+        for col in range(0, len(destinations), block):
+            dst_block = destinations[col:col + block]
+            # coordinate index -> position in the tile coordinates
+            index = {}
+            for i in (*src_block, *dst_block):
+                index.setdefault(i, len(index))
+            tiles.append({
+                'row': row,
+                'col': col,
+                'coordinates': [coordinates[i] for i in index],
+                'sources': [index[i] for i in src_block],
+                'destinations': [index[i] for i in dst_block],
+            })
+    return tiles
+
+
+def _merge_table_tiles(
+        tiles: List[dict],
+        results: List[dict],
+        n_sources: int,
+        n_destinations: int,
+        dtype: Optional[str] = None,
+) -> dict:
+    """Stitch the responses of the tiles into a single table response.
+
+    With ``dtype`` the matrices are preallocated numpy arrays filled block
+    by block, otherwise nested lists.
+    """
+    merged = {
+        'code': 'Ok',
+        'sources': [None] * n_sources,
+        'destinations': [None] * n_destinations,
+    }
+    for key in ('durations', 'distances'):
+        if not results or key not in results[0]:
+            continue
+        if dtype is None:
+            merged[key] = [[None] * n_destinations for _ in range(n_sources)]
+        else:
+            merged[key] = _numpy().full(
+                (n_sources, n_destinations), float('nan'), dtype=dtype,
+            )
+
+    for tile, res in zip(tiles, results):
+        row, col = tile['row'], tile['col']
+        if col == 0:
+            merged['sources'][row:row + len(res['sources'])] = res['sources']
+        if row == 0:
+            merged['destinations'][col:col + len(res['destinations'])] = (
+                res['destinations']
+            )
+        for key in ('durations', 'distances'):
+            if key not in merged:
+                continue
+            if dtype is not None:
+                rows, cols = len(res['sources']), len(res['destinations'])
+                merged[key][row:row + rows, col:col + cols] = res[key]
+                continue
+            for i, values in enumerate(res[key]):
+                merged[key][row + i][col:col + len(values)] = values
+
+    return merged
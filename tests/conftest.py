@@ -1,9 +1,12 @@
+import json as jsonlib
 from unittest.mock import MagicMock
+from urllib.parse import parse_qs, unquote, urlsplit
 
 import pytest
 import aiohttp
 
 from osrm.model import ServiceStatus
+from osrm.polyline import decode, encode
 
 pytest_plugins = ('pytest_asyncio',)
 
@@ -13,16 +16,152 @@ coords = [(0.1, 0.2), (0.3, 0.4)]
 
 
 @pytest.fixture
-def aiohttp_mock():
+def aiohttp_mock(monkeypatch):
+    def _response(res, status, body):
+        res.status = status
+        res.read.return_value = body
+
+        async def _iter_chunked(size):
+            for i in range(0, len(body), size):
+                yield body[i:i + size]
+
+        res.content.iter_chunked = _iter_chunked
+
     def _do_mock(status = 200, json = {}):
         mock = aiohttp.ClientSession
-        mock.get = MagicMock()
-        mock.get.return_value.__aenter__.return_value.status = status
-        mock.get.return_value.__aenter__.return_value.json.return_value = json
+        monkeypatch.setattr(mock, 'get', MagicMock())
+        if callable(json):
+            # json computed from the requested url
+            def _get(url, *args, **kwargs):
+                ctx = MagicMock()
+                _response(
+                    ctx.__aenter__.return_value, status,
+                    jsonlib.dumps(json(url)).encode(),
+                )
+                return ctx
+
+            mock.get.side_effect = _get
+            return
+        _response(
+            mock.get.return_value.__aenter__.return_value, status,
+            jsonlib.dumps(json).encode(),
+        )
 
     return _do_mock
 
 
+def _url_coords_params(url):
+    """Coordinates and query params of an OSRM url."""
+    parsed = urlsplit(url)
+    path = unquote(parsed.path.rsplit('/', 1)[-1])
+    if path.startswith('polyline'):
+        precision = 6 if path.startswith('polyline6') else 5
+        encoded = path[path.index('(') + 1:-1]
+        coords = [tuple(c) for c in decode(encoded, precision).tolist()]
+    else:
+        coords = [
+            tuple(float(v) for v in c.split(',')) for c in path.split(';')
+        ]
+    params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+    return coords, params
+
+
+def match_json(url):
+    """Fake match response, consecutive matched coordinates in a matching.
+
+    Coordinates with negative latitude are not matched and split the trace.
+    Legs are as long as the longitude difference, the overview geometry
+    goes through the coordinates and the middle of each leg.
+    """
+    coords, params = _url_coords_params(url)
+    runs = []
+    for i, (_, lat) in enumerate(coords):
+        if lat < 0:
+            runs.append([])
+        elif not runs or not runs[-1] or runs[-1][-1] != i - 1:
+            runs.append([i])
+        else:
+            runs[-1].append(i)
+    runs = [run for run in runs if run]
+    tracepoints = [None] * len(coords)
+    for index, run in enumerate(runs):
+        for k, i in enumerate(run):
+            tracepoints[i] = {
+                "name": f'wp{coords[i][0]:g}',
+                "location": list(coords[i]),
+                "distance": 0.0,
+                "hint": "",
+                "matchings_index": index,
+                "waypoint_index": k,
+            }
+
+    def _matching(run):
+        legs = [
+            {
+                "distance": coords[b][0] - coords[a][0],
+                "duration": 2 * (coords[b][0] - coords[a][0]),
+                "weight": coords[b][0] - coords[a][0],
+                "summary": "",
+                "steps": [],
+            }
+            for a, b in zip(run, run[1:])
+        ]
+        line = [coords[run[0]]]
+        for a, b in zip(run, run[1:]):
+            line.append(tuple(
+                (u + v) / 2 for u, v in zip(coords[a], coords[b])
+            ))
+            line.append(coords[b])
+        geometries = params.get('geometries', 'polyline')
+        return {
+            "distance": sum(leg["distance"] for leg in legs),
+            "duration": sum(leg["duration"] for leg in legs),
+            "weight": sum(leg["weight"] for leg in legs),
+            "weight_name": "routability",
+            "confidence": 1.0,
+            "geometry": (
+                {"type": "LineString", "coordinates": line}
+                if geometries == 'geojson'
+                else encode(line, 6 if geometries == 'polyline6' else 5)
+            ),
+            "legs": legs,
+        }
+
+    return {
+        "code": "Ok",
+        "tracepoints": tracepoints,
+        "matchings": [_matching(run) for run in runs],
+    }
+
+
+def table_json(url):
+    """Fake table response where duration is ``1000 * src_x + dst_x``."""
+    coords, params = _url_coords_params(url)
+
+    def _indexes(param):
+        if params.get(param, 'all') == 'all':
+            return list(range(len(coords)))
+        return [int(i) for i in params[param].split(';')]
+
+    def _wp(i):
+        return {
+            "name": f'wp{coords[i][0]:g}',
+            "location": list(coords[i]),
+            "distance": 0.0,
+            "hint": "",
+        }
+
+    srcs, dsts = _indexes('sources'), _indexes('destinations')
+    return {
+        "code": "Ok",
+        "durations": [
+            [1000 * coords[s][0] + coords[d][0] for d in dsts] for s in srcs
+        ],
+        "sources": [_wp(s) for s in srcs],
+        "destinations": [_wp(d) for d in dsts],
+    }
+
+
 @pytest.fixture
 def fnearest():
     def _assertions(nearest):
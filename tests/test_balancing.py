@@ -0,0 +1,182 @@
+import asyncio
+import time
+from contextlib import ExitStack
+
+import pytest
+
+from benchmarks.server import StandInServer
+from osrm import Balancer, OsrmAsyncClient, OsrmClient, RetryPolicy
+
+COORDS = [(12.0, 41.0), (12.1, 41.1)]
+
+
+def test_balancer_least_outstanding():
+    balancer = Balancer(['http://a', 'http://b/'])
+    a, b = balancer.backends
+
+    assert (a.url, b.url) == ('http://a/', 'http://b/')
+    first = balancer.select()
+    second = balancer.select()
+    assert {first, second} == {a, b}
+    balancer.release(first, 0.1)
+    assert balancer.select() is first
+    assert balancer.select(exclude=a) is b
+    with pytest.raises(ValueError):
+        Balancer([])
+    with pytest.raises(ValueError):
+        Balancer(['http://a'], strategy='random')
+
+
+def test_balancer_ewma():
+    balancer = Balancer(['http://a', 'http://b'], strategy='ewma', decay=0.5)
+    a, b = balancer.backends
+
+    for backend, latency in ((a, 0.01), (b, 0.1), (b, 0.2)):
+        balancer._acquire(backend)
+        balancer.release(backend, latency)
+    assert b.ewma == pytest.approx(0.15)
+    assert [balancer.select() for _ in range(3)] == [a, a, a]
+    # 3 in flight at 10ms cost more than 1 at 150ms
+    for _ in range(12):
+        balancer.select()
+    assert balancer.select() is b
+
+
+def test_balancer_ejection():
+    balancer = Balancer(
+        ['http://a', 'http://b'], max_failures=2, eject_time=0.05,
+    )
+    a, b = balancer.backends
+
+    for _ in range(2):
+        balancer._acquire(a)
+        balancer.release(a, 0.1, ok=False)
+    assert not a.healthy
+    assert all(balancer.select() is b for _ in range(5))
+    time.sleep(0.06)
+    # re-probed once, ejected again on the first failure
+    assert balancer.select() is a
+    assert balancer.select() is b
+    balancer.release(a, 0.1, ok=False)
+    assert not a.healthy
+    time.sleep(0.06)
+    assert balancer.select() is a
+    balancer.release(a, 0.1)
+    assert a.healthy and a.failures == 0
+
+
+@pytest.fixture
+def servers():
+    with ExitStack() as stack:
+        yield [
+            stack.enter_context(StandInServer(latency=latency, steps=1))
+            for latency in (0.001, 0.001, 0.05)
+        ]
+
+
+@pytest.mark.parametrize('strategy', ['least_outstanding', 'ewma'])
+def test_skewed_latency_sync(servers, strategy):
+    balancer = Balancer([server.url for server in servers], strategy)
+
+    with OsrmClient(balancer=balancer) as osrm:
+        results = osrm.map_route([COORDS] * 100)
+        list(results)
+
+    assert results.completed == 100
+    fast, _, slow = [server.requests for server in servers]
+    assert sum(server.requests for server in servers) == 100
+    assert slow < fast
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('strategy', ['least_outstanding', 'ewma'])
+async def test_skewed_latency_async(servers, strategy):
+    balancer = Balancer([server.url for server in servers], strategy)
+    events = []
+
+    async with OsrmAsyncClient(
+            balancer=balancer, on_request=events.append,
+    ) as osrm:
+        async for _ in osrm.route_many([COORDS] * 100):
+            pass
+
+    fast, _, slow = [server.requests for server in servers]
+    assert sum(server.requests for server in servers) == 100
+    assert slow < fast
+    assert {event.backend.split('/route')[0] for event in events} == {
+        server.url for server in servers
+    }
+
+
+@pytest.mark.asyncio
+async def test_eject_down_server():
+    with StandInServer() as down:
+        url = down.url
+    with StandInServer() as up:
+        balancer = Balancer([url, up.url], max_failures=1, eject_time=0.2)
+        async with OsrmAsyncClient(balancer=balancer) as osrm:
+            for _ in range(10):
+                try:
+                    await osrm.route(COORDS)
+                except Exception:
+                    pass
+            down, _ = balancer.backends
+            assert not down.healthy
+            assert down.requests == 1
+            assert up.requests >= 9
+
+            await asyncio.sleep(0.2)
+            with pytest.raises(Exception):
+                await osrm.route(COORDS)
+            assert down.requests == 2
+
+
+def test_base_urls(servers):
+    with OsrmClient(base_url=[server.url for server in servers]) as osrm:
+        for _ in range(6):
+            osrm.route(COORDS)
+
+    assert osrm.balancer.strategy == 'least_outstanding'
+    assert sum(server.requests for server in servers) == 6
+
+
+def test_stream_table_balanced(servers):
+    events = []
+    retry = RetryPolicy(attempts=10, backoff=0.001)
+    coords = [(12.0 + i * 1e-3, 41.0) for i in range(10)]
+
+    with StandInServer(error_rate=1.0) as down:
+        with OsrmClient(
+                balancer=Balancer(
+                    [down.url] + [server.url for server in servers],
+                    strategy='round_robin', max_failures=100,
+                ),
+                retry=retry, on_request=events.append,
+        ) as osrm:
+            for _ in range(6):
+                table = osrm.stream_table(coords)
+                assert table.durations.shape == (10, 10)
+
+    assert [server.requests for server in servers] == [2, 2, 2]
+    assert down.requests == retry.retries > 0
+    assert [event.service for event in events] == ['table'] * 6
+    assert sum(event.attempts for event in events) == 6 + retry.retries
+
+
+@pytest.mark.asyncio
+async def test_stream_table_balanced_async(servers):
+    events = []
+    coords = [(12.0 + i * 1e-3, 41.0) for i in range(10)]
+
+    async with OsrmAsyncClient(
+            balancer=Balancer(
+                [server.url for server in servers], strategy='round_robin',
+            ),
+            on_request=events.append,
+    ) as osrm:
+        for _ in range(6):
+            table = await osrm.stream_table(coords)
+            assert table.durations.shape == (10, 10)
+
+    assert [server.requests for server in servers] == [2, 2, 2]
+    assert [event.service for event in events] == ['table'] * 6
@@ -0,0 +1,148 @@
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from osrm import Cache, MemoryCache, SqliteCache
+from osrm.utils import _cache_key
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def cache_factory(request, tmp_path):
+    def _cache(**kwargs):
+        if request.param == 'memory':
+            return MemoryCache(**kwargs)
+        # every read counts in the LRU order
+        return SqliteCache(
+            str(tmp_path / 'cache.db'), access_resolution=0, **kwargs,
+        )
+
+    return _cache
+
+
+def test_hit_miss(cache_factory):
+    cache = cache_factory()
+
+    assert cache.get('a') is None
+    cache.set('a', b'{"code": "Ok"}')
+    assert cache.get('a') == b'{"code": "Ok"}'
+
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.hit_ratio == 0.5
+
+
+def test_hit_miss_threads(cache_factory):
+    cache = cache_factory()
+    cache.set('a', b'aaaa')
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(cache.get, ['a', 'b'] * 2000))
+
+    assert cache.hits == cache.misses == 2000
+
+
+def test_abstract():
+    with pytest.raises(TypeError):
+        Cache()
+
+
+def test_lru_size_bound(cache_factory):
+    cache = cache_factory(max_bytes=10)
+
+    cache.set('a', b'aaaa')
+    time.sleep(0.01)
+    cache.set('b', b'bbbb')
+    time.sleep(0.01)
+    assert cache.get('a') == b'aaaa'
+    time.sleep(0.01)
+    cache.set('c', b'cccc')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == b'aaaa'
+    assert cache.get('c') == b'cccc'
+    assert cache.size == 8
+
+    # larger than the whole cache, never stored
+    cache.set('d', b'd' * 11)
+    assert cache.get('d') is None
+    assert len(cache) == 2
+
+
+def test_ttl(cache_factory):
+    cache = cache_factory(ttl=0.05)
+
+    cache.set('a', b'aaaa')
+    assert cache.get('a') == b'aaaa'
+    time.sleep(0.1)
+    assert cache.get('a') is None
+
+
+def test_sqlite_shared(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    SqliteCache(path).set('a', b'aaaa')
+
+    assert SqliteCache(path).get('a') == b'aaaa'
+
+
+def test_sqlite_access_resolution(tmp_path):
+    cache = SqliteCache(str(tmp_path / 'cache.db'), access_resolution=60)
+    cache.set('a', b'aaaa')
+
+    def _accessed():
+        with cache._connection() as conn:
+            return conn.execute('SELECT accessed FROM osrm_cache').fetchone()
+
+    accessed = _accessed()
+    conn = cache._connection()
+    changes = conn.total_changes
+    assert cache.get('a') == b'aaaa'
+    # hits within the resolution do not write
+    assert conn.total_changes == changes
+    assert _accessed() == accessed
+
+
+def test_sqlite_size(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = SqliteCache(path, max_bytes=10)
+
+    cache.set('a', b'aaaa')
+    cache.set('a', b'aa')
+    cache.set('b', b'bbbb')
+    assert cache.size == 6
+    cache.set('c', b'cccccc')
+    assert cache.get('a') is None
+    assert cache.size == 10
+    # the size of an existing database is kept by another instance
+    assert SqliteCache(path).size == 10
+    cache.clear()
+    assert cache.size == 0
+
+
+def test_sqlite_existing_database(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            'CREATE TABLE osrm_cache (key TEXT PRIMARY KEY, value BLOB NOT'
+            ' NULL, size INTEGER NOT NULL, expires REAL, accessed REAL NOT'
+            ' NULL)'
+        )
+        conn.execute(
+            "INSERT INTO osrm_cache VALUES ('a', x'0102', 2, NULL, 0)"
+        )
+    conn.close()
+
+    cache = SqliteCache(path)
+    assert cache.size == 2
+    cache.set('b', b'bbb')
+    assert cache.size == 5
+
+
+def test_cache_key():
+    assert _cache_key('http://h/route/v1/driving/1,2;3,4?b=1&a=2') == (
+        _cache_key('http://h/route/v1/driving/1,2;3,4?a=2&b=1')
+    )
+    assert _cache_key('http://h/route/v1/driving/1,2;3,4?a=2') != (
+        _cache_key('http://h/route/v1/driving/1,2;3,5?a=2')
+    )
@@ -1,7 +1,37 @@
+import asyncio
 import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import pytest
 
-from osrm import OsrmAsyncClient
+import aiohttp
+
+from osrm import OsrmAsyncClient, SqliteCache
+from osrm.utils import OsrmException
+
+from .conftest import match_json, table_json
+
+
+@pytest.mark.asyncio
+async def test_pool_options():
+    async with OsrmAsyncClient(
+            pool_size=20, pool_size_per_host=5, dns_cache_ttl=0,
+    ) as osrm:
+        connector = osrm._session.connector
+        assert connector.limit == 20
+        assert connector.limit_per_host == 5
+        assert not connector.use_dns_cache
+
+
+@pytest.mark.asyncio
+async def test_shared_connector():
+    connector = aiohttp.TCPConnector(limit=3)
+    async with OsrmAsyncClient(connector=connector) as osrm:
+        assert osrm._session.connector is connector
+    async with OsrmAsyncClient(connector=connector) as osrm:
+        assert osrm._session.connector is connector
+    assert not connector.closed
+    await connector.close()
 
 
 @pytest.mark.asyncio
@@ -14,6 +44,53 @@ async def test_nearest(fnearest, aiohttp_mock):
     fnearest["assertions"](nearest)
 
 
+@pytest.mark.asyncio
+async def test_nearest_cached(fnearest, aiohttp_mock, tmp_path):
+    aiohttp_mock(json=json.loads(fnearest["res_json"]))
+    cache = SqliteCache(str(tmp_path / 'cache.db'))
+
+    async with OsrmAsyncClient(cache=cache) as osrm:
+        for _ in range(3):
+            nearest = await osrm.nearest(fnearest["coords"])
+            fnearest["assertions"](nearest)
+
+    assert aiohttp.ClientSession.get.call_count == 1
+    assert cache.hits == 2
+    assert cache.misses == 1
+
+
+@pytest.mark.asyncio
+async def test_nearest_coalesced(fnearest, aiohttp_mock):
+    aiohttp_mock(json=json.loads(fnearest["res_json"]))
+
+    async with OsrmAsyncClient(coalesce=True) as osrm:
+        results = await asyncio.gather(*(
+            osrm.nearest(fnearest["coords"]) for _ in range(5)
+        ))
+        other = await osrm.nearest((0.5, 0.6))
+
+    assert aiohttp.ClientSession.get.call_count == 2
+    for nearest in results:
+        fnearest["assertions"](nearest)
+    fnearest["assertions"](other)
+    assert not osrm._inflight
+
+
+@pytest.mark.asyncio
+async def test_snap(fnearest, aiohttp_mock):
+    aiohttp_mock(json=json.loads(fnearest["res_json"]))
+    coords = [(0.1, 0.2), (0.100001, 0.2), (0.3, 0.4)] * 10
+
+    async with OsrmAsyncClient() as osrm:
+        snap = await osrm.snap(coords, precision=4, concurrency=2)
+
+    assert aiohttp.ClientSession.get.call_count == 2
+    assert snap.unique == 2
+    assert len(snap.waypoints) == 30
+    assert all(wp.name == 'thename0' for wp in snap.waypoints)
+    assert not snap.errors
+
+
 @pytest.mark.asyncio
 async def test_route(froute, aiohttp_mock):
     aiohttp_mock(json=json.loads(froute["res_json"]))
@@ -24,6 +101,34 @@ async def test_route(froute, aiohttp_mock):
     froute["assertions"](route)
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize('executor', [ThreadPoolExecutor, ProcessPoolExecutor])
+@pytest.mark.parametrize('lazy', [False, True])
+async def test_parse_executor(executor, lazy, froute, aiohttp_mock):
+    aiohttp_mock(json=lambda url: (
+        match_json(url) if '/match/' in url
+        else json.loads(froute["res_json"])
+    ))
+
+    with executor(max_workers=2) as pool:
+        async with OsrmAsyncClient(parse_executor=pool, lazy=lazy) as osrm:
+            routes = await asyncio.gather(*(
+                osrm.route(froute["coords"], steps=True) for _ in range(4)
+            ))
+            match = await osrm.match(
+                [(float(i), 1.0) for i in range(10)], max_matching_size=4,
+                window_overlap=1,
+            )
+
+            aiohttp_mock(status=400, json={'code': 'InvalidQuery'})
+            with pytest.raises(OsrmException, match='InvalidQuery'):
+                await osrm.route(froute["coords"])
+
+    for route in routes:
+        froute["assertions"](route)
+    assert len(match.tracepoints) == 10
+
+
 @pytest.mark.asyncio
 async def test_table(ftable, aiohttp_mock):
     aiohttp_mock(json=json.loads(ftable["res_json"]))
@@ -34,6 +139,84 @@ async def test_table(ftable, aiohttp_mock):
     ftable["assertions"](table)
 
 
+@pytest.mark.asyncio
+async def test_table_tiled(aiohttp_mock):
+    aiohttp_mock(json=table_json)
+    coords = [(float(i), 0.0) for i in range(5)]
+
+    async with OsrmAsyncClient(max_concurrency=2) as osrm:
+        table = await osrm.table(coords, max_table_size=2)
+
+    assert [wp.name for wp in table.sources] == [f'wp{i}' for i in range(5)]
+    assert [wp.name for wp in table.destinations] == [
+        f'wp{i}' for i in range(5)
+    ]
+    assert table.durations == [
+        [1000.0 * s + d for d in range(5)] for s in range(5)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_table_dedupe(aiohttp_mock):
+    aiohttp_mock(json=table_json)
+    coords = [(1.0, 0.0), (2.0, 0.0), (1.0, 0.0)]
+
+    async with OsrmAsyncClient() as osrm:
+        table = await osrm.table(coords, dedupe=True)
+
+    url = aiohttp.ClientSession.get.call_args[0][0]
+    assert '/1.0,0.0;2.0,0.0?' in url
+    assert table.durations == [
+        [1001.0, 1002.0, 1001.0],
+        [2001.0, 2002.0, 2001.0],
+        [1001.0, 1002.0, 1001.0],
+    ]
+    assert [wp.name for wp in table.sources] == ['wp1', 'wp2', 'wp1']
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('dtype', [None, 'float64'])
+async def test_table_dedupe_coalesced(dtype, aiohttp_mock):
+    aiohttp_mock(json=table_json)
+    coords = [(1.0, 0.0), (1.0, 0.0), (2.0, 0.0)]
+
+    async with OsrmAsyncClient(coalesce=True) as osrm:
+        tables = await asyncio.gather(*(
+            osrm.table(coords, dedupe=True, dtype=dtype) for _ in range(3)
+        ))
+
+    # the collapsed table is shared, each caller expands its own copy
+    assert aiohttp.ClientSession.get.call_count == 1
+    for table in tables:
+        assert [wp.name for wp in table.sources] == ['wp1', 'wp1', 'wp2']
+        assert [list(row) for row in table.durations] == [
+            [1001.0, 1001.0, 1002.0],
+            [1001.0, 1001.0, 1002.0],
+            [2001.0, 2001.0, 2002.0],
+        ]
+
+
+@pytest.mark.asyncio
+async def test_stream_table(aiohttp_mock):
+    aiohttp_mock(json=table_json)
+    coords = [(float(x), 0.0) for x in range(4)]
+
+    async with OsrmAsyncClient() as osrm:
+        table = await osrm.stream_table(
+            coords, destinations=[0, 2], chunk_size=8,
+        )
+
+    assert table.durations.tolist() == [
+        [1000.0 * i, 1000.0 * i + 2] for i in range(4)
+    ]
+    assert [wp.name for wp in table.destinations] == ['wp0', 'wp2']
+
+    aiohttp_mock(status=400, json={'code': 'InvalidQuery'})
+    async with OsrmAsyncClient() as osrm:
+        with pytest.raises(OsrmException, match='InvalidQuery'):
+            await osrm.stream_table(coords)
+
+
 @pytest.mark.asyncio
 async def test_match(fmatch, aiohttp_mock):
     aiohttp_mock(json=json.loads(fmatch["res_json"]))
@@ -44,6 +227,22 @@ async def test_match(fmatch, aiohttp_mock):
     fmatch["assertions"](match)
 
 
+@pytest.mark.asyncio
+async def test_match_windowed(aiohttp_mock):
+    aiohttp_mock(json=match_json)
+    coords = [(float(i), 1.0) for i in range(10)]
+
+    async with OsrmAsyncClient() as osrm:
+        match = await osrm.match(coords, max_matching_size=4, window_overlap=1)
+
+    assert aiohttp.ClientSession.get.call_count == 3
+    assert [tp.name for tp in match.tracepoints] == [
+        f'wp{i}' for i in range(10)
+    ]
+    assert [m.distance for m in match.matchings] == [9.0]
+    assert [tp.waypoint_index for tp in match.tracepoints] == list(range(10))
+
+
 @pytest.mark.asyncio
 async def test_trip(ftrip, aiohttp_mock):
     aiohttp_mock(json=json.loads(ftrip["res_json"]))
@@ -52,3 +251,59 @@ async def test_trip(ftrip, aiohttp_mock):
         trip = await osrm.trip(ftrip["coords"], steps=True)
 
     ftrip["assertions"](trip)
+
+
+@pytest.mark.asyncio
+async def test_route_many(froute, aiohttp_mock):
+    res_json = json.loads(froute["res_json"])
+
+    def _json(url):
+        if '9.0,9.0' in url:
+            raise ValueError('boom')
+        return res_json
+
+    aiohttp_mock(json=_json)
+    requests = [froute["coords"], [(9.0, 9.0), (0.1, 0.2)]] * 3
+
+    async with OsrmAsyncClient() as osrm:
+        results = [
+            res async for res in osrm.route_many(
+                requests, concurrency=2, steps=True,
+            )
+        ]
+
+    assert sorted(i for i, _ in results) == list(range(6))
+    for i, res in results:
+        if i % 2:
+            assert isinstance(res, ValueError)
+        else:
+            froute["assertions"](res)
+
+
+@pytest.mark.asyncio
+async def test_route_many_ordered():
+    in_flight = 0
+    max_in_flight = 0
+
+    async def _route(coordinates, delay):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(in_flight, max_in_flight)
+        await asyncio.sleep(delay)
+        in_flight -= 1
+        return coordinates
+
+    osrm = OsrmAsyncClient()
+    osrm.route = _route
+    requests = [
+        {"coordinates": i, "delay": 0.001 * ((7 * i) % 5)}
+        for i in range(20)
+    ]
+    results = [
+        res async for res in osrm.route_many(
+            requests, concurrency=3, ordered=True, buffer_size=4,
+        )
+    ]
+
+    assert results == [(i, i) for i in range(20)]
+    assert max_in_flight == 3
@@ -1,6 +1,56 @@
 import json
+import pickle
+import re
 
-from osrm import OsrmClient
+import pytest
+import requests
+
+from osrm import MemoryCache, OsrmClient
+from osrm.utils import OsrmException
+
+from .conftest import _url_coords_params, match_json, table_json
+
+
+def test_pool_options():
+    with OsrmClient(max_workers=32) as osrm:
+        adapter = osrm._session.get_adapter('https://example.com')
+        assert adapter._pool_maxsize == 32
+        assert adapter.tcp_nodelay
+
+    with OsrmClient(pool_size=4) as osrm:
+        adapter = osrm._session.get_adapter('http://example.com')
+        assert adapter._pool_maxsize == 4
+
+
+def test_pool_adapter_pickle():
+    with OsrmClient(tcp_nodelay=False) as osrm:
+        adapter = osrm._session.get_adapter('http://example.com')
+        copy = pickle.loads(pickle.dumps(adapter))
+
+    assert copy.tcp_nodelay is False
+    assert copy._pool_maxsize == adapter._pool_maxsize
+
+
+def test_nested_enter():
+    osrm = OsrmClient()
+    with osrm:
+        session = osrm._session
+        with osrm:
+            assert osrm._session is session
+        assert osrm._session.adapters
+        assert not osrm._executor._shutdown
+    assert osrm._executor._shutdown
+
+
+def test_shared_session(fnearest, requests_mock):
+    requests_mock.get(fnearest["url"], json=json.loads(fnearest["res_json"]))
+
+    with requests.Session() as session:
+        for _ in range(2):
+            with OsrmClient(session=session) as osrm:
+                nearest = osrm.nearest(fnearest["coords"])
+            fnearest["assertions"](nearest)
+        assert requests_mock.call_count == 2
 
 
 def test_nearest(fnearest, requests_mock):
@@ -12,6 +62,87 @@ def test_nearest(fnearest, requests_mock):
     fnearest["assertions"](nearest)
 
 
+def test_nearest_cached(fnearest, requests_mock):
+    requests_mock.get(fnearest["url"], json=json.loads(fnearest["res_json"]))
+    cache = MemoryCache()
+
+    with OsrmClient(cache=cache) as osrm:
+        for _ in range(3):
+            nearest = osrm.nearest(fnearest["coords"])
+            fnearest["assertions"](nearest)
+
+    assert requests_mock.call_count == 1
+    assert cache.hits == 2
+    assert cache.misses == 1
+
+
+def test_json_loads(fnearest, requests_mock):
+    requests_mock.get(fnearest["url"], text=fnearest["res_json"])
+    decoded = []
+
+    def _loads(raw):
+        decoded.append(raw)
+        return json.loads(raw)
+
+    with OsrmClient(json_loads=_loads) as osrm:
+        nearest = osrm.nearest(fnearest["coords"])
+
+    fnearest["assertions"](nearest)
+    assert len(decoded) == 1
+    assert isinstance(decoded[0], bytes)
+
+
+def test_error_not_json(fnearest, requests_mock):
+    requests_mock.get(
+        fnearest["url"], status_code=502, text="<html>Bad Gateway</html>",
+    )
+
+    with OsrmClient() as osrm:
+        with pytest.raises(OsrmException, match="502"):
+            osrm.nearest(fnearest["coords"])
+
+
+def test_snap(requests_mock):
+    def _nearest(req, ctx):
+        lon, lat = (
+            float(v) for v in req.path.rsplit('/', 1)[-1].split(',')
+        )
+        if lon < 0:
+            ctx.status_code = 400
+            return {"code": "NoSegment", "message": "no segment"}
+        return {
+            "code": "Ok",
+            "waypoints": [{
+                "name": f'{lon:g}',
+                "location": [lon, lat],
+                "distance": 0.0,
+                "hint": "",
+            }],
+        }
+
+    requests_mock.get(re.compile('/nearest/'), json=_nearest)
+    coords = [
+        (1.000001, 2.0), (1.000002, 2.0), (3.0, 4.0),
+        (-1.0, 0.0), (1.0, 2.0), (3.0, 4.0),
+    ]
+
+    with OsrmClient(max_workers=2) as osrm:
+        snap = osrm.snap(coords, precision=5)
+
+    assert requests_mock.call_count == 3
+    # cells are snapped at their rounded coordinate
+    assert any(
+        '/1.0,2.0?' in h.url for h in requests_mock.request_history
+    )
+    assert snap.total == 6
+    assert snap.unique == 3
+    assert snap.dedup_ratio == 0.5
+    assert [wp.name if wp else None for wp in snap.waypoints] == [
+        '1', '1', '3', None, '1', '3',
+    ]
+    assert list(snap.errors) == [(-1.0, 0.0)]
+
+
 def test_route(froute, requests_mock):
     requests_mock.get(froute["url"], json=json.loads(froute["res_json"]))
 
@@ -30,6 +161,188 @@ def test_table(ftable, requests_mock):
     ftable["assertions"](table)
 
 
+def test_table_tiled(requests_mock):
+    requests_mock.get(
+        re.compile('/table/'),
+        json=lambda req, ctx: table_json(req.url),
+    )
+    coords = [(float(i), 0.0) for i in range(7)]
+
+    with OsrmClient() as osrm:
+        table = osrm.table(
+            coords, sources=[6, 0, 3], max_table_size=4,
+        )
+
+    # blocks of 2 sources x 2 destinations
+    assert requests_mock.call_count == 8
+    assert [wp.name for wp in table.sources] == ['wp6', 'wp0', 'wp3']
+    assert [wp.name for wp in table.destinations] == [
+        f'wp{i}' for i in range(7)
+    ]
+    assert table.durations == [
+        [1000.0 * s + d for d in range(7)] for s in (6, 0, 3)
+    ]
+
+
+@pytest.mark.parametrize('precision', [5, 6])
+def test_polyline_coordinates(requests_mock, precision):
+    requests_mock.get(
+        re.compile('/table/'),
+        json=lambda req, ctx: table_json(req.url),
+    )
+    coords = [(12.0 + i * 1e-3, 41.5) for i in range(5)]
+
+    with OsrmClient(
+            polyline_threshold=4, polyline_precision=precision,
+    ) as osrm:
+        encoded = osrm.table(coords)
+        text = osrm.table(coords[:4])
+
+    urls = [req.url for req in requests_mock.request_history]
+    assert f'/polyline{precision if precision == 6 else ""}(' in urls[0]
+    assert '/12.0,41.5;' in urls[1]
+    assert [tuple(wp.location) for wp in encoded.sources] == coords
+    assert encoded.durations[1][:4] == text.durations[1]
+    with pytest.raises(ValueError):
+        OsrmClient(polyline_precision=7)
+
+
+def test_table_tiled_array(requests_mock):
+    requests_mock.get(
+        re.compile('/table/'),
+        json=lambda req, ctx: table_json(req.url),
+    )
+    coords = [(float(i), 0.0) for i in range(5)]
+
+    with OsrmClient() as osrm:
+        table = osrm.table(coords, max_table_size=2, dtype='float64')
+
+    assert table.durations.shape == (5, 5)
+    assert table.durations.tolist() == [
+        [1000.0 * s + d for d in range(5)] for s in range(5)
+    ]
+
+
+@pytest.mark.parametrize('dtype', [None, 'float64'])
+def test_table_dedupe(dtype, requests_mock):
+    requests_mock.get(
+        re.compile('/table/'),
+        json=lambda req, ctx: table_json(req.url),
+    )
+    coords = [(float(i % 3), 0.0) for i in range(7)] + [(2.0000001, 0.0)]
+
+    def _as_list(matrix):
+        return matrix if dtype is None else matrix.tolist()
+
+    with OsrmClient() as osrm:
+        naive = osrm.table(coords, sources=[0, 3, 4, 7], dtype=dtype)
+        table = osrm.table(
+            coords, sources=[0, 3, 4, 7], dtype=dtype, dedupe=True,
+        )
+        near = osrm.table(
+            coords, dtype=dtype, dedupe=True, dedupe_precision=5,
+        )
+
+    assert requests_mock.request_history[1].url.split('?')[0].endswith(
+        '0.0,0.0;1.0,0.0;2.0,0.0;2.0000001,0.0'
+    )
+    assert requests_mock.request_history[1].qs['sources'] == ['0;1;3']
+    assert _as_list(table.durations) == _as_list(naive.durations)
+    assert [wp.name for wp in table.sources] == (
+        [wp.name for wp in naive.sources]
+    )
+    assert [wp.name for wp in table.destinations] == (
+        [wp.name for wp in naive.destinations]
+    )
+    assert requests_mock.request_history[2].url.split('?')[0].endswith(
+        '0.0,0.0;1.0,0.0;2.0,0.0'
+    )
+    assert _as_list(near.durations)[7] == _as_list(near.durations)[2]
+
+
+def test_stream_table(requests_mock):
+    requests_mock.get(
+        re.compile('/table/'),
+        json=lambda req, ctx: table_json(req.url),
+    )
+    coords = [(float(x), 0.0) for x in range(5)]
+    rows = []
+
+    with OsrmClient() as osrm:
+        table = osrm.stream_table(coords, sources=[1, 3], chunk_size=16)
+        listed = osrm.stream_table(coords, dtype=None)
+        osrm.stream_table(
+            coords, destinations=[4], on_row=lambda *row: rows.append(row),
+        )
+
+    assert table.durations.tolist() == [
+        [1000.0 + j for j in range(5)], [3000.0 + j for j in range(5)],
+    ]
+    assert [wp.name for wp in table.sources] == ['wp1', 'wp3']
+    assert listed.durations == table_json(
+        requests_mock.request_history[1].url
+    )['durations']
+    assert [(key, i, list(row)) for key, i, row in rows] == [
+        ('durations', i, [1000.0 * i + 4]) for i in range(5)
+    ]
+
+
+def test_stream_table_error(requests_mock):
+    requests_mock.get(
+        re.compile('/table/'), status_code=400,
+        json={'code': 'InvalidQuery', 'message': 'too big'},
+    )
+
+    with OsrmClient() as osrm:
+        with pytest.raises(OsrmException, match='too big'):
+            osrm.stream_table([(1.0, 2.0), (3.0, 4.0)])
+
+
+def test_map_route(froute, requests_mock):
+    def _route(request, context):
+        if '/9.0,9.0;' in request.url:
+            context.status_code = 400
+            return {'code': 'NoRoute', 'message': 'no route'}
+        return json.loads(froute["res_json"])
+
+    requests_mock.get(re.compile('/route/'), json=_route)
+    requests = [froute["coords"]] * 5
+    requests[2] = {'coordinates': [(9.0, 9.0), (1.0, 1.0)], 'steps': False}
+
+    with OsrmClient(max_workers=2) as osrm:
+        batch = osrm.map_route(requests, steps=True)
+        results = list(batch)
+
+    assert len(results) == 5
+    assert isinstance(results[2], OsrmException)
+    for i in (0, 1, 3, 4):
+        froute["assertions"](results[i])
+    assert 'steps=true' in requests_mock.request_history[0].url
+    assert batch.completed == 5
+    assert batch.errors == 1
+    assert batch.elapsed > 0
+    assert batch.throughput > 0
+
+
+def test_map_table_tiled(requests_mock):
+    requests_mock.get(
+        re.compile('/table/'),
+        json=lambda req, ctx: table_json(req.url),
+    )
+    requests = [
+        [(float(x), float(n)) for x in range(n)] for n in range(1, 7)
+    ]
+
+    # tiles requested from the pool workers must not wait on the pool
+    with OsrmClient(max_workers=1) as osrm:
+        tables = list(osrm.map_table(requests, max_table_size=4))
+
+    for n, table in enumerate(tables, 1):
+        assert table.durations == [
+            [1000.0 * i + j for j in range(n)] for i in range(n)
+        ]
+
+
 def test_match(fmatch, requests_mock):
     requests_mock.get(fmatch["url"], json=json.loads(fmatch["res_json"]))
 
@@ -39,6 +352,98 @@ def test_match(fmatch, requests_mock):
     fmatch["assertions"](match)
 
 
+def test_match_windowed(requests_mock):
+    requests_mock.get(
+        re.compile('/match/'),
+        json=lambda req, ctx: match_json(req.url),
+    )
+    coords = [(float(i), -1.0 if i == 5 else 1.0) for i in range(12)]
+
+    with OsrmClient() as osrm:
+        match = osrm.match(
+            coords,
+            timestamps=list(range(100, 112)),
+            max_matching_size=6,
+            window_overlap=2,
+        )
+
+    # windows [0, 6), [4, 10), [8, 12)
+    assert requests_mock.call_count == 3
+    assert sorted(
+        h.qs['timestamps'] for h in requests_mock.request_history
+    ) == [
+        ['100;101;102;103;104;105'],
+        ['104;105;106;107;108;109'],
+        ['108;109;110;111'],
+    ]
+    assert len(match.tracepoints) == 12
+    assert match.tracepoints[5] is None
+    # the unmatched tracepoint splits the trace, the rest is stitched
+    assert [m.distance for m in match.matchings] == [4.0, 5.0]
+    assert [len(m.legs) for m in match.matchings] == [4, 5]
+    assert [
+        (tp.name, tp.matchings_index, tp.waypoint_index)
+        for tp in match.tracepoints if tp
+    ] == [(f'wp{i}', 0, i) for i in range(5)] + [
+        (f'wp{i}', 1, i - 6) for i in range(6, 12)
+    ]
+
+
+def test_match_windowed_single_point_tail(requests_mock):
+    requests_mock.get(
+        re.compile('/match/'),
+        json=lambda req, ctx: match_json(req.url),
+    )
+    coords = [(float(i), 1.0) for i in range(7)]
+
+    with OsrmClient() as osrm:
+        match = osrm.match(coords, max_matching_size=6, window_overlap=0)
+
+    # windows [0, 6) and [5, 7), rather than a single point [6, 7)
+    assert sorted(
+        len(_url_coords_params(h.url)[0])
+        for h in requests_mock.request_history
+    ) == [2, 6]
+    # the windows cut the full overview at the waypoints
+    assert {
+        h.qs['overview'][0] for h in requests_mock.request_history
+    } == {'full'}
+    assert [tp.waypoint_index for tp in match.tracepoints] == [
+        0, 1, 2, 3, 4, 5, 0,
+    ]
+
+
+@pytest.mark.parametrize('geometries', ['polyline', 'polyline6', 'geojson'])
+def test_match_windowed_continuous(geometries, requests_mock):
+    requests_mock.get(
+        re.compile('/match/'),
+        json=lambda req, ctx: match_json(req.url),
+    )
+    coords = [(i * 0.25 + (i % 3) * 0.0625, 1.0) for i in range(100)]
+
+    with OsrmClient() as osrm:
+        single = osrm.match(coords, geometries=geometries)
+        windowed = osrm.match(
+            coords, geometries=geometries,
+            max_matching_size=12, window_overlap=4,
+        )
+
+    assert requests_mock.call_count == 1 + 12
+    assert len(windowed.matchings) == len(single.matchings) == 1
+    matching, expected = windowed.matchings[0], single.matchings[0]
+    assert matching.distance == pytest.approx(expected.distance)
+    assert matching.duration == pytest.approx(expected.duration)
+    assert matching.weight == pytest.approx(expected.weight)
+    assert len(matching.legs) == len(expected.legs) == 99
+    assert matching.geometry == expected.geometry
+    assert [
+        (tp.matchings_index, tp.waypoint_index)
+        for tp in windowed.tracepoints
+    ] == [
+        (tp.matchings_index, tp.waypoint_index) for tp in single.tracepoints
+    ]
+
+
 def test_trip(ftrip, requests_mock):
     requests_mock.get(ftrip["url"], json=json.loads(ftrip["res_json"]))
 
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from benchmarks.server import StandInServer
+from osrm import AdaptiveLimiter, OsrmAsyncClient, RetryPolicy
+
+COORDS = [(12.0, 41.0), (12.1, 41.1)]
+
+
+@pytest.mark.asyncio
+async def test_limiter_queue():
+    limiter = AdaptiveLimiter(initial_limit=2)
+    await limiter.acquire()
+    await limiter.acquire()
+
+    waiters = [asyncio.ensure_future(limiter.acquire()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert (limiter.in_flight, limiter.queued) == (2, 3)
+    waiters[0].cancel()
+    limiter.release()
+    await asyncio.sleep(0)
+    # the cancelled waiter is skipped, the others served in order
+    assert waiters[1].done() and not waiters[2].done()
+    assert (limiter.in_flight, limiter.queued) == (2, 1)
+    limiter.release()
+    await asyncio.sleep(0)
+    assert waiters[2].done()
+    assert limiter.queued == 0
+
+
+def test_limiter_aimd():
+    limiter = AdaptiveLimiter(initial_limit=10, backoff=0.5, tolerance=2.0)
+    limiter.in_flight = 10
+
+    limiter.release(0.01)
+    assert limiter._limit == pytest.approx(10.1)
+    # queueing on the server
+    limiter.release(0.05)
+    assert limiter.limit == 5
+    # sent before the decrease, no further decrease
+    limiter.release(0.05, dropped=True)
+    assert limiter.limit == 5
+    assert limiter.drops == 1
+    # idle limit does not grow
+    limiter.in_flight = 2
+    limiter.release(0.01)
+    assert limiter._limit == pytest.approx(5.05)
+    limiter.release(None)
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_capacity_limit():
+    limiter = AdaptiveLimiter(initial_limit=32)
+
+    with StandInServer(capacity=4, latency=0.02, steps=1) as server:
+        async with OsrmAsyncClient(
+                base_url=server.url, limiter=limiter, pool_size=100,
+        ) as osrm:
+            async for _, res in osrm.route_many([COORDS] * 400, 64):
+                assert not isinstance(res, Exception)
+
+    # a fixed limit of 64 queues 60 requests on the server
+    assert 4 <= limiter.limit <= 16
+    assert server.max_queued <= 32
+    assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_drops():
+    limiter = AdaptiveLimiter(initial_limit=32)
+
+    with StandInServer(
+            capacity=2, max_queue=2, latency=0.01, steps=1,
+    ) as server:
+        async with OsrmAsyncClient(
+                base_url=server.url, limiter=limiter, pool_size=100,
+                retry=RetryPolicy(attempts=10, backoff=0.01),
+        ) as osrm:
+            async for _, res in osrm.route_many([COORDS] * 100, 32):
+                assert not isinstance(res, Exception)
+
+    assert server.rejected > 0
+    assert limiter.drops == server.rejected
+    assert limiter.limit < 16
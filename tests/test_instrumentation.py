@@ -0,0 +1,77 @@
+import pytest
+
+from benchmarks.server import StandInServer
+from osrm import MemoryCache, OsrmAsyncClient, OsrmClient
+from osrm.utils import OsrmException
+
+COORDS = [(12.0, 41.0), (12.1, 41.1), (12.2, 41.2)]
+
+
+@pytest.fixture(scope='module')
+def server():
+    with StandInServer(latency=0.01, steps=2, max_table_size=10) as srv:
+        yield srv
+
+
+def _check_route_event(event, phases):
+    assert event.service == 'route'
+    assert event.coordinates == 3
+    assert event.status == 200
+    assert event.response_bytes > 0
+    assert event.error is None
+    assert not event.cached
+    assert set(phases) <= set(event.timings)
+    assert event.timings['wait'] >= 0.01
+    assert sum(event.timings.values()) <= event.total
+
+
+def test_sync(server):
+    events = []
+
+    with OsrmClient(
+            base_url=server.url, cache=MemoryCache(), on_request=events.append,
+    ) as osrm:
+        osrm.route(COORDS, steps=True)
+        osrm.route(COORDS, steps=True)
+        with pytest.raises(OsrmException):
+            osrm.table(COORDS * 4)
+
+    _check_route_event(events[0], ['wait', 'download', 'decode', 'build'])
+    assert events[1].cached
+    assert set(events[1].timings) == {'decode', 'build'}
+    assert events[2].status == 400
+    assert isinstance(events[2].error, OsrmException)
+
+
+@pytest.mark.asyncio
+async def test_async(server):
+    events = []
+
+    async with OsrmAsyncClient(
+            base_url=server.url, on_request=events.append, dns_cache_ttl=0,
+    ) as osrm:
+        await osrm.route(COORDS, steps=True)
+        await osrm.route(COORDS, steps=True)
+        with pytest.raises(OsrmException):
+            await osrm.table(COORDS * 4)
+
+    # the first request opens the connection, the second one reuses it
+    _check_route_event(
+        events[0], ['connect', 'wait', 'download', 'decode', 'build'],
+    )
+    _check_route_event(events[1], ['wait', 'download', 'decode', 'build'])
+    assert 'connect' not in events[1].timings
+    assert events[2].status == 400
+    assert isinstance(events[2].error, OsrmException)
+
+
+@pytest.mark.asyncio
+async def test_no_hook(server, monkeypatch):
+    monkeypatch.setattr(
+        'osrm.instrumentation.RequestEvent.__init__', None,
+    )
+
+    async with OsrmAsyncClient(base_url=server.url) as osrm:
+        await osrm.route(COORDS)
+    with OsrmClient(base_url=server.url) as osrm:
+        osrm.route(COORDS)
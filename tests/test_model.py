@@ -1,4 +1,8 @@
 import json
+import math
+
+import numpy as np
+import pytest
 
 import osrm
 
@@ -139,3 +143,118 @@ def test_route():
     assert route.legs[0].distance == 0.1
     assert route.legs[0].steps[0].geometry == "otherpolyline"
     assert route.legs[0].steps[0].maneuver.bearing_before == 32.1
+
+
+def test_table_array():
+    table_json = """
+    {
+      "code": "Ok",
+      "durations": [[0.0, 5.2], [null, 0.0]],
+      "sources": [],
+      "destinations": []
+    }
+    """
+    table_data = json.loads(table_json)
+    table = osrm.OsrmTable(dtype="float32", **table_data)
+
+    assert isinstance(table.durations, np.ndarray)
+    assert table.durations.dtype == np.float32
+    assert table.durations.shape == (2, 2)
+    assert table.durations.flags["C_CONTIGUOUS"]
+    assert table.durations[0, 1] == np.float32(5.2)
+    assert math.isnan(table.durations[1, 0])
+    assert table.distances.shape == (0, 0)
+
+
+def _public(obj):
+    """Public attributes of a model object, recursively."""
+    if isinstance(obj, list):
+        return [_public(item) for item in obj]
+    if not isinstance(obj, osrm.model.BaseModel):
+        return obj
+    return {
+        name: _public(getattr(obj, name))
+        for name in dir(obj)
+        if not name.startswith("_") and not callable(getattr(obj, name))
+    }
+
+
+def test_route_lazy():
+    route_json = """
+    {
+      "distance": 0.1,
+      "duration": 0.2,
+      "geometry": "somepolyline",
+      "legs": [
+        {
+          "distance": 0.1,
+          "duration": 0.2,
+          "annotation": {
+            "distance": [0.1],
+            "duration": [0.2],
+            "datasources": [0],
+            "nodes": [1, 2]
+          },
+          "steps": [
+            {
+              "name": "thename",
+              "mode": "car",
+              "distance": 0.1,
+              "duration": 0.2,
+              "geometry": "otherpolyline",
+              "maneuver": {
+                "location": [1.1, 1.2],
+                "bearing_before": 32.1,
+                "bearing_after": 12.3,
+                "type": "blblbl"
+              },
+              "intersections": [
+                {
+                  "location": [0.1, 2.3],
+                  "bearings": [],
+                  "entry": [false, true],
+                  "out": 1,
+                  "lanes": []
+                }
+              ]
+            }
+          ]
+        },
+        {
+          "distance": 0.3,
+          "duration": 0.4,
+          "steps": []
+        }
+      ]
+    }
+    """
+    route_data = json.loads(route_json)
+    lazy = osrm.Route(lazy=True, **route_data)
+
+    assert hasattr(lazy, "_raw_legs")
+    assert lazy.distance == 0.1
+    assert lazy.legs[0].steps[0].intersections[0].out == 1
+    assert lazy.legs[1].annotation is None
+    assert not hasattr(lazy, "_raw_legs")
+    assert _public(lazy) == _public(osrm.Route(**route_data))
+
+
+def test_compact_objects():
+    isec_data = {
+        "location": [0.1, 2.3],
+        "bearings": [0, 180],
+        "entry": [True, False],
+        "in": 1,
+        "classes": ["toll"],
+    }
+    isec = osrm.Intersection(**isec_data)
+
+    assert not hasattr(isec, "__dict__")
+    assert getattr(isec, "in") == 1
+    assert isec.out is None
+    assert isec.lanes == []
+    # fields not declared by the object are still available
+    assert isec.classes == ["toll"]
+    assert "classes" in dir(isec)
+    with pytest.raises(AttributeError):
+        isec.other
@@ -0,0 +1,114 @@
+import random
+
+import numpy as np
+import pytest
+
+import osrm
+from osrm import polyline
+
+
+def _encode(coords, precision=5):
+    """Reference encoder of (lon, lat) coordinates."""
+    factor = 10 ** precision
+    res = []
+    prev = (0, 0)
+    for lon, lat in coords:
+        point = (round(lat * factor), round(lon * factor))
+        for value, prev_value in zip(point, prev):
+            value = value - prev_value
+            value = ~(value << 1) if value < 0 else value << 1
+            while value >= 0x20:
+                res.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            res.append(chr(value + 63))
+        prev = point
+    return ''.join(res)
+
+
+def _random_coords(n, precision):
+    rnd = random.Random(n)
+    return [
+        (
+            round(rnd.uniform(-180, 180), precision),
+            round(rnd.uniform(-90, 90), precision),
+        )
+        for _ in range(n)
+    ]
+
+
+@pytest.mark.parametrize('precision', [5, 6])
+def test_encode(precision):
+    coords = _random_coords(100, precision)
+
+    encoded = polyline.encode(coords, precision)
+    assert encoded == _encode(coords, precision)
+    # python encoder below the vectorized size
+    assert polyline.encode(coords[:10], precision) == _encode(
+        coords[:10], precision,
+    )
+    assert polyline.encode(np.array(coords[:10]), precision) == _encode(
+        coords[:10], precision,
+    )
+    assert polyline.decode(encoded, precision).tolist() == [
+        list(c) for c in coords
+    ]
+    assert polyline.encode(
+        [(-120.2, 38.5), (-120.95, 40.7), (-126.453, 43.252)],
+    ) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    assert polyline.encode([]) == ''
+
+
+def test_decode():
+    coords = polyline.decode('_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+    assert coords.shape == (3, 2)
+    assert np.allclose(
+        coords, [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]],
+    )
+
+
+@pytest.mark.parametrize('precision', [5, 6])
+def test_decode_roundtrip(precision):
+    coords = _random_coords(200, precision)
+
+    decoded = polyline.decode(_encode(coords, precision), precision)
+
+    assert np.allclose(decoded, coords, atol=10 ** -precision / 2)
+
+
+@pytest.mark.parametrize('batch_chars', [1 << 16, 16])
+def test_decode_many(batch_chars, monkeypatch):
+    monkeypatch.setattr(polyline, '_BATCH_CHARS', batch_chars)
+    lines = [_random_coords(n, 5) for n in (3, 0, 1, 50)]
+
+    decoded = polyline.decode_many([_encode(line) for line in lines])
+
+    assert len(decoded) == 4
+    for line, coords in zip(lines, decoded):
+        assert coords.shape == (len(line), 2)
+        assert np.allclose(coords, np.array(line).reshape(-1, 2))
+
+
+def test_decode_invalid():
+    with pytest.raises(ValueError):
+        polyline.decode('_p~iF~ps|U_ulL')
+    with pytest.raises(ValueError):
+        polyline.decode_many(['_p~iF~ps|', '_ulLnnqC'])
+
+
+def test_route_geometry_array():
+    route = osrm.Route(
+        distance=1.0,
+        duration=1.0,
+        legs=[],
+        geometry='_p~iF~ps|U_ulLnnqC_mqNvxq`@',
+    )
+    geojson_route = osrm.Route(
+        distance=1.0,
+        duration=1.0,
+        legs=[],
+        geometry={"type": "LineString", "coordinates": [[1.0, 2.0]]},
+    )
+
+    assert route.geometry_array().shape == (3, 2)
+    assert geojson_route.geometry_array().tolist() == [[1.0, 2.0]]
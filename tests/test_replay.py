@@ -0,0 +1,120 @@
+import json
+import re
+
+import aiohttp
+import pytest
+
+from osrm import (
+    MemoryCache, OsrmAsyncClient, OsrmClient, Recorder, Replayer,
+)
+from osrm.utils import OsrmException
+
+from .conftest import table_json
+
+COORDS = [(1.0, 2.0), (3.0, 4.0)]
+
+
+@pytest.fixture
+def record(froute, requests_mock, tmp_path):
+    requests_mock.get(
+        re.compile('/route/'), json=json.loads(froute["res_json"]),
+    )
+    requests_mock.get(
+        re.compile('/table/'), json=lambda req, ctx: table_json(req.url),
+    )
+    requests_mock.get(
+        re.compile('/nearest/'), status_code=400,
+        json={'code': 'InvalidValue', 'message': 'bad'},
+    )
+    path = str(tmp_path / 'run.osrmrec')
+
+    with Recorder(path) as recorder:
+        with OsrmClient(recorder=recorder) as osrm:
+            osrm.route(froute["coords"], steps=True)
+            osrm.table(COORDS)
+            osrm.stream_table(COORDS, sources=[1])
+            with pytest.raises(OsrmException):
+                osrm.nearest((1.0, 2.0))
+        assert recorder.records == 4
+    requests_mock.reset_mock()
+    return path
+
+
+def test_replay_sync(froute, record, requests_mock):
+    replayer = Replayer(record)
+    assert len(replayer) == 4
+    assert [status for _, status, _ in replayer] == [200, 200, 200, 400]
+
+    with OsrmClient(replayer=replayer) as osrm:
+        route = osrm.route(froute["coords"], steps=True)
+        table = osrm.table(COORDS)
+        streamed = osrm.stream_table(COORDS, sources=[1])
+        with pytest.raises(OsrmException, match='bad'):
+            osrm.nearest((1.0, 2.0))
+        with pytest.raises(OsrmException, match='no recorded response'):
+            osrm.route(COORDS)
+
+    assert requests_mock.call_count == 0
+    froute["assertions"](route)
+    assert table.durations == [[1001.0, 1003.0], [3001.0, 3003.0]]
+    assert streamed.durations.tolist() == [[3001.0, 3003.0]]
+
+
+@pytest.mark.asyncio
+async def test_replay_async(froute, record, aiohttp_mock):
+    aiohttp_mock()
+
+    async with OsrmAsyncClient(replayer=Replayer(record)) as osrm:
+        route = await osrm.route(froute["coords"], steps=True)
+        table = await osrm.stream_table(COORDS, sources=[1])
+
+    assert aiohttp.ClientSession.get.call_count == 0
+    froute["assertions"](route)
+    assert table.durations.tolist() == [[3001.0, 3003.0]]
+
+
+def test_record_cache_hits(froute, requests_mock, tmp_path):
+    requests_mock.get(
+        re.compile('/route/'), json=json.loads(froute["res_json"]),
+    )
+    cache = MemoryCache()
+    with OsrmClient(cache=cache) as osrm:
+        osrm.route(froute["coords"])
+    path = str(tmp_path / 'run.osrmrec')
+
+    # the second run is served by the cache, its record is still complete
+    with Recorder(path) as recorder:
+        with OsrmClient(cache=cache, recorder=recorder) as osrm:
+            osrm.route(froute["coords"])
+        assert recorder.records == 1
+    assert requests_mock.call_count == 1
+
+    with OsrmClient(replayer=Replayer(path)) as osrm:
+        froute["assertions"](osrm.route(froute["coords"]))
+
+
+def test_existing_and_truncated(tmp_path):
+    path = str(tmp_path / 'run.osrmrec')
+    with Recorder(path) as recorder:
+        recorder.record('http://osrm/route/v1/driving/1,2?b=1&a=2', 200, b'1')
+        recorder.record('http://osrm/route/v1/driving/3,4', 200, b'2')
+    with pytest.raises(FileExistsError):
+        Recorder(path)
+    with open(path, 'ab') as f:
+        f.write(b'\xc8\x00\x10')
+
+    replayer = Replayer(path)
+
+    assert len(replayer) == 2
+    assert replayer.get('http://osrm/route/v1/driving/1,2?a=2&b=1') == (
+        200, b'1',
+    )
+    assert replayer.get('http://osrm/route/v1/driving/3,4') == (200, b'2')
+
+
+def test_not_a_record(tmp_path):
+    path = tmp_path / 'other'
+    path.write_bytes(b'{}')
+
+    with pytest.raises(OsrmException, match='not a record file'):
+        Replayer(str(path))
@@ -0,0 +1,283 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import pytest
+import requests
+
+from benchmarks.server import StandInServer
+from osrm import (
+    Balancer,
+    CircuitBreaker,
+    CircuitOpenError,
+    HedgePolicy,
+    OsrmAsyncClient,
+    OsrmClient,
+    RetryPolicy,
+)
+from osrm.utils import OsrmException
+
+COORDS = [(12.0, 41.0), (12.1, 41.1)]
+
+
+def test_retry_policy():
+    policy = RetryPolicy(attempts=3, backoff=0.1, max_backoff=0.3)
+
+    assert policy.retry(0, 503)
+    assert policy.retry(1)
+    assert not policy.retry(2, 503)
+    assert not policy.retry(0, 400)
+    assert policy.retries == 2
+    for attempt in range(5):
+        assert 0 <= policy.delay(attempt) <= min(0.1 * 2 ** attempt, 0.3)
+    assert RetryPolicy(jitter=False, backoff=0.1).delay(2) == 0.4
+
+
+def test_policy_counters_threads():
+    retry = RetryPolicy(attempts=2)
+    hedge = HedgePolicy()
+
+    def _count(_):
+        retry.retry(0)
+        hedge.count_hedge()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(_count, range(4000)))
+
+    assert retry.retries == hedge.hedged == 4000
+
+
+def test_hedge_policy():
+    policy = HedgePolicy(percentile=90, window=10, min_samples=5)
+
+    for latency in range(4):
+        policy.observe(latency)
+    assert policy.delay() is None
+    for latency in range(4, 20):
+        policy.observe(latency)
+    # only the last 10 latencies count
+    assert policy.delay() == 19
+    assert HedgePolicy(min_samples=0, max_delay=0.5).delay() is None
+    policy.max_delay = 5
+    assert policy.delay() == 5
+
+
+@pytest.fixture
+def flaky_server():
+    with StandInServer(steps=1, error_rate=0.5) as srv:
+        yield srv
+
+
+@pytest.fixture
+def slow_server():
+    with StandInServer(
+            steps=1, latency=0.005, slow_rate=0.1, slow_latency=1.0,
+    ) as srv:
+        yield srv
+
+
+def test_retry_sync(flaky_server):
+    retry = RetryPolicy(attempts=20, backoff=0.001)
+
+    with OsrmClient(base_url=flaky_server.url) as osrm:
+        with pytest.raises(OsrmException, match='503'):
+            for _ in range(10):
+                osrm.route(COORDS)
+    with OsrmClient(base_url=flaky_server.url, retry=retry) as osrm:
+        for _ in range(10):
+            osrm.route(COORDS)
+
+    assert retry.retries > 0
+
+
+@pytest.mark.asyncio
+async def test_retry_async(flaky_server):
+    retry = RetryPolicy(attempts=20, backoff=0.001)
+    events = []
+
+    async with OsrmAsyncClient(
+            base_url=flaky_server.url, retry=retry, on_request=events.append,
+    ) as osrm:
+        for _ in range(10):
+            await osrm.route(COORDS)
+
+    assert retry.retries == sum(event.attempts - 1 for event in events)
+    assert retry.retries > 0
+
+
+@pytest.mark.asyncio
+async def test_retry_connection_error():
+    with StandInServer() as server:
+        url = server.url
+    retry = RetryPolicy(attempts=3, backoff=0.001)
+
+    async with OsrmAsyncClient(base_url=url, retry=retry) as osrm:
+        with pytest.raises(aiohttp.ClientConnectionError):
+            await osrm.route(COORDS)
+    assert retry.retries == 2
+
+
+def _hedge():
+    hedge = HedgePolicy(percentile=50, min_samples=1, max_delay=0.05)
+    hedge.observe(0.01)
+    return hedge
+
+
+def test_hedge_sync(slow_server):
+    hedge = _hedge()
+
+    latencies = []
+    with OsrmClient(base_url=slow_server.url, hedge=hedge) as osrm:
+        for _ in range(30):
+            start = time.perf_counter()
+            osrm.route(COORDS)
+            latencies.append(time.perf_counter() - start)
+
+    assert hedge.hedged > 0
+    # about 3 slow responses, slow only if the hedge is slow too
+    assert sum(latency > 0.5 for latency in latencies) <= 1
+
+
+@pytest.mark.asyncio
+async def test_hedge_async(slow_server):
+    hedge = _hedge()
+    events = []
+
+    async with OsrmAsyncClient(
+            base_url=slow_server.url, hedge=hedge, on_request=events.append,
+    ) as osrm:
+        for _ in range(30):
+            await osrm.route(COORDS)
+
+    assert hedge.hedged == sum(event.hedged for event in events) > 0
+    assert sum(event.total > 0.5 for event in events) <= 1
+
+
+def test_circuit_breaker():
+    transitions = []
+    breaker = CircuitBreaker(
+        failure_rate=0.5, window=4, min_requests=4, cooldown=0.05,
+        half_open_requests=2,
+        on_state_change=lambda *t: transitions.append(t[1:]),
+    )
+
+    for ok in (True, False, True, False):
+        assert breaker.allow('a')
+        breaker.record('a', ok)
+    assert breaker.state('a') == 'open'
+    assert not breaker.allow('a') and not breaker.available('a')
+    assert breaker.state('b') == 'closed'
+    time.sleep(0.05)
+    assert breaker.state('a') == 'half_open'
+    assert breaker.allow('a') and breaker.allow('a')
+    assert not breaker.allow('a')
+    breaker.record('a', False)
+    assert breaker.state('a') == 'open'
+    time.sleep(0.05)
+    for _ in range(2):
+        assert breaker.allow('a')
+        breaker.record('a', True)
+    assert transitions == [
+        ('closed', 'open'), ('open', 'half_open'), ('half_open', 'open'),
+        ('open', 'half_open'), ('half_open', 'closed'),
+    ]
+
+
+def test_circuit_stale_outcome():
+    breaker = CircuitBreaker(min_requests=1, cooldown=0.01)
+
+    # sent while closed, completing after the circuit opened
+    stale = breaker.allow('a')
+    assert breaker.allow('a')
+    breaker.record('a', False)
+    time.sleep(0.02)
+    probe = breaker.allow('a')
+    assert probe is not None and probe != stale
+    breaker.record('a', True, stale)
+    breaker.record('a', False, stale)
+    assert breaker.state('a') == 'half_open'
+    assert not breaker.allow('a')
+    breaker.record('a', True, probe)
+    assert breaker.state('a') == 'closed'
+
+
+def _half_open(breaker, url):
+    assert breaker.allow(url)
+    breaker.record(url, False)
+    time.sleep(0.02)
+
+
+def test_hedge_no_server_sync():
+    breaker = CircuitBreaker(min_requests=1, cooldown=0.01)
+    hedge = _hedge()
+
+    with StandInServer(steps=1, latency=0.1) as server:
+        with OsrmClient(
+                balancer=Balancer([server.url]), breaker=breaker, hedge=hedge,
+        ) as osrm:
+            url = osrm.balancer.backends[0].url
+            _half_open(breaker, url)
+            # the probe is slow, no other server to hedge to
+            osrm.route(COORDS)
+
+    assert hedge.hedged == 0
+    assert server.requests == 1
+    assert breaker.state(url) == 'closed'
+
+
+@pytest.mark.asyncio
+async def test_hedge_no_server_async():
+    breaker = CircuitBreaker(min_requests=1, cooldown=0.01)
+    hedge = _hedge()
+
+    with StandInServer(steps=1, latency=0.1) as server:
+        async with OsrmAsyncClient(
+                balancer=Balancer([server.url]), breaker=breaker, hedge=hedge,
+        ) as osrm:
+            url = osrm.balancer.backends[0].url
+            _half_open(breaker, url)
+            await osrm.route(COORDS)
+
+    assert hedge.hedged == 0
+    assert server.requests == 1
+    assert breaker.state(url) == 'closed'
+
+
+def test_circuit_fail_fast():
+    with StandInServer() as server:
+        url = server.url
+    breaker = CircuitBreaker(min_requests=2, cooldown=60)
+
+    with OsrmClient(base_url=url, breaker=breaker) as osrm:
+        for _ in range(2):
+            with pytest.raises(requests.ConnectionError):
+                osrm.route(COORDS)
+        start = time.perf_counter()
+        with pytest.raises(CircuitOpenError):
+            osrm.route(COORDS)
+        assert time.perf_counter() - start < 0.01
+
+
+@pytest.mark.asyncio
+async def test_circuit_failover():
+    with StandInServer() as down:
+        url = down.url
+    transitions = []
+    breaker = CircuitBreaker(
+        min_requests=2, cooldown=60,
+        on_state_change=lambda *t: transitions.append(t),
+    )
+
+    with StandInServer() as up:
+        async with OsrmAsyncClient(
+                balancer=Balancer([url, up.url], max_failures=100),
+                breaker=breaker,
+                retry=RetryPolicy(attempts=5, backoff=0.001),
+        ) as osrm:
+            for _ in range(20):
+                await osrm.route(COORDS)
+            down_backend = osrm.balancer.backends[0]
+
+    assert transitions == [(down_backend.url, 'closed', 'open')]
+    assert down_backend.requests == 2
+    assert up.requests == 20
@@ -0,0 +1,174 @@
+import random
+from contextlib import ExitStack
+
+import numpy as np
+import pytest
+
+from benchmarks.server import StandInServer
+from osrm import (
+    OsrmAsyncClient,
+    OsrmAsyncShardedClient,
+    OsrmClient,
+    OsrmShardedClient,
+    Shard,
+    ShardMap,
+)
+from osrm.utils import OsrmException
+
+WEST = (0.0, 40.0, 10.0, 50.0)
+EAST = (10.0, 40.0, 20.0, 50.0)
+
+
+def test_shard_map_grid():
+    shards = [
+        Shard(None, bbox=(x, y, x + 1, y + 1), name=(x, y))
+        for x in range(40) for y in range(25)
+    ]
+    shard_map = ShardMap(shards, node_size=8)
+    rng = random.Random(0)
+
+    for _ in range(200):
+        point = (rng.uniform(0, 40), rng.uniform(0, 25))
+        brute = next(shard for shard in shards if shard.contains(point))
+        assert shard_map.find(point, 'driving') is brute
+    with pytest.raises(OsrmException):
+        shard_map.find((41.0, 0.5), 'driving')
+
+
+def test_shard_map_priority_and_profiles():
+    triangle = [(0.0, 0.0), (4.0, 0.0), (0.0, 4.0)]
+    city = Shard('city', polygon=triangle)
+    country = Shard('country', bbox=(0, 0, 10, 10))
+    bike = Shard('bike', bbox=(0, 0, 10, 10), profiles=['cycling'])
+    shard_map = ShardMap([city, bike, country])
+
+    assert city.bbox == (0.0, 0.0, 4.0, 4.0)
+    assert shard_map.find((1.0, 1.0), 'driving') is city
+    # in the bbox of the city but out of its polygon
+    assert shard_map.find((3.0, 3.0), 'driving') is country
+    assert shard_map.find((1.0, 1.0), 'cycling') is city
+    assert shard_map.find((5.0, 5.0), 'cycling') is bike
+    assert shard_map.find_all([(1, 1), (5, 5)], 'driving') is country
+    assert shard_map.find_common([(1, 1), (11, 5)], 'driving') is None
+    with pytest.raises(ValueError):
+        Shard(None)
+
+
+def test_split_table():
+    shard_map = ShardMap([Shard('w', bbox=WEST), Shard('e', bbox=EAST)])
+    coordinates = [(1, 45), (11, 45), (2, 45), (12, 45)]
+
+    split = shard_map.split_table(coordinates, 'driving', [0, 1], [1, 2, 3])
+    assert [(shard.client, request) for shard, request in split] == [
+        ('w', {
+            'sources': [0], 'destinations': [1], 'rows': [0], 'cols': [1],
+            'coordinates': [(1, 45), (2, 45)],
+        }),
+        ('e', {
+            'sources': [0], 'destinations': [0, 1], 'rows': [1],
+            'cols': [0, 2], 'coordinates': [(11, 45), (12, 45)],
+        }),
+    ]
+
+
+@pytest.fixture
+def servers():
+    with ExitStack() as stack:
+        yield [stack.enter_context(StandInServer(steps=1)) for _ in range(3)]
+
+
+def _shards(servers, client):
+    west, east, bike = (client(base_url=server.url) for server in servers)
+    return [
+        Shard(west, bbox=WEST, profiles=['driving']),
+        Shard(east, bbox=EAST, profiles=['driving']),
+        Shard(bike, bbox=(0, 40, 20, 50), profiles=['cycling']),
+    ]
+
+
+def test_sharded_client(servers):
+    coordinates = [(1.0, 45.0), (2.0, 45.0), (11.0, 45.0)]
+
+    with OsrmShardedClient(_shards(servers, OsrmClient)) as osrm:
+        osrm.route(coordinates[:2])
+        osrm.route(coordinates[1:], profile='cycling')
+        osrm.nearest(coordinates[2])
+        with pytest.raises(OsrmException):
+            osrm.route(coordinates[1:])
+        table = osrm.table(coordinates, dtype='float64')
+
+    assert [server.requests for server in servers] == [2, 2, 1]
+    assert table.durations.shape == (3, 3)
+    # pairs across shards are unreachable
+    assert np.isnan(table.durations).tolist() == [
+        [False, False, True],
+        [False, False, True],
+        [True, True, False],
+    ]
+    assert all(waypoint is not None for waypoint in table.sources)
+
+
+class _FailingClient(OsrmClient):
+    def __enter__(self):
+        raise OSError('cannot enter')
+
+
+class _FailingAsyncClient(OsrmAsyncClient):
+    async def __aenter__(self):
+        raise OSError('cannot enter')
+
+
+def test_sharded_client_enter_failure(servers):
+    west = OsrmClient(base_url=servers[0].url)
+    osrm = OsrmShardedClient([
+        Shard(west, bbox=WEST),
+        Shard(_FailingClient(base_url=servers[1].url), bbox=EAST),
+    ])
+
+    with pytest.raises(OSError):
+        osrm.__enter__()
+    # the clients entered before the failure are exited
+    assert west._entered == 0
+
+
+@pytest.mark.asyncio
+async def test_async_sharded_client_enter_failure(servers):
+    exited = []
+
+    class _Client(OsrmAsyncClient):
+        async def __aexit__(self, *args, **kwargs):
+            exited.append(self)
+            await super().__aexit__(*args, **kwargs)
+
+    west = _Client(base_url=servers[0].url)
+    osrm = OsrmAsyncShardedClient([
+        Shard(west, bbox=WEST),
+        Shard(_FailingAsyncClient(base_url=servers[1].url), bbox=EAST),
+    ])
+
+    with pytest.raises(OSError):
+        await osrm.__aenter__()
+    assert exited == [west]
+
+
+@pytest.mark.asyncio
+async def test_async_sharded_client(servers):
+    coordinates = [(1.0, 45.0), (11.0, 45.0), (2.0, 45.0)]
+
+    async with OsrmAsyncShardedClient(
+            _shards(servers, OsrmAsyncClient),
+    ) as osrm:
+        await osrm.trip(coordinates[::2])
+        table = await osrm.table(
+            coordinates, sources=[0, 1], destinations=[2],
+            annotations=['duration', 'distance'],
+        )
+        single = await osrm.table(coordinates, profile='cycling')
+
+    assert [server.requests for server in servers] == [2, 0, 1]
+    assert table.durations[0][0] is not None
+    assert table.durations[1] == [None]
+    assert table.distances[1] == [None]
+    # no destination in the east shard, so no waypoint for its source
+    assert table.sources[1] is None
+    assert len(single.durations) == 3
@@ -0,0 +1,63 @@
+"""Clients against the stand-in server of the benchmarks, over real HTTP."""
+import pytest
+
+from benchmarks.bench_client import SCENARIOS, check
+from benchmarks.server import StandInServer
+from osrm import OsrmAsyncClient, OsrmClient, ServiceStatus
+from osrm.utils import OsrmException
+
+
+@pytest.fixture(scope='module')
+def server():
+    with StandInServer(steps=2, intersections=1, max_table_size=150) as srv:
+        yield srv
+
+
+@pytest.mark.parametrize('name', list(SCENARIOS))
+def test_sync(server, name):
+    method, kwargs = SCENARIOS[name]
+
+    with OsrmClient(base_url=server.url) as osrm:
+        res = getattr(osrm, method)(**kwargs)
+
+    assert res.code == ServiceStatus.OK
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('name', list(SCENARIOS))
+async def test_async(server, name):
+    method, kwargs = SCENARIOS[name]
+
+    async with OsrmAsyncClient(base_url=server.url) as osrm:
+        res = await getattr(osrm, method)(**kwargs)
+
+    assert res.code == ServiceStatus.OK
+
+
+@pytest.mark.asyncio
+async def test_tiled_table(server):
+    coords = [(12.0 + i * 1e-3, 41.0) for i in range(200)]
+
+    with OsrmClient(base_url=server.url) as osrm:
+        with pytest.raises(OsrmException, match='TooBig'):
+            osrm.table(coords)
+        table = osrm.table(coords, max_table_size=150)
+    assert len(table.durations) == 200
+
+    async with OsrmAsyncClient(base_url=server.url) as osrm:
+        table = await osrm.stream_table(coords[:50], dtype='float32')
+    assert table.durations.shape == (50, 50)
+
+
+def test_check():
+    baseline = {'sync/route': {'rps': 100.0, 'cpu_ms': 2.0}}
+
+    assert check(
+        {'sync/route': {'rps': 80.0, 'cpu_ms': 2.5}}, baseline, 0.5,
+    ) == []
+    assert check(
+        {'sync/route': {'rps': 60.0, 'cpu_ms': 3.5}}, baseline, 0.5,
+    ) == [
+        'sync/route rps: 60.00 (baseline 100.00)',
+        'sync/route cpu_ms: 3.50 (baseline 2.00)',
+    ]
@@ -0,0 +1,89 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from osrm.streaming import TableParser
+
+
+def _table(n, m, seed):
+    rnd = random.Random(seed)
+    durations = [
+        [rnd.choice([None, 3, rnd.random() * 100]) for _ in range(m)]
+        for _ in range(n)
+    ]
+    return {
+        "code": "Ok",
+        "sources": [{"name": 'a]"[{', "location": [1.5, 2]}] * n,
+        "durations": durations,
+        "distances": durations,
+        "destinations": [{"name": "b}", "hint": "x\\y"}] * m,
+        "fallback": 0,
+    }
+
+
+def _feed(parser, raw, seed):
+    rnd = random.Random(seed)
+    i = 0
+    while i < len(raw):
+        size = rnd.randint(1, 9)
+        parser.feed(raw[i:i + size])
+        i += size
+    return parser.close()
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+@pytest.mark.parametrize('seed', range(5))
+def test_chunks(seed, indent):
+    data = _table(4, 3, seed)
+    raw = json.dumps(data, indent=indent).encode()
+
+    assert _feed(TableParser((4, 3), json.loads), raw, seed) == data
+
+    res = _feed(TableParser((4, 3), json.loads, dtype='float64'), raw, seed)
+    for key in ('durations', 'distances'):
+        assert res[key].shape == (4, 3)
+        np.testing.assert_array_equal(
+            res[key], np.array(data[key], dtype=float),
+        )
+    assert res['sources'] == data['sources']
+    assert res['fallback'] == 0
+
+
+def test_on_row():
+    data = _table(3, 2, 0)
+    rows = []
+    parser = TableParser(
+        (3, 2), json.loads,
+        on_row=lambda *args: rows.append(args),
+    )
+    res = _feed(parser, json.dumps(data).encode(), 0)
+
+    assert 'durations' not in res
+    assert rows == [
+        (key, i, row)
+        for key in ('durations', 'distances')
+        for i, row in enumerate(data[key])
+    ]
+
+
+@pytest.mark.parametrize('raw', [
+    b'{"code": "Ok", "durations": [[1, 2], [3',
+    b'{"code": "Ok", "durations": [[1, 2], [3, 4]]',
+])
+def test_truncated(raw):
+    parser = TableParser((2, 2), json.loads)
+    parser.feed(raw)
+    with pytest.raises(ValueError, match='truncated'):
+        parser.close()
+
+
+@pytest.mark.parametrize('raw', [
+    b'{"durations": [[1, 2], [3]]}',
+    b'{"durations": [[1, 2]]}',
+    b'{"durations": [[1, 2], [3, 4], [5, 6]]}',
+])
+def test_shape(raw):
+    with pytest.raises(ValueError, match='shape'):
+        TableParser((2, 2), json.loads).feed(raw)